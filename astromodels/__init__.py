@@ -4,6 +4,7 @@ from version import __version__
 from .sources.point_source import PointSource
 from .sources.extended_source import ExtendedSource
 from .sources.particle_source import ParticleSource
+from .sources.point_source_catalog import PointSourceCatalog
 from parameter import Parameter, IndependentVariable, SettingOutOfBounds
 from .functions.functions import *
 from .functions.functions_2D import *
@@ -0,0 +1,66 @@
+__author__ = 'giacomov'
+
+# Run the standard benchmark suite from the command line:
+#
+#   python -m astromodels.benchmarks --output results.json
+#   python -m astromodels.benchmarks --compare baseline.json
+#
+# The exit status is 1 if there are regressions with respect to the baseline
+
+import argparse
+import sys
+
+from astromodels.benchmarks.runner import run_benchmarks, get_benchmark_names, save_results, load_results, \
+    compare, format_results, format_comparison
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(prog='python -m astromodels.benchmarks',
+                                     description='Run the benchmarks of the hot paths of astromodels')
+
+    parser.add_argument('--output', help='Save the results in this JSON file', default=None)
+
+    parser.add_argument('--compare', help='Compare the results with the baseline stored in this JSON file',
+                        default=None)
+
+    parser.add_argument('--tolerance', help='Relative tolerance for the comparison (default: 0.2)', type=float,
+                        default=0.2)
+
+    parser.add_argument('--quick', help='Use smaller sizes and fewer calls', action='store_true')
+
+    parser.add_argument('--only', help='Run only these benchmarks', nargs='+', choices=get_benchmark_names(),
+                        default=None)
+
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(quick=args.quick, only=args.only, verbose=True)
+
+    print("")
+    print(format_results(results))
+
+    if args.output is not None:
+
+        save_results(results, args.output)
+
+    if args.compare is not None:
+
+        comparison = compare(results, load_results(args.compare), args.tolerance)
+
+        print("")
+        print(format_comparison(comparison))
+
+        n_regressions = len([x for x in comparison if x[-1] == 'regression'])
+
+        if n_regressions > 0:
+
+            print("\n%i regression(s) with respect to %s" % (n_regressions, args.compare))
+
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+
+    sys.exit(main())
@@ -0,0 +1,108 @@
+__author__ = 'giacomov'
+
+import sys
+import time
+import timeit
+
+import numpy as np
+
+from astromodels.parameter import Parameter
+from astromodels.functions.functions import Powerlaw, Log_parabola
+from astromodels.sources.point_source import PointSource
+from astromodels.model import Model
+
+
+def _rate(callable_object, n_calls, repeat=3):
+
+    # Best of "repeat" runs, expressed as calls per second
+
+    best_time = min(timeit.repeat(callable_object, number=n_calls, repeat=repeat))
+
+    return n_calls / best_time
+
+
+def benchmark_construction(n_calls=2000):
+    """
+    Measure how many parameters and functions can be created (or duplicated) per second.
+
+    :param n_calls: number of calls for each measurement
+    :return: a dictionary with the rate (calls per second) for each operation
+    """
+
+    parameter = Parameter('K', 1.0, min_value=1e-30, max_value=1e3, desc='Normalization', unit='1 / (keV cm2 s)')
+
+    powerlaw = Powerlaw()
+
+    return {'Parameter.duplicate': _rate(parameter.duplicate, n_calls),
+            'Powerlaw()': _rate(Powerlaw, n_calls),
+            'Log_parabola()': _rate(Log_parabola, n_calls),
+            'Powerlaw.duplicate': _rate(powerlaw.duplicate, n_calls)}
+
+
+def benchmark_many_point_sources(n_sources=10000):
+    """
+    Measure the time needed to build n_sources point sources with a power law spectrum, with a loop over the
+    constructor of PointSource and with PointSource.many, and the time needed to build a model with them.
+
+    :param n_sources: number of point sources
+    :return: a dictionary with the time in seconds for each operation
+    """
+
+    names = ["src%i" % i for i in range(n_sources)]
+
+    ra = np.linspace(0, 359.0, n_sources)
+    dec = np.linspace(-89.0, 89.0, n_sources)
+    K = np.linspace(1.0, 10.0, n_sources)
+    index = np.linspace(-1.5, -2.5, n_sources)
+
+    results = {}
+
+    start = time.time()
+
+    sources = [PointSource(names[i], ra=ra[i], dec=dec[i], spectral_shape=Powerlaw(K=K[i], index=index[i]))
+               for i in range(n_sources)]
+
+    results['PointSource loop'] = time.time() - start
+
+    start = time.time()
+
+    _ = Model(*sources)
+
+    results['Model (from loop)'] = time.time() - start
+
+    del sources
+
+    start = time.time()
+
+    _ = PointSource.many(names, ra, dec, Powerlaw, K=K, index=index)
+
+    results['PointSource.many'] = time.time() - start
+
+    start = time.time()
+
+    _ = Model.from_arrays(names, ra, dec, Powerlaw, K=K, index=index)
+
+    results['Model.from_arrays'] = time.time() - start
+
+    return results
+
+
+if __name__ == "__main__":
+
+    n_calls = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    results = benchmark_construction(n_calls)
+
+    for operation in sorted(results.keys()):
+
+        print("%-25s %10.0f per second" % (operation, results[operation]))
+
+    n_sources = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+
+    results = benchmark_many_point_sources(n_sources)
+
+    print("\nBuilding %i point sources:" % n_sources)
+
+    for operation in sorted(results.keys()):
+
+        print("%-25s %10.2f s" % (operation, results[operation]))
@@ -0,0 +1,272 @@
+__author__ = 'giacomov'
+
+import itertools
+import os
+import shutil
+import tempfile
+import timeit
+
+import numpy as np
+import astropy.units as u
+
+from astromodels.functions.functions import Powerlaw, Band
+from astromodels.functions.functions_2D import Gaussian_on_sphere
+from astromodels.sources.extended_source import ExtendedSource
+from astromodels.model import Model
+from astromodels.model_parser import clone_model, load_model
+from astromodels.utils.configuration import get_user_data_path
+
+
+# Benchmarks measuring the time needed by the most used operations. Each benchmark returns a dictionary
+# {name of the measurement: seconds per call}. Inputs are generated with fixed seeds, so that the results can be
+# compared among runs (see astromodels.benchmarks.runner)
+
+
+def time_per_call(callable_object, n_calls, repeat=3):
+    """
+    Returns the time per call of the provided callable, as the best of "repeat" runs of n_calls calls (the minimum is
+    the least affected by the other processes running on the machine)
+
+    :param callable_object: the callable (without arguments)
+    :param n_calls: number of calls for each run
+    :param repeat: number of runs
+    :return: seconds per call
+    """
+
+    return min(timeit.repeat(callable_object, number=n_calls, repeat=repeat)) / n_calls
+
+
+def _make_model(n_sources):
+
+    # A model with n_sources point sources with a power law spectrum, at fixed positions
+
+    rng = np.random.RandomState(0)
+
+    names = ["src%i" % i for i in range(n_sources)]
+
+    return Model.from_arrays(names, rng.uniform(0, 360, n_sources), rng.uniform(-90, 90, n_sources), Powerlaw,
+                             K=rng.uniform(0.1, 10, n_sources), index=rng.uniform(-3, -1, n_sources))
+
+
+def benchmark_function_call(n_calls=1000, n_energies=1000):
+    """
+    Time the call of a 1d function (Powerlaw) with and without units
+
+    :param n_calls: number of calls for each measurement
+    :param n_energies: number of energies
+    :return: dictionary of timings (seconds per call)
+    """
+
+    function = Powerlaw()
+
+    function.set_units(u.keV, 1 / (u.keV * u.cm ** 2 * u.s))
+
+    energies = np.logspace(0, 3, n_energies)
+    energies_with_units = energies * u.keV
+
+    # Change the value of the index at every call, so that the memoization (see benchmark_memoize) does not kick in
+
+    indexes = itertools.cycle(np.linspace(-2.5, -1.5, 1001))
+
+    def call_without_units():
+
+        function.index.value = next(indexes)
+
+        return function(energies)
+
+    def call_with_units():
+
+        function.index.value = next(indexes)
+
+        return function(energies_with_units)
+
+    return {'Function1D.__call__ without units': time_per_call(call_without_units, n_calls),
+            'Function1D.__call__ with units': time_per_call(call_with_units, max(n_calls // 10, 1))}
+
+
+def benchmark_memoize(n_calls=10000, n_energies=1000):
+    """
+    Time the memoize decorator, when the result is in the cache and when it is not, and compare with the
+    evaluation without memoization
+
+    :param n_calls: number of calls for each measurement
+    :param n_energies: number of energies
+    :return: dictionary of timings (seconds per call)
+    """
+
+    function = Powerlaw()
+
+    energies = np.logspace(0, 3, n_energies)
+
+    indexes = itertools.cycle(np.linspace(-2.5, -1.5, 1001))
+
+    def miss():
+
+        function.index.value = next(indexes)
+
+        return function._call_without_units(energies)
+
+    def evaluate():
+
+        function.index.value = next(indexes)
+
+        return function.evaluate(energies, function.K.value, function.piv.value, function.index.value)
+
+    return {'memoize (hit)': time_per_call(lambda: function._call_without_units(energies), n_calls),
+            'memoize (miss)': time_per_call(miss, max(n_calls // 10, 1)),
+            'memoize (no memoization)': time_per_call(evaluate, max(n_calls // 10, 1))}
+
+
+def benchmark_free_parameters(n_calls=100, n_sources=100):
+    """
+    Time the access to the free parameters of a model
+
+    :param n_calls: number of calls
+    :param n_sources: number of point sources in the model
+    :return: dictionary of timings (seconds per call)
+    """
+
+    model = _make_model(n_sources)
+
+    return {'Model.free_parameters (%i sources)' % n_sources: time_per_call(lambda: model.free_parameters, n_calls)}
+
+
+def benchmark_clone_and_load(sizes=(10, 100, 1000)):
+    """
+    Time clone_model and load_model on models with the given numbers of point sources
+
+    :param sizes: numbers of point sources
+    :return: dictionary of timings (seconds per call)
+    """
+
+    results = {}
+
+    directory = tempfile.mkdtemp()
+
+    try:
+
+        for n_sources in sizes:
+
+            model = _make_model(n_sources)
+
+            filename = os.path.join(directory, "model_%i.yml" % n_sources)
+
+            model.save(filename)
+
+            n_calls = max(100 // n_sources, 1)
+
+            results['clone_model (%i sources)' % n_sources] = time_per_call(lambda: clone_model(model), n_calls)
+            results['load_model (%i sources)' % n_sources] = time_per_call(lambda: load_model(filename), n_calls)
+
+    finally:
+
+        shutil.rmtree(directory)
+
+    return results
+
+
+def benchmark_extended_source(n_calls=5, n_pixels=100000, n_energies=10):
+    """
+    Time the evaluation of an extended source (Gaussian on the sphere with a power law spectrum) on a large grid of
+    pixels
+
+    :param n_calls: number of calls for each measurement
+    :param n_pixels: number of pixels
+    :param n_energies: number of energies
+    :return: dictionary of timings (seconds per call)
+    """
+
+    shape = Gaussian_on_sphere(lon0=100.0, lat0=20.0, sigma=1.0)
+
+    source = ExtendedSource('extended', spatial_shape=shape, spectral_shape=Powerlaw())
+
+    rng = np.random.RandomState(0)
+
+    ra = rng.uniform(90, 110, n_pixels)
+    dec = rng.uniform(10, 30, n_pixels)
+
+    energies = np.logspace(0, 3, n_energies)
+
+    sigmas = itertools.cycle(np.linspace(0.5, 1.5, 101))
+
+    def call():
+
+        # Change the shape at every call, so that the memoization does not kick in
+
+        shape.sigma.value = next(sigmas)
+
+        return source(ra, dec, energies)
+
+    def call_sparse():
+
+        shape.sigma.value = next(sigmas)
+
+        return source(ra, dec, energies, sparse=True)
+
+    return {'ExtendedSource.__call__ (%i pixels)' % n_pixels: time_per_call(call, n_calls),
+            'ExtendedSource.__call__ sparse (%i pixels)' % n_pixels: time_per_call(call_sparse, n_calls)}
+
+
+def benchmark_template_model(n_calls=1000, n_energies=100):
+    """
+    Time the interpolation of a TemplateModel (a small template built from the Band function is saved in the data
+    directory of astromodels, with the name __benchmark, and removed at the end)
+
+    :param n_calls: number of calls for each measurement
+    :param n_energies: number of energies
+    :return: dictionary of timings (seconds per call)
+    """
+
+    # Imported here, so that the other benchmarks can run even if the dependencies of the template models are
+    # not available
+
+    from astromodels.functions.template_model import TemplateModel, TemplateModelFactory
+
+    band = Band(K=1.0)
+
+    grid_energies = np.logspace(1, 3, 50)
+
+    factory = TemplateModelFactory('__benchmark', 'Template for benchmarks', grid_energies, ['alpha', 'beta'])
+
+    alpha_grid = np.linspace(-1.5, 0.5, 10)
+    beta_grid = np.linspace(-3.5, -2.1, 10)
+
+    factory.define_parameter_grid('alpha', alpha_grid)
+    factory.define_parameter_grid('beta', beta_grid)
+
+    for alpha in alpha_grid:
+
+        for beta in beta_grid:
+
+            band.alpha.value = alpha
+            band.beta.value = beta
+
+            factory.add_interpolation_data(band(grid_energies), alpha=alpha, beta=beta)
+
+    # The template is removed at the end, so that it does not stay in the data directory of the user
+
+    data_file = os.path.join(get_user_data_path(), '__benchmark.h5')
+
+    try:
+
+        factory.save_data(overwrite=True)
+
+        template = TemplateModel('__benchmark')
+
+        energies = np.logspace(1, 3, n_energies)
+
+        alphas = itertools.cycle(np.linspace(-1.4, 0.4, 101))
+
+        def call():
+
+            template.alpha.value = next(alphas)
+
+            return template(energies)
+
+        return {'TemplateModel interpolation': time_per_call(call, n_calls)}
+
+    finally:
+
+        if os.path.exists(data_file):
+
+            os.remove(data_file)
@@ -0,0 +1,103 @@
+__author__ = 'giacomov'
+
+import gc
+import sys
+import time
+import types
+
+from astromodels.model import Model
+from astromodels.sources.point_source import PointSource
+from astromodels.functions.functions import Powerlaw
+
+
+# These are never counted, as they are shared by everything (classes, functions and modules)
+
+_excluded_types = (type, types.ClassType, types.ModuleType, types.FunctionType, types.BuiltinFunctionType,
+                   types.MethodType, types.CodeType, types.FrameType)
+
+
+def deep_sizeof(obj, exclude=()):
+    """
+    Compute the memory footprint of an object, i.e., the size of the object plus the size of all the objects reachable
+    from it. Each object is counted only once, so objects shared between different instances count only once.
+    Classes, modules and functions are never counted.
+
+    :param obj: the object
+    :param exclude: a list of objects which should not be counted (nor followed)
+    :return: size in bytes
+    """
+
+    seen = set(id(x) for x in exclude)
+
+    total_size = 0
+
+    to_visit = [obj]
+
+    while to_visit:
+
+        this_object = to_visit.pop()
+
+        if id(this_object) in seen or isinstance(this_object, _excluded_types):
+
+            continue
+
+        seen.add(id(this_object))
+
+        total_size += sys.getsizeof(this_object)
+
+        to_visit.extend(gc.get_referents(this_object))
+
+    return total_size
+
+
+def _make_model(n_sources):
+
+    sources = []
+
+    for i in range(n_sources):
+
+        sources.append(PointSource("src%i" % i, ra=float(i % 360), dec=0.0, spectral_shape=Powerlaw()))
+
+    return Model(*sources)
+
+
+def benchmark_memory(n_sources=1000):
+    """
+    Build a model with n_sources point sources with a power law spectrum, and measure its memory footprint.
+
+    :param n_sources: number of point sources
+    :return: a dictionary with the total size in bytes, the size per source in bytes and the time needed to build
+    the model
+    """
+
+    # Measure the size of the objects shared by all models (like the units), which are not part of the footprint
+    # of the single sources
+
+    reference = _make_model(1)
+
+    shared_size = deep_sizeof(reference)
+
+    start = time.time()
+
+    model = _make_model(n_sources)
+
+    elapsed = time.time() - start
+
+    total_size = deep_sizeof(model)
+
+    return {'n_sources': n_sources,
+            'total_bytes': total_size,
+            'bytes_per_source': (total_size - shared_size) / float(n_sources - 1),
+            'build_time': elapsed}
+
+
+if __name__ == "__main__":
+
+    n_sources = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    results = benchmark_memory(n_sources)
+
+    print("Sources:                %i" % results['n_sources'])
+    print("Total size:             %.1f MB" % (results['total_bytes'] / 1024.0 / 1024.0))
+    print("Size per source:        %.0f bytes" % results['bytes_per_source'])
+    print("Build time:             %.2f s" % results['build_time'])
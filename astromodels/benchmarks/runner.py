@@ -0,0 +1,257 @@
+__author__ = 'giacomov'
+
+import collections
+import exceptions
+import json
+import platform
+import traceback
+
+import numpy as np
+
+from astromodels.version import __version__
+from astromodels.benchmarks import hot_paths
+from astromodels.benchmarks.memory import benchmark_memory
+
+
+# The benchmarks of the standard suite, as {name: (function, keywords for the full run, keywords for the quick run)}.
+# Each function returns a dictionary {measurement: seconds per call}
+
+_suite = collections.OrderedDict()
+
+_suite['function_call'] = (hot_paths.benchmark_function_call,
+                           {},
+                           {'n_calls': 100})
+
+_suite['memoize'] = (hot_paths.benchmark_memoize,
+                     {},
+                     {'n_calls': 1000})
+
+_suite['free_parameters'] = (hot_paths.benchmark_free_parameters,
+                             {},
+                             {'n_calls': 10})
+
+_suite['clone_and_load'] = (hot_paths.benchmark_clone_and_load,
+                            {},
+                            {'sizes': (10,)})
+
+_suite['extended_source'] = (hot_paths.benchmark_extended_source,
+                             {},
+                             {'n_calls': 2, 'n_pixels': 10000})
+
+_suite['template_model'] = (hot_paths.benchmark_template_model,
+                            {},
+                            {'n_calls': 100})
+
+
+def _benchmark_memory(n_sources):
+
+    results = benchmark_memory(n_sources)
+
+    return {'memory per source (%i sources)' % n_sources: results['bytes_per_source']}
+
+
+_suite['memory'] = (_benchmark_memory,
+                    {'n_sources': 1000},
+                    {'n_sources': 100})
+
+# Units of the measurements of each benchmark (for all of them, lower is better)
+
+_units = collections.defaultdict(lambda: 's')
+_units['memory'] = 'bytes'
+
+
+class UnknownBenchmark(exceptions.Exception):
+    pass
+
+
+def get_benchmark_names():
+    """
+    Returns the names of the benchmarks in the standard suite
+
+    :return: list of names
+    """
+
+    return _suite.keys()
+
+
+def _get_metadata(quick):
+
+    return collections.OrderedDict([('astromodels', __version__),
+                                    ('python', platform.python_version()),
+                                    ('numpy', np.__version__),
+                                    ('platform', platform.platform()),
+                                    ('quick', quick)])
+
+
+def run_benchmarks(quick=False, only=None, verbose=False):
+    """
+    Run the standard benchmark suite.
+
+    A benchmark which fails (for example because an optional dependency is not available) is recorded as skipped,
+    with the reason, and it does not stop the others.
+
+    :param quick: if True, use smaller sizes and fewer calls (faster, but less precise)
+    :param only: list of names of the benchmarks to run (default: all, see get_benchmark_names)
+    :param verbose: if True, print the name of each benchmark before running it
+    :return: a dictionary with the keys 'metadata', 'results' ({measurement: {'value': ..., 'unit': ...}}) and
+    'skipped' ({benchmark: reason})
+    """
+
+    if only is None:
+
+        only = get_benchmark_names()
+
+    for name in only:
+
+        if name not in _suite:
+
+            raise UnknownBenchmark("Unknown benchmark %s. Known benchmarks are: %s"
+                                   % (name, ", ".join(get_benchmark_names())))
+
+    results = collections.OrderedDict()
+
+    skipped = collections.OrderedDict()
+
+    for name in only:
+
+        function, keywords, quick_keywords = _suite[name]
+
+        if verbose:
+
+            print("Running %s..." % name)
+
+        try:
+
+            measurements = function(**(quick_keywords if quick else keywords))
+
+        except Exception as e:
+
+            if verbose:
+
+                traceback.print_exc()
+
+            skipped[name] = "%s: %s" % (type(e).__name__, e)
+
+            continue
+
+        for measurement in sorted(measurements.keys()):
+
+            results[measurement] = collections.OrderedDict([('value', float(measurements[measurement])),
+                                                            ('unit', _units[name])])
+
+    return collections.OrderedDict([('metadata', _get_metadata(quick)),
+                                    ('results', results),
+                                    ('skipped', skipped)])
+
+
+def save_results(results, filename):
+    """
+    Save the results of run_benchmarks in a JSON file
+
+    :param results: the results
+    :param filename: name of the output file
+    :return: (none)
+    """
+
+    with open(filename, "w+") as f:
+
+        json.dump(results, f, indent=2, separators=(',', ': '))
+
+
+def load_results(filename):
+    """
+    Read results saved with save_results
+
+    :param filename: name of the file
+    :return: the results
+    """
+
+    with open(filename) as f:
+
+        return json.load(f, object_pairs_hook=collections.OrderedDict)
+
+
+def compare(results, baseline, tolerance=0.2):
+    """
+    Compare results with a baseline. A measurement is a regression if it is more than (1 + tolerance) times the
+    value in the baseline (all measurements are times or sizes, so lower is better), and an improvement if it is
+    less than 1 / (1 + tolerance) times the value in the baseline. Measurements present in only one of the two are
+    ignored.
+
+    :param results: results from run_benchmarks (or load_results)
+    :param baseline: results to compare with
+    :param tolerance: relative tolerance (default: 0.2, i.e., 20%)
+    :return: list of tuples (measurement, baseline value, new value, ratio, status) where status is one of
+    'regression', 'improvement' or 'ok'
+    """
+
+    assert tolerance >= 0, "The tolerance cannot be negative"
+
+    comparison = []
+
+    for measurement, new in results['results'].iteritems():
+
+        if measurement not in baseline['results']:
+
+            continue
+
+        old_value = baseline['results'][measurement]['value']
+        new_value = new['value']
+
+        ratio = new_value / old_value if old_value > 0 else np.inf
+
+        if ratio > 1 + tolerance:
+
+            status = 'regression'
+
+        elif ratio < 1 / (1 + tolerance):
+
+            status = 'improvement'
+
+        else:
+
+            status = 'ok'
+
+        comparison.append((measurement, old_value, new_value, ratio, status))
+
+    return comparison
+
+
+def format_results(results):
+    """
+    Returns a table (as a string) with the results
+
+    :param results: results from run_benchmarks (or load_results)
+    :return: a string
+    """
+
+    lines = []
+
+    for measurement, result in results['results'].iteritems():
+
+        lines.append("%-50s %12.4g %s" % (measurement, result['value'], result['unit']))
+
+    for name, reason in results['skipped'].iteritems():
+
+        lines.append("%-50s skipped (%s)" % (name, reason))
+
+    return "\n".join(lines)
+
+
+def format_comparison(comparison):
+    """
+    Returns a table (as a string) with the comparison
+
+    :param comparison: the output of compare
+    :return: a string
+    """
+
+    lines = ["%-50s %12s %12s %8s" % ('measurement', 'baseline', 'new', 'ratio')]
+
+    for measurement, old_value, new_value, ratio, status in comparison:
+
+        flag = '' if status == 'ok' else status.upper()
+
+        lines.append("%-50s %12.4g %12.4g %8.2f %s" % (measurement, old_value, new_value, ratio, flag))
+
+    return "\n".join(lines)
@@ -12,13 +12,51 @@ class NonExistingAttribute(RuntimeWarning):
     pass
 
 
+def _get_slot_names(cls):
+    """
+    Returns the names of all the slots of the provided class, including those of the parent classes (with the name
+    mangling applied to private slots)
+
+    :param cls: a class
+    :return: a list of attribute names
+    """
+
+    slot_names = _slot_names_cache.get(cls)
+
+    if slot_names is None:
+
+        slot_names = []
+
+        for this_class in cls.__mro__:
+
+            for name in this_class.__dict__.get('__slots__', ()):
+
+                if name.startswith('__') and not name.endswith('__'):
+
+                    name = '_%s%s' % (this_class.__name__.lstrip('_'), name)
+
+                slot_names.append(name)
+
+        _slot_names_cache[cls] = slot_names
+
+    return slot_names
+
+
+_slot_names_cache = {}
+
+
 class DualAccessClass(object):
     """
     Suppose there is a class A having a dictionary b as a member. Inheriting from this class will allow the user to
     access the elements of b either as A.b[key] or as A.key. Accessing the element as A.key is read-only,
     i.e., A.key=something will fail.
+
+    Derived classes can use __slots__ (and thus have no __dict__). In that case the elements of the dictionary are not
+    stored as attributes, and they are found by __getattr__ instead.
     """
 
+    __slots__ = ('_lookup_dictionary', '_dictionary_label')
+
     def __init__(self, label, dictionary):
 
         self._lookup_dictionary = dictionary
@@ -26,6 +64,59 @@ class DualAccessClass(object):
 
         for key, value in self._lookup_dictionary.iteritems():
 
+            self._set_element_attribute(key, value)
+
+    def __getstate__(self):
+
+        # This is needed to copy and pickle instances of classes using __slots__
+
+        slots_state = {}
+
+        for name in _get_slot_names(type(self)):
+
+            try:
+
+                slots_state[name] = object.__getattribute__(self, name)
+
+            except AttributeError:
+
+                # Slot not set
+
+                continue
+
+        return getattr(self, '__dict__', None), slots_state
+
+    def __setstate__(self, state):
+
+        dict_state, slots_state = state
+
+        if dict_state:
+
+            self.__dict__.update(dict_state)
+
+        for name, value in slots_state.iteritems():
+
+            object.__setattr__(self, name, value)
+
+    def __getattr__(self, key):
+
+        # This is called only if the normal attribute lookup fails, which happens for the elements of the dictionary
+        # when the instance has no __dict__
+
+        try:
+
+            return object.__getattribute__(self, '_lookup_dictionary')[key]
+
+        except (AttributeError, KeyError):
+
+            raise AttributeError("'%s' object has no attribute '%s'" % (type(self).__name__, key))
+
+    def _set_element_attribute(self, key, value):
+
+        # Store the element as attribute (which makes access faster) only if the instance has a __dict__
+
+        if hasattr(self, '__dict__'):
+
             super(DualAccessClass, self).__setattr__(key, value)
 
     def __setattr__(self, key, value):
@@ -56,10 +147,12 @@ class DualAccessClass(object):
 
         self._lookup_dictionary[name] = value
 
-        super(DualAccessClass, self).__setattr__(name, value)
+        self._set_element_attribute(name, value)
 
     def _del_attribute(self, name):
 
-        super(DualAccessClass, self).__delattr__(name)
+        if hasattr(self, '__dict__'):
+
+            super(DualAccessClass, self).__delattr__(name)
 
         return self._lookup_dictionary.pop(name)
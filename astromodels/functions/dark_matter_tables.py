@@ -0,0 +1,199 @@
+__author__ = 'giacomov'
+
+# This module provides the tables of the gamma-ray spectra from dark matter annihilation used by DMFitFunction and
+# DMSpectra. The tables are loaded only once per process (and only when they are first needed), in read-only and
+# possibly memory-mapped arrays, so that all the instances of those functions share the same data. The interpolators
+# are also built lazily, one for each table and channel, and shared among the instances.
+
+import os
+import tempfile
+import warnings
+
+import numpy as np
+from scipy.interpolate import RegularGridInterpolator
+
+from astromodels.utils.configuration import get_user_cache_path
+
+_tables_directory = os.path.dirname(os.path.abspath(__file__))
+
+# Fermi tables (text format, 2 GeV < m_DM < 10 TeV) and HAWC tables (numpy format, used up to 1 PeV)
+
+_fermi_table_file = os.path.join(_tables_directory, 'gammamc_dif.dat')
+_hawc_table_file = os.path.join(_tables_directory, 'dmSpecTab.npy')
+
+# Mapping between the channel codes and the rows in the gammamc file (dmSpecTab.npy follows the same mapping)
+
+channel_index_mapping = {
+    1: 8,  # ee
+    2: 6,  # mumu
+    3: 3,  # tautau
+    4: 1,  # bb
+    5: 2,  # tt
+    6: 7,  # gg
+    7: 4,  # ww
+    8: 5,  # zz
+    9: 0,  # cc
+    10: 10,  # uu
+    11: 11,  # dd
+    12: 9,  # ss
+}
+
+# Grid in x = log10(E/M), with 10 decades
+
+_n_decades = 10.0
+_x_edges = np.linspace(0, 1.0, 251)
+x_grid = 0.5 * (_x_edges[1:] + _x_edges[:-1]) * _n_decades - _n_decades
+
+# These are the mass points in GeV for the Fermi and the HAWC tables
+
+fermi_masses = np.array([2.0, 4.0, 6.0, 8.0, 10.0,
+                         25.0, 50.0, 80.3, 91.2, 100.0,
+                         150.0, 176.0, 200.0, 250.0, 350.0, 500.0, 750.0,
+                         1000.0, 1500.0, 2000.0, 3000.0, 5000.0, 7000.0, 1E4])
+
+hawc_masses = np.array([50., 61.2, 74.91, 91.69, 112.22, 137.36, 168.12, 205.78, 251.87, 308.29,
+                        377.34, 461.86, 565.31, 691.93, 846.91, 1036.6, 1268.78, 1552.97, 1900.82,
+                        2326.57, 2847.69, 3485.53, 4266.23, 5221.81, 6391.41, 7823.0, 9575.23,
+                        11719.94, 14345.03, 17558.1, 21490.85, 26304.48, 32196.3, 39407.79, 48234.54,
+                        59038.36, 72262.07, 88447.7, 108258.66, 132506.99, 162186.57, 198513.95,
+                        242978.11, 297401.58, 364015.09, 445549.04, 545345.37, 667494.6, 817003.43, 1000000.])
+
+# The combined table uses the Fermi table up to 10 TeV and the HAWC table above
+
+_first_hawc_mass_index = 27
+
+combined_masses = np.append(fermi_masses, hawc_masses[_first_hawc_mass_index:])
+
+# Process-wide stores (filled lazily)
+
+_tables = {}
+
+_interpolators = {}
+
+
+def _read_only(array):
+
+    array.flags.writeable = False
+
+    return array
+
+
+def _save_atomically(filename, array):
+
+    # Write to a temporary file in the same directory and then rename it, so that other processes never see a
+    # partially written file
+
+    file_descriptor, temporary_file = tempfile.mkstemp(dir=os.path.dirname(filename), suffix='.npy')
+
+    try:
+
+        with os.fdopen(file_descriptor, 'wb') as f:
+
+            np.save(f, array)
+
+        os.rename(temporary_file, filename)
+
+    except:
+
+        os.remove(temporary_file)
+
+        raise
+
+
+def _load_fermi_table():
+
+    # Parsing the text file is slow, so the first time we save it in binary format in the cache directory. Then we
+    # memory-map the binary version (which is regenerated if the text file is newer)
+
+    try:
+
+        binary_file = os.path.join(get_user_cache_path(), 'gammamc_dif.npy')
+
+        if not os.path.exists(binary_file) or os.path.getmtime(binary_file) < os.path.getmtime(_fermi_table_file):
+
+            _save_atomically(binary_file, np.loadtxt(_fermi_table_file))
+
+        data = np.load(binary_file, mmap_mode='r')
+
+    except (IOError, OSError, ValueError):
+
+        warnings.warn("Could not use the binary cache for the dark matter tables. Reading the text file instead.")
+
+        data = _read_only(np.loadtxt(_fermi_table_file))
+
+    return data.reshape((12, len(fermi_masses), len(x_grid)))
+
+
+def _load_combined_table():
+
+    fermi_table = get_table('fermi')
+
+    hawc_table = np.load(_hawc_table_file, mmap_mode='r')
+
+    combined_table = np.zeros((12, len(combined_masses), len(x_grid)))
+
+    combined_table[:, :len(fermi_masses), :] = fermi_table
+    combined_table[:, len(fermi_masses):, :] = hawc_table[:, _first_hawc_mass_index:, :]
+
+    return _read_only(combined_table)
+
+
+_table_loaders = {'fermi': (_load_fermi_table, fermi_masses),
+                  'combined': (_load_combined_table, combined_masses)}
+
+
+def get_table(table_name):
+    """
+    Returns the table of dN/dx (with shape (n_channels, n_masses, n_x)). The table is loaded the first time it is
+    requested, and then shared. It is read-only.
+
+    :param table_name: either 'fermi' (2 GeV < m_DM < 10 TeV) or 'combined' (Fermi and HAWC, 2 GeV < m_DM < 1 PeV)
+    :return: the table (a read-only array)
+    """
+
+    table = _tables.get(table_name)
+
+    if table is None:
+
+        loader, _ = _table_loaders[table_name]
+
+        table = _tables[table_name] = loader()
+
+    return table
+
+
+def get_interpolator(table_name, channel):
+    """
+    Returns the interpolator of dN/dx as a function of (mass, x) for the provided table and channel. The
+    interpolator is built the first time it is requested, and then shared.
+
+    :param table_name: either 'fermi' or 'combined' (see get_table)
+    :param channel: the annihilation channel (see channel_index_mapping)
+    :return: a RegularGridInterpolator instance
+    """
+
+    key = (table_name, int(channel))
+
+    interpolator = _interpolators.get(key)
+
+    if interpolator is None:
+
+        try:
+
+            channel_index = channel_index_mapping[key[1]]
+
+        except KeyError:
+
+            raise ValueError("Unknown dark matter annihilation channel %s. Valid channels are %s" %
+                             (channel, sorted(channel_index_mapping.keys())))
+
+        _, masses = _table_loaders[table_name]
+
+        interpolator = RegularGridInterpolator([masses, x_grid],
+                                               get_table(table_name)[channel_index, :, :],
+                                               bounds_error=False,
+                                               fill_value=None)
+
+        _interpolators[key] = interpolator
+
+    return interpolator
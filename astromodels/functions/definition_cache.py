@@ -0,0 +1,154 @@
+__author__ = 'giacomov'
+
+# This module implements an on-disk cache for the function definitions, i.e., the YAML documents contained in the
+# docstring of the function classes (see FunctionMeta). Parsing YAML is slow, and it is the main cost of creating
+# a function class, which happens at import for all the functions (and for all the Xspec models, if available).
+# The cache contains the parsed definitions (pickled) keyed by the SHA1 hash of the docstring, so any change in a
+# docstring automatically invalidates the corresponding entry. The cache is loaded the first time it is needed and
+# saved at exit, only if new definitions have been added. Any problem with the cache (unreadable or unwritable file,
+# corrupted content...) is ignored, and the definitions are just parsed again.
+
+import atexit
+import cPickle
+import hashlib
+import os
+import sys
+import tempfile
+
+import yaml
+
+from astromodels.my_yaml import my_yaml
+from astromodels.utils.configuration import get_user_cache_path
+from astromodels.version import __version__
+
+# Change this if the format of the cache changes. The cache is also discarded if the version of astromodels, of
+# YAML or of python changes, as they might change the result of the parsing
+
+_CACHE_VERSION = 1
+
+_cache_signature = (_CACHE_VERSION, __version__, yaml.__version__, tuple(sys.version_info[:2]))
+
+_cache_file_name = 'function_definitions.pkl'
+
+# Dictionary hash -> pickled definition. It is None until it is loaded
+
+_cache = None
+
+_cache_is_dirty = False
+
+
+def _get_cache_file():
+
+    return os.path.join(get_user_cache_path(), _cache_file_name)
+
+
+def _load_cache():
+
+    global _cache
+
+    _cache = {}
+
+    try:
+
+        with open(_get_cache_file(), 'rb') as f:
+
+            signature, definitions = cPickle.load(f)
+
+    except Exception:
+
+        # No cache yet, or unreadable cache
+
+        return
+
+    if signature == _cache_signature:
+
+        _cache = definitions
+
+
+def _save_cache():
+
+    if not _cache_is_dirty:
+
+        return
+
+    try:
+
+        cache_file = _get_cache_file()
+
+        # Write to a temporary file in the same directory and then rename it, so that the cache file is never
+        # corrupted (even if more than one process is writing it at the same time)
+
+        file_descriptor, temporary_file = tempfile.mkstemp(dir=os.path.dirname(cache_file))
+
+        try:
+
+            with os.fdopen(file_descriptor, 'wb') as f:
+
+                cPickle.dump((_cache_signature, _cache), f, cPickle.HIGHEST_PROTOCOL)
+
+            os.rename(temporary_file, cache_file)
+
+        except:
+
+            # Do not leave the temporary file behind
+
+            os.remove(temporary_file)
+
+            raise
+
+    except Exception:
+
+        # Never fail because of the cache
+
+        pass
+
+
+atexit.register(_save_cache)
+
+
+def load_function_definition(docstring):
+    """
+    Returns the function definition contained in the provided docstring, using the cache if possible. Each call
+    returns a new copy of the definition, which can be freely modified.
+
+    :param docstring: the docstring of the function class (a YAML document)
+    :return: the definition (an OrderedDict)
+    """
+
+    global _cache_is_dirty
+
+    if not isinstance(docstring, basestring):
+
+        # This will fail with the appropriate exception
+
+        return my_yaml.load(docstring)
+
+    if _cache is None:
+
+        _load_cache()
+
+    key = hashlib.sha1(docstring.encode('utf-8') if isinstance(docstring, unicode) else docstring).hexdigest()
+
+    pickled_definition = _cache.get(key)
+
+    if pickled_definition is not None:
+
+        try:
+
+            return cPickle.loads(pickled_definition)
+
+        except Exception:
+
+            # Corrupted entry, parse the definition again
+
+            pass
+
+    # Not in the cache. Parse it (this will raise if the docstring is not valid YAML) and add it to the cache
+
+    function_definition = my_yaml.load(docstring)
+
+    _cache[key] = cPickle.dumps(function_definition, cPickle.HIGHEST_PROTOCOL)
+
+    _cache_is_dirty = True
+
+    return function_definition
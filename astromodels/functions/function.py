@@ -1,9 +1,11 @@
-from astromodels.parameter import Parameter
-from astromodels.my_yaml import my_yaml
+from astromodels.parameter import Parameter, get_value_resolver
+from astromodels.functions.definition_cache import load_function_definition
 from astromodels.utils.pretty_list import dict_to_list
 from astromodels.tree import Node
 from astromodels.utils.table import dict_to_table
 from astromodels.units import get_units
+from astromodels.utils.angular_distance import select_points_inside_circle
+from astromodels.utils.spatial_index import select_points_inside_box
 import astropy.units as u
 import functools
 
@@ -20,6 +22,7 @@ from yaml.reader import ReaderError
 import numpy as np
 import scipy.integrate
 import inspect
+import time
 
 __author__ = 'giacomov'
 
@@ -37,6 +40,11 @@ else:
     has_ipython = True
 
 
+# Types of the attributes which can be shared between a function and its copies (see Function._can_be_cloned)
+
+_immutable_types = (type(None), bool, int, long, float, str, unicode, tuple, u.UnitBase)
+
+
 class WarningNoTests(ImportWarning):
     pass
 
@@ -95,6 +103,10 @@ _operations = {'+': np.add,
 
 _known_functions = {}
 
+# Time spent in FunctionMeta to create each function class (see get_function_classes_creation_times)
+
+_class_creation_times = collections.OrderedDict()
+
 
 def memoize(method):
     """
@@ -165,6 +177,8 @@ class FunctionMeta(type):
         # implemented well, and add properties and methods according to the definition
         # given in the docstring of cls
 
+        start_time = time.time()
+
         # Enforce the presence of the evaluate method
 
         if 'evaluate' not in dct:
@@ -196,11 +210,11 @@ class FunctionMeta(type):
 
         # The doc is a YAML document containing among other things the definition of the parameters
 
-        # Parse it
+        # Parse it (or get it from the cache of the definitions, which is much faster)
 
         try:
 
-            function_definition = my_yaml.load(cls.__doc__)
+            function_definition = load_function_definition(cls.__doc__)
 
         except ReaderError:
 
@@ -257,6 +271,13 @@ class FunctionMeta(type):
 
             cls.__parameters[this_parameter.name] = this_parameter
 
+        # Store the names of the normalization parameters, i.e., the parameters which multiply the whole function
+        # (declared with "is_normalization : yes" in the definition of the parameter)
+
+        cls._normalization_parameters = tuple(parameter_name for parameter_name, parameter_definition in
+                                              function_definition['parameters'].iteritems()
+                                              if parameter_definition.get('is_normalization', False))
+
         # Now check that all the parameters used in 'evaluate' are part of the documentation,
         # and that there are no unused parameters
 
@@ -326,6 +347,8 @@ class FunctionMeta(type):
 
         _known_functions[name] = cls
 
+        _class_creation_times[name] = time.time() - start_time
+
         # Finally call the type init
 
         super(FunctionMeta, cls).__init__(name, bases, dct)
@@ -505,6 +528,16 @@ class FunctionMeta(type):
 
 class Function(Node):
 
+    # Names of the normalization parameters (this is overridden by FunctionMeta, see the normalization_parameters
+    # property)
+
+    _normalization_parameters = ()
+
+    # The function definition is never changed after the creation of the class, so it can be shared by the copies
+    # made with Node._clone_tree
+
+    _shared_attributes = ('_function_definition',)
+
     def __init__(self, name=None, function_definition=None, parameters=None):
 
         # I use default values only to avoid warnings from pycharm and other software about the
@@ -566,6 +599,18 @@ class Function(Node):
 
         return free_parameters
 
+    @property
+    def normalization_parameters(self):
+        """
+        Returns a dictionary of the normalization parameters of this function, i.e., of the parameters which multiply
+        the whole function (f(x) = K * g(x), where g does not depend on K). They are declared in the definition of the
+        function with "is_normalization : yes". This can be used for example to profile normalizations analytically.
+
+        :return: dictionary of normalization parameters
+        """
+
+        return collections.OrderedDict([(k, self._children[k]) for k in self._normalization_parameters])
+
     @staticmethod
     def _generate_uuid():
         """
@@ -809,12 +854,65 @@ class Function(Node):
         :return: a new copy of the function
         """
 
+        if self._can_be_cloned():
+
+            return self._clone()
+
         # Create a copy
 
         function_copy = copy.deepcopy(self)
 
         return function_copy
 
+    def _can_be_cloned(self):
+        """
+        Returns whether this function can be copied with _clone, i.e., if its state is made only of parameters and of
+        immutable objects
+
+        :return: True or False
+        """
+
+        for key, value in self.__dict__.iteritems():
+
+            if key in self._children or key == '_function_definition' or key == '_unnormalized_shape_cache':
+
+                # Parameters are duplicated by _clone, while the function definition is never changed after
+                # the creation of the class (it is shared by all the instances of the same class). The cache of
+                # the shape is not copied
+
+                continue
+
+            if not isinstance(value, _immutable_types):
+
+                return False
+
+        return True
+
+    def _clone(self):
+        """
+        Returns a copy of this function, duplicating the parameters and sharing all the other attributes (which must
+        be immutable, see _can_be_cloned). This is much faster than a deepcopy. The new function is not attached to
+        any tree.
+
+        :return: a new copy of the function
+        """
+
+        new_function = object.__new__(type(self))
+
+        new_function.__dict__.update(self.__dict__)
+
+        new_function.__dict__.pop('_unnormalized_shape_cache', None)
+
+        new_function._dictionary_label = self._dictionary_label
+
+        new_function._reset_node()
+
+        for child_name, child in self._children.iteritems():
+
+            new_function._add_child(child.duplicate(), child_name)
+
+        return new_function
+
     def get_boundaries(self):
         """
         Returns the boundaries of this function. By default there is no boundary, but subclasses can
@@ -825,6 +923,143 @@ class Function(Node):
 
         return None
 
+    def get_truncation_radius(self):
+        """
+        Returns the angular distance from the center (lon0, lat0) beyond which this spatial function is zero (or can
+        be considered zero), for the current values of the parameters. This is used by evaluate_sparse. By default
+        there is no truncation radius, but subclasses can override this.
+
+        :return: the radius, or None
+        """
+
+        return None
+
+    def evaluate_sparse(self, x, y, *args, **kwargs):
+        """
+        Evaluate this spatial function, with the current values of the parameters, only at the positions where it can
+        be different from zero. These are selected with a cheap test, using the truncation radius if available
+        (see get_truncation_radius) or the boundaries otherwise (see get_boundaries). Units are not supported.
+
+        :param x: array of longitudes
+        :param y: array of latitudes
+        :param args: other inputs of the function (for example the energies for 3D functions)
+        :param dense: (keyword only) if True, return an array for all the positions, with zeros where the function
+        has not been evaluated (default: False)
+        :return: a tuple (indexes, values) with the indexes of the selected positions and the values there, or an
+        array for all positions if dense=True
+        """
+
+        dense = kwargs.pop('dense', False)
+
+        assert len(kwargs) == 0, "Unknown keyword arguments: %s" % ",".join(kwargs.keys())
+
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+
+        truncation_radius = self.get_truncation_radius()
+
+        if truncation_radius is not None:
+
+            indexes = select_points_inside_circle(x, y, self.lon0.value, self.lat0.value, truncation_radius)
+
+        else:
+
+            indexes = select_points_inside_box(x, y, self.get_boundaries())
+
+        parameters = dict((parameter_name, parameter.value) for parameter_name, parameter in self._children.iteritems())
+
+        values = self.evaluate(x[indexes], y[indexes], *args, **parameters)
+
+        if not dense:
+
+            return indexes, values
+
+        result = np.zeros((x.shape[0],) + values.shape[1:])
+
+        result[indexes] = values
+
+        return result
+
+    def _evaluate_with_values(self, x, get_value):
+
+        # Evaluate the function at x (a 2d array without units), using for each parameter the value returned by
+        # get_value(parameter) instead of the current value. The values can be numbers or arrays with shape (n, 1),
+        # which are broadcast against x, so the function is evaluated for n sets of values of the parameters with one
+        # call. If the function does not support arrays of parameters, it is evaluated row by row
+
+        parameters = dict((parameter_name, get_value(parameter))
+                          for parameter_name, parameter in self._children.iteritems())
+
+        shape = np.broadcast(x, *parameters.values()).shape
+
+        try:
+
+            result = np.asarray(self.evaluate(x, **parameters), dtype=float)
+
+        except (ValueError, IndexError, TypeError):
+
+            result = None
+
+        if result is None or result.shape != shape:
+
+            x = np.broadcast_to(x, shape)
+
+            result = np.empty(shape)
+
+            for i in range(shape[0]):
+
+                these_parameters = dict((parameter_name, value[i, 0] if np.ndim(value) > 0 else value)
+                                        for parameter_name, value in parameters.iteritems())
+
+                result[i] = self.evaluate(x[i], **these_parameters)
+
+        return result
+
+    def evaluate_with(self, params, x, *other_variables):
+        """
+        Evaluate the function with the values of the parameters provided explicitly, instead of the current values.
+        The state of the function (and of its parameters) is never read for the provided parameters nor written, so
+        many threads can evaluate the same function at different values at the same time. Parameters which are not
+        provided keep their current value, while linked parameters are computed through their laws. Units are not
+        supported.
+
+            >>> powerlaw.evaluate_with({'K': 2.0, 'index': -2.2}, energies)
+
+        :param params: dictionary {parameter name: value} (the names are those in the parameters dictionary)
+        :param x: array of values of the independent variable
+        :param other_variables: other variables, for functions of more than one variable (for example y for 2D
+        functions)
+        :return: array of values
+        """
+
+        values = {}
+
+        for parameter_name, value in params.iteritems():
+
+            if parameter_name not in self._children:
+
+                raise UnknownParameter("Function %s has no parameter %s" % (self.name, parameter_name))
+
+            values[id(self._children[parameter_name])] = value
+
+        get_value = get_value_resolver(values)
+
+        if not other_variables:
+
+            x = np.array(x, dtype=float, ndmin=1)
+
+            return self._evaluate_with_values(x.reshape(1, -1), get_value).reshape(x.shape)
+
+        else:
+
+            assert not isinstance(self, CompositeFunction), "Composite functions of more than one variable are not " \
+                                                            "supported"
+
+            parameters = dict((parameter_name, get_value(parameter))
+                              for parameter_name, parameter in self._children.iteritems())
+
+            return self.evaluate(x, *other_variables, **parameters)
+
 
 class Function1D(Function):
 
@@ -1067,8 +1302,72 @@ class Function1D(Function):
         for parameter_name, parameter in self._children.iteritems():
             kwargs[parameter_name] = parameter.value
 
+        if self._normalization_parameters:
+
+            # f(x) = K * g(x), and g is cached, so we do not need to compute it again if only K changed
+
+            normalization = 1.0
+
+            for parameter_name in self._normalization_parameters:
+
+                normalization *= kwargs[parameter_name]
+
+            return normalization * self._get_unnormalized_shape(x, *args, **kwargs)
+
         return self.evaluate(x, *args, **kwargs)
 
+    def _get_unnormalized_shape(self, x, *args, **kwargs):
+
+        # Returns the function computed with all the normalization parameters set to 1. The result for the last
+        # combination of input grid and values of the other parameters is cached
+
+        for parameter_name in self._normalization_parameters:
+
+            kwargs[parameter_name] = 1.0
+
+        shape_key = (args, tuple(kwargs[parameter_name] for parameter_name in self._children.keys()))
+
+        cache = self.__dict__.get('_unnormalized_shape_cache')
+
+        if cache is not None:
+
+            cached_x, cached_shape_key, cached_shape = cache
+
+            if cached_shape_key == shape_key and cached_x.shape == x.shape and np.array_equal(cached_x, x):
+
+                return cached_shape
+
+        shape = self.evaluate(x, *args, **kwargs)
+
+        self._unnormalized_shape_cache = (np.array(x, copy=True), shape_key, shape)
+
+        return shape
+
+    def get_unnormalized_shape(self, x):
+        """
+        Returns the value of the function at x (without units) with all the normalization parameters (see
+        normalization_parameters) set to 1, i.e., g(x) where f(x) = K * g(x). If the function has no normalization
+        parameters, this is the same as f(x).
+
+        :param x: the values of the independent variable (without units)
+        :return: the values of g(x)
+        """
+
+        new_input = np.array(x, dtype=float, ndmin=1, copy=False)
+
+        kwargs = {}
+
+        for parameter_name, parameter in self._children.iteritems():
+            kwargs[parameter_name] = parameter.value
+
+        if self._normalization_parameters:
+
+            # Return a copy, so the cache cannot be modified from outside
+
+            return np.squeeze(np.array(self._get_unnormalized_shape(new_input, **kwargs), copy=True))
+
+        return np.squeeze(self.evaluate(new_input, **kwargs))
+
 
 class Function2D(Function):
 
@@ -1692,6 +1991,28 @@ class CompositeFunction(Function):
         "A list containing the function used to build this composite function"
         return self._functions
 
+    def _evaluate_with_values(self, x, get_value):
+
+        # Same as Function._evaluate_with_values, going through the operations which define this composite function
+
+        operation, first, second = self._calling_sequence
+
+        numpy_operator = _operations[operation]
+
+        if numpy_operator == 'compose':
+
+            return first._evaluate_with_values(second._evaluate_with_values(x, get_value), get_value)
+
+        first_value = first._evaluate_with_values(x, get_value) if isinstance(first, Function) else first
+
+        if second is None:
+
+            return numpy_operator(first_value)
+
+        second_value = second._evaluate_with_values(x, get_value) if isinstance(second, Function) else second
+
+        return numpy_operator(first_value, second_value)
+
     def evaluate(self):
 
         raise NotImplementedError("You cannot instance and use a composite function by itself. Use the factories.")
@@ -1789,6 +2110,17 @@ def list_functions():
     return table
 
 
+def get_function_classes_creation_times():
+    """
+    Returns the time spent to create each function class (parsing its definition, creating the parameters and
+    checking the calling sequence). This happens at import, so this can be used to profile the startup time.
+
+    :return: an OrderedDict with the name of the class as key and the time (in seconds) as value, in order of creation
+    """
+
+    return collections.OrderedDict(_class_creation_times)
+
+
 def _parse_function_expression(function_specification):
     """
     Parse a complex function expression like:
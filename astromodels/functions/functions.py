@@ -4,7 +4,7 @@ __author__ = 'giacomov'
 import math
 import numpy as np
 import warnings
-from scipy.special import gammaincc, gamma, erfcinv
+from scipy.special import gammaincc, gamma, erfcinv, exp1
 import exceptions
 
 from astromodels.functions.function import Function1D, Function2D, FunctionMeta, ModelAssertionViolation
@@ -12,12 +12,7 @@ from astromodels.functions.function import Function1D, Function2D, FunctionMeta,
 from astromodels.units import get_units
 import astropy.units as astropy_units
 
-import astromodels
-from scipy.interpolate import RegularGridInterpolator
-
-
-class GSLNotAvailable(ImportWarning):
-    pass
+from astromodels.functions import dark_matter_tables
 
 
 class NaimaNotAvailable(ImportWarning):
@@ -49,23 +44,67 @@ else:
 
     has_naima = True
 
-try:
+def upper_incomplete_gamma(s, x):
+    """
+    The (non-normalized) upper incomplete gamma function Gamma(s, x), for any real s (including zero and negative
+    values) and x > 0. Both arguments can be arrays, which are broadcast against each other.
 
-    # GSL is the GNU Scientific Library. Pygsl is the python wrapper for it. It is used by some
-    # functions for faster computation
+    For s > 0 this uses scipy, for s = 0 the exponential integral E1(x), and for s < 0 the recurrence
+    Gamma(s, x) = (Gamma(s + 1, x) - x^s exp(-x)) / s starting from s + n in [0, 1).
 
-    from pygsl.testing.sf import gamma_inc
+    :param s: first argument
+    :param x: second argument (must be positive)
+    :return: Gamma(s, x)
+    """
 
-except ImportError:
+    s, x = np.broadcast_arrays(np.asarray(s, dtype=float), np.asarray(x, dtype=float))
 
-    warnings.warn("The GSL library or the pygsl wrapper cannot be loaded. Models that depend on it will not be "
-                  "available.", GSLNotAvailable)
+    # Number of steps of the recurrence needed to bring s in [0, 1)
 
-    has_gsl = False
+    n_steps = np.where(s < 0, np.ceil(-s), 0)
 
-else:
+    s0 = s + n_steps
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+
+        result = np.where(s0 == 0, exp1(x), gammaincc(s0, x) * gamma(s0))
+
+        for step in range(1, int(n_steps.max()) + 1 if n_steps.size > 0 else 1):
+
+            this_s = s0 - step
+
+            result = np.where(step <= n_steps, (result - np.power(x, this_s) * np.exp(-x)) / this_s, result)
+
+    return result[()]
+
+
+def _get_cached_integral(function, integral, *shape_parameters):
+    """
+    Returns integral(*shape_parameters), caching the result in the function instance. This is used by the functions
+    normalized by their integral in a band, so that the integral is computed again only when the shape parameters
+    change (and not when the normalization changes). Arrays of parameters are not cached.
+
+    :param function: the instance of the function
+    :param integral: the callable computing the integral
+    :param shape_parameters: the parameters on which the integral depends
+    :return: the value of the integral
+    """
+
+    if not all(isinstance(parameter, (float, int, long, np.number)) for parameter in shape_parameters):
+
+        return integral(*shape_parameters)
+
+    cache = function.__dict__.get('_integral_cache')
+
+    if cache is not None and cache[0] == shape_parameters:
 
-    has_gsl = True
+        return cache[1]
+
+    value = integral(*shape_parameters)
+
+    function._integral_cache = (shape_parameters, value)
+
+    return value
 
 
 # noinspection PyPep8Naming
@@ -82,6 +121,7 @@ class Powerlaw(Function1D):
         K :
 
             desc : Normalization (differential flux at the pivot value)
+            is_normalization : yes
             initial value : 1.0
 
         piv :
@@ -138,6 +178,7 @@ class Powerlaw_flux(Function1D):
             F :
 
                 desc : Integral between a and b
+                is_normalization : yes
                 initial value : 1
 
             index :
@@ -175,11 +216,29 @@ class Powerlaw_flux(Function1D):
         self.a.unit = x_unit
         self.b.unit = x_unit
 
+    @staticmethod
+    def _integral(index, a, b):
+
+        gp1 = index + 1
+
+        # The case index = -1 is handled separately
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+
+            return np.where(gp1 == 0, np.log(np.divide(b, a)), (np.power(b, gp1) - np.power(a, gp1)) / gp1)[()]
+
     # noinspection PyPep8Naming
     def evaluate(self, x, F, index, a, b):
-        gp1 = index + 1
 
-        return F * gp1 / (b ** gp1 - a ** gp1) * np.power(x, index)
+        if isinstance(index, astropy_units.Quantity):
+
+            gp1 = index + 1
+
+            return F * gp1 / (b ** gp1 - a ** gp1) * np.power(x, index)
+
+        this_integral = _get_cached_integral(self, self._integral, index, a, b)
+
+        return F / this_integral * np.power(x, index)
 
 
 class Cutoff_powerlaw(Function1D):
@@ -195,6 +254,7 @@ class Cutoff_powerlaw(Function1D):
         K :
 
             desc : Normalization (differential flux at the pivot value)
+            is_normalization : yes
             initial value : 1.0
 
         piv :
@@ -252,6 +312,7 @@ class SmoothlyBrokenPowerLaw(Function1D):
         K :
 
             desc : normalization
+            is_normalization : yes
             initial value : 1
             min : 0
     
@@ -354,6 +415,7 @@ class Broken_powerlaw(Function1D):
         K :
 
             desc : Normalization (differential flux at x_b)
+            is_normalization : yes
             initial value : 1.0
 
         xb :
@@ -428,6 +490,7 @@ class Gaussian(Function1D):
         F :
 
             desc : Integral between -inf and +inf. Fix this to 1 to obtain a Normal distribution
+            is_normalization : yes
             initial value : 1
 
         mu :
@@ -476,26 +539,30 @@ class Gaussian(Function1D):
         """
         Used by multinest
 
-        :param x: 0 < x < 1
-        :param lower_bound:
-        :param upper_bound:
-        :return:
+        :param x: 0 < x < 1 (number or array)
+        :return: the value(s) of the parameter
         """
 
-        mu = self.mu.value
-        sigma = self.sigma.value
+        return self.evaluate_from_unit_cube(x, self.F.value, self.mu.value, self.sigma.value)
+
+    # noinspection PyPep8Naming
+    def evaluate_from_unit_cube(self, x, F, mu, sigma):
+        """
+        Inverse of the cumulative distribution, with the parameters given explicitly (they can be arrays, broadcast
+        against x)
+        """
 
         sqrt_two = 1.414213562
 
-        if x < 1e-16 or (1 - x) < 1e-16:
+        x = np.asarray(x, dtype=float)
 
-            res = -1e32
+        at_the_edge = (x < 1e-16) | ((1 - x) < 1e-16)
 
-        else:
+        with np.errstate(invalid='ignore', divide='ignore'):
 
-            res = mu + sigma * sqrt_two * erfcinv(2 * (1 - x))
+            res = np.where(at_the_edge, -1e32, mu + sigma * sqrt_two * erfcinv(2 * (1 - x)))
 
-        return res
+        return res if res.ndim > 0 else float(res)
 
 
 class Uniform_prior(Function1D):
@@ -550,7 +617,10 @@ class Uniform_prior(Function1D):
         result = np.zeros(x.shape) * value * 0
 
         idx = (x >= lower_bound) & (x <= upper_bound)
-        result[idx] = value
+
+        # (result + value) has the shape of result also when the parameters are arrays (see Model.log_prior)
+
+        result[idx] = (result + value)[idx]
 
         return result
 
@@ -558,19 +628,21 @@ class Uniform_prior(Function1D):
         """
         Used by multinest
 
-        :param x: 0 < x < 1
-        :param lower_bound:
-        :param upper_bound:
-        :return:
+        :param x: 0 < x < 1 (number or array)
+        :return: the value(s) of the parameter
         """
 
-        lower_bound = self.lower_bound.value
-        upper_bound = self.upper_bound.value
+        return self.evaluate_from_unit_cube(x, self.lower_bound.value, self.upper_bound.value, self.value.value)
 
-        low = lower_bound
-        spread = float(upper_bound - lower_bound)
+    def evaluate_from_unit_cube(self, x, lower_bound, upper_bound, value):
+        """
+        Inverse of the cumulative distribution, with the parameters given explicitly (they can be arrays, broadcast
+        against x)
+        """
+
+        spread = np.asarray(upper_bound, dtype=float) - lower_bound
 
-        par = x * spread + low
+        par = x * spread + lower_bound
 
         return par
 
@@ -636,14 +708,20 @@ class Log_uniform_prior(Function1D):
         """
         Used by multinest
 
-        :param x: 0 < x < 1
-        :param lower_bound:
-        :param upper_bound:
-        :return:
+        :param x: 0 < x < 1 (number or array)
+        :return: the value(s) of the parameter
         """
 
-        low = math.log10(self.lower_bound.value)
-        up = math.log10(self.upper_bound.value)
+        return self.evaluate_from_unit_cube(x, self.lower_bound.value, self.upper_bound.value, self.K.value)
+
+    def evaluate_from_unit_cube(self, x, lower_bound, upper_bound, K):
+        """
+        Inverse of the cumulative distribution, with the parameters given explicitly (they can be arrays, broadcast
+        against x)
+        """
+
+        low = np.log10(lower_bound)
+        up = np.log10(upper_bound)
 
         spread = up - low
         par = 10 ** (x * spread + low)
@@ -663,6 +741,7 @@ class Blackbody(Function1D):
     parameters :
         K :
             desc :
+            is_normalization : yes
             initial value : 1e-4
             min : 0.
     
@@ -699,6 +778,7 @@ class Sin(Function1D):
         K :
 
             desc : Normalization
+            is_normalization : yes
             initial value : 1
 
         f :
@@ -789,6 +869,12 @@ if has_naima:
 
         __metaclass__ = FunctionMeta
 
+        # The result depends also on the parameters of the particle distribution, which the memoization of the
+        # results (based on the parameters of this function only) does not know about, so it is not used here. The
+        # expensive part is cached in _get_luminosity instead
+
+        _call_without_units = Function1D.__dict__['_call_without_units'].input_object
+
         def _set_units(self, x_unit, y_unit):
 
             # This function can only be used as a spectrum,
@@ -823,11 +909,18 @@ if has_naima:
 
             self._particle_distribution.set_units(current_units.energy, current_units.energy ** (-1))
 
-            # Naima wants a function which accepts a quantity as x (in units of eV) and returns an astropy quantity,
+            # Naima wants a function which accepts a quantity as x and returns an astropy quantity,
             # so we need to create a wrapper which will remove the unit from x and add the unit to the return
-            # value
+            # value. Naima only sees the shape of the distribution (with the normalizations set to 1), since the
+            # emission is proportional to the normalizations, which are applied in evaluate
+
+            self._particle_distribution_wrapper = lambda x: \
+                function.get_unnormalized_shape(x.to(current_units.energy).value) / current_units.energy
+
+            # The naima model and the cached luminosity depend on the particle distribution
 
-            self._particle_distribution_wrapper = lambda x: function(x.value) / current_units.energy
+            self._naima_synchrotron = None
+            self._luminosity_cache = None
 
         def get_particle_distribution(self):
 
@@ -836,14 +929,83 @@ if has_naima:
         particle_distribution = property(get_particle_distribution, set_particle_distribution,
                                          doc="""Get/set particle distribution for electrons""")
 
+        def _get_naima_synchrotron(self, B, emin, emax, need):
+
+            # The naima model is built only once, then its parameters are updated
+
+            synchrotron = self.__dict__.get('_naima_synchrotron')
+
+            if synchrotron is None:
+
+                synchrotron = naima.models.Synchrotron(self._particle_distribution_wrapper, B * astropy_units.Gauss,
+                                                       Eemin=emin * astropy_units.GeV,
+                                                       Eemax=emax * astropy_units.GeV, nEed=need)
+
+                # The cache of naima does not know about the parameters of the particle distribution, so it could
+                # return old results. The luminosity is cached in evaluate instead
+
+                synchrotron._memoize = False
+
+                self._naima_synchrotron = synchrotron
+
+            else:
+
+                synchrotron.B = B * astropy_units.Gauss
+                synchrotron.Eemin = emin * astropy_units.GeV
+                synchrotron.Eemax = emax * astropy_units.GeV
+                synchrotron.nEed = need
+
+            return synchrotron
+
+        def _get_luminosity(self, x, B, emin, emax, need):
+
+            # Returns the luminosity (in 1 / (s eV)) for the shape of the particle distribution, i.e., with its
+            # normalizations set to 1. It is computed by naima only if one of its inputs changed (not when only the
+            # distance or the normalizations of the particle distribution changed)
+
+            distribution = self._particle_distribution
+
+            shape_parameters = tuple(parameter.value for parameter_name, parameter in
+                                     distribution.parameters.iteritems()
+                                     if parameter_name not in distribution.normalization_parameters)
+
+            key = (B, emin, emax, need, get_units().energy, shape_parameters)
+
+            cache = self.__dict__.get('_luminosity_cache')
+
+            if cache is not None:
+
+                cached_x, cached_key, luminosity = cache
+
+                if cached_key == key and cached_x.shape == x.shape and np.array_equal(cached_x, x):
+
+                    return luminosity
+
+            synchrotron = self._get_naima_synchrotron(B, emin, emax, need)
+
+            luminosity = synchrotron.flux(x * get_units().energy, distance=0).to(1 / (astropy_units.s *
+                                                                                       astropy_units.eV)).value
+
+            self._luminosity_cache = (np.array(x, copy=True), key, luminosity)
+
+            return luminosity
+
         # noinspection PyPep8Naming
         def evaluate(self, x, B, distance, emin, emax, need):
 
-            _synch = naima.models.Synchrotron(self._particle_distribution_wrapper, B * astropy_units.Gauss,
-                                              Eemin=emin * astropy_units.GeV,
-                                              Eemax=emax * astropy_units.GeV, nEed=need)
+            luminosity = self._get_luminosity(x, B, emin, emax, need)
+
+            normalization = 1.0
+
+            for parameter in self._particle_distribution.normalization_parameters.values():
 
-            return _synch.flux(x * get_units().energy, distance=distance * astropy_units.kpc).value
+                normalization *= parameter.value
+
+            # Flux in 1 / (s cm2 eV) at the requested distance (as done by naima)
+
+            distance_cm = distance * astropy_units.kpc.to(astropy_units.cm)
+
+            return normalization * luminosity / (4 * np.pi * distance_cm ** 2)
 
         def to_dict(self, minimal=False):
 
@@ -929,6 +1091,7 @@ class Band(Function1D):
         K :
 
             desc : Differential flux at the pivot energy
+            is_normalization : yes
             initial value : 1e-4
 
         alpha :
@@ -1027,6 +1190,7 @@ class Band_Calderone(Function1D):
         F :
 
             desc : integral in the band defined by a and b
+            is_normalization : yes
             initial value : 1e-6
 
         a:
@@ -1079,114 +1243,100 @@ class Band_Calderone(Function1D):
     def ggrb_int_cpl(a, Ec, Emin, Emax):
 
         # Gammaincc does not support quantities
-        i1 = gammaincc(2 + a, Emin / Ec) * gamma(2 + a)
-        i2 = gammaincc(2 + a, Emax / Ec) * gamma(2 + a)
+        i1 = upper_incomplete_gamma(2 + a, np.divide(Emin, Ec))
+        i2 = upper_incomplete_gamma(2 + a, np.divide(Emax, Ec))
 
         return -Ec * Ec * (i2 - i1)
 
     @staticmethod
     def ggrb_int_pl(a, b, Ec, Emin, Emax):
 
-        pre = pow(a - b, a - b) * math.exp(b - a) / pow(Ec, b)
+        pre = np.power(a - b, a - b) * np.exp(b - a) / np.power(Ec, b)
 
-        if b != -2:
+        # The case b = -2 is handled separately
 
-            return pre / (2 + b) * (pow(Emax, 2 + b) - pow(Emin, 2 + b))
+        with np.errstate(invalid='ignore', divide='ignore'):
 
-        else:
+            return np.where(b != -2,
+                            pre / (2 + b) * (np.power(Emax, 2 + b) - np.power(Emin, 2 + b)),
+                            pre * np.log(np.divide(Emax, Emin)))[()]
 
-            return pre * math.log(Emax / Emin)
+    @classmethod
+    def _integral(cls, alpha, beta, Ec, a, b, opt):
 
-    def evaluate(self, x, alpha, beta, xp, F, a, b, opt):
+        # Integral of the unnormalized model between a and b. For the Band model the cutoff power law is integrated
+        # below the split energy, and the power law above it
 
-        assert opt == 0 or opt == 1, "Opt must be either 0 or 1"
-
-        if alpha < beta:
-            raise ModelAssertionViolation("Alpha cannot be smaller than beta")
-
-        if alpha < -2:
-            raise ModelAssertionViolation("Alpha cannot be smaller than -2")
-
-        # Cutoff energy
+        Esplit = (alpha - beta) * Ec
 
-        if alpha == -2:
+        Esplit_in_band = np.clip(Esplit, a, b)
 
-            Ec = xp / 0.0001  # TRICK: avoid a=-2
+        cpl_upper_bound = np.where(opt == 0, b, Esplit_in_band)
 
-        else:
+        intflux = cls.ggrb_int_cpl(alpha, Ec, a, cpl_upper_bound)
 
-            Ec = xp / (2 + alpha)
+        with np.errstate(invalid='ignore', divide='ignore'):
 
-        # Split energy
+            intflux = intflux + np.where(opt == 0, 0.0, cls.ggrb_int_pl(alpha, beta, Ec, Esplit_in_band, b))
 
-        Esplit = (alpha - beta) * Ec
+        return intflux[()]
 
-        # Evaluate model integrated flux and normalization
+    def evaluate(self, x, alpha, beta, xp, F, a, b, opt):
 
         if isinstance(alpha, astropy_units.Quantity):
 
             # The following functions do not allow the use of units
             alpha_ = alpha.value
-            Ec_ = Ec.value
+            beta_ = beta.value
+            xp_ = xp.value
             a_ = a.value
             b_ = b.value
-            Esplit_ = Esplit.value
-            beta_ = beta.value
+            opt_ = opt.value
 
             unit_ = self.x_unit
 
         else:
 
-            alpha_, Ec_, a_, b_, Esplit_, beta_ = alpha, Ec, a, b, Esplit, beta
+            alpha_, beta_, xp_, a_, b_, opt_ = alpha, beta, xp, a, b, opt
             unit_ = 1.0
 
-        if opt == 0:
+        assert np.all((opt_ == 0) | (opt_ == 1)), "Opt must be either 0 or 1"
 
-            # Cutoff power law
-
-            intflux = self.ggrb_int_cpl(alpha_, Ec_, a_, b_)
-
-        else:
-
-            # Band model
+        if np.any(alpha_ < beta_):
+            raise ModelAssertionViolation("Alpha cannot be smaller than beta")
 
-            if a <= Esplit and Esplit <= b:
+        if np.any(alpha_ < -2):
+            raise ModelAssertionViolation("Alpha cannot be smaller than -2")
 
-                intflux = (self.ggrb_int_cpl(alpha_, Ec_, a_, Esplit_) +
-                           self.ggrb_int_pl(alpha_, beta_, Ec_, Esplit_, b_))
+        # Cutoff energy
 
-            else:
+        Ec_ = xp_ / np.where(alpha_ == -2, 0.0001, 2 + alpha_)[()]  # TRICK: avoid a=-2
 
-                if Esplit < a:
+        # Split energy
 
-                    intflux = self.ggrb_int_pl(alpha_, beta_, Ec_, a_, b_)
+        Esplit_ = (alpha_ - beta_) * Ec_
 
-                else:
+        # Evaluate model integrated flux and normalization
 
-                    raise RuntimeError("Esplit > emax!")
+        intflux = _get_cached_integral(self, self._integral, alpha_, beta_, Ec_, a_, b_, opt_)
 
         erg2keV = 6.24151e8
 
         norm = F * erg2keV / (intflux * unit_)
 
-        if opt == 0:
-
-            # Cutoff power law
+        x_ = x.to(unit_).value if isinstance(x, astropy_units.Quantity) else x
 
-            flux = np.power(x / Ec, alpha) * np.exp(- x / Ec)
+        x_Ec = np.divide(x_, Ec_)
 
-        else:
-
-            # The norm * 0 is to keep the units right
+        with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
 
-            flux = np.zeros(x.shape) * norm * 0
+            cutoff_powerlaw = np.power(x_Ec, alpha_) * np.exp(-x_Ec)
 
-            idx = x < Esplit
+            powerlaw = np.power(alpha_ - beta_, alpha_ - beta_) * np.exp(beta_ - alpha_) * np.power(x_Ec, beta_)
 
-            flux[idx] = norm * np.power(x[idx] / Ec, alpha) * np.exp(-x[idx] / Ec)
-            flux[~idx] = norm * pow(alpha - beta, alpha - beta) * math.exp(beta - alpha) * np.power(x[~idx] / Ec, beta)
+        flux = np.where((opt_ == 0) | (x_ < Esplit_), cutoff_powerlaw, powerlaw)
 
-        return flux
+        return norm * flux
 
 
 class Log_parabola(Function1D):
@@ -1202,6 +1352,7 @@ class Log_parabola(Function1D):
         K :
 
             desc : Normalization
+            is_normalization : yes
             initial value : 1.0
 
         piv :
@@ -1269,72 +1420,81 @@ class Log_parabola(Function1D):
         return self.piv.value * pow(10, (2 + self.alpha.value) / (2 * self.beta.value))
 
 
-if has_gsl:
-    class Cutoff_powerlaw_flux(Function1D):
-        r"""
-            description :
+class Cutoff_powerlaw_flux(Function1D):
+    r"""
+        description :
 
-                A cutoff power law having the flux as normalization, which should reduce the correlation among
-                parameters.
+            A cutoff power law having the flux as normalization, which should reduce the correlation among
+            parameters.
 
-            latex : $ \frac{F}{T(b)-T(a)} ~x^{index}~\exp{(-x/x_{c})}~\text{with}~T(x)=-x_{c}^{index+1} \Gamma(index+1, x/C)~\text{(}\Gamma\text{ is the incomplete gamma function)} $
+        latex : $ \frac{F}{T(b)-T(a)} ~x^{index}~\exp{(-x/x_{c})}~\text{with}~T(x)=-x_{c}^{index+1} \Gamma(index+1, x/C)~\text{(}\Gamma\text{ is the incomplete gamma function)} $
 
-            parameters :
+        parameters :
 
-                F :
+            F :
 
-                    desc : Integral between a and b
-                    initial value : 1e-5
+                desc : Integral between a and b
+                is_normalization : yes
+                initial value : 1e-5
 
-                index :
+            index :
 
-                    desc : photon index
-                    initial value : -2.0
+                desc : photon index
+                initial value : -2.0
 
-                xc :
+            xc :
 
-                    desc : cutoff position
-                    initial value : 50.0
+                desc : cutoff position
+                initial value : 50.0
 
-                a :
+            a :
 
-                    desc : lower bound for the band in which computing the integral F
-                    initial value : 1.0
-                    fix : yes
+                desc : lower bound for the band in which computing the integral F
+                initial value : 1.0
+                fix : yes
 
-                b :
+            b :
 
-                    desc : upper bound for the band in which computing the integral F
-                    initial value : 100.0
-                    fix : yes
-            """
+                desc : upper bound for the band in which computing the integral F
+                initial value : 100.0
+                fix : yes
+        """
 
-        __metaclass__ = FunctionMeta
+    __metaclass__ = FunctionMeta
 
-        def _set_units(self, x_unit, y_unit):
-            # K has units of y * x
-            self.F.unit = y_unit * x_unit
+    def _set_units(self, x_unit, y_unit):
+        # K has units of y * x
+        self.F.unit = y_unit * x_unit
+
+        # alpha is dimensionless
+        self.index.unit = astropy_units.dimensionless_unscaled
+
+        # xc, a and b have the same dimension as x
+        self.xc.unit = x_unit
+        self.a.unit = x_unit
+        self.b.unit = x_unit
 
-            # alpha is dimensionless
-            self.index.unit = astropy_units.dimensionless_unscaled
+    @staticmethod
+    def _integral(a, b, index, ec):
+
+        ap1 = index + 1
+
+        return np.power(ec, ap1) * (upper_incomplete_gamma(ap1, np.divide(a, ec)) -
+                                    upper_incomplete_gamma(ap1, np.divide(b, ec)))
 
-            # xc, a and b have the same dimension as x
-            self.xc.unit = x_unit
-            self.a.unit = x_unit
-            self.b.unit = x_unit
+    def evaluate(self, x, F, index, xc, a, b):
 
-        @staticmethod
-        def _integral(a, b, index, ec):
-            ap1 = index + 1
+        if isinstance(index, astropy_units.Quantity):
 
-            integrand = lambda x: -pow(ec, ap1) * gamma_inc(ap1, x / ec)
+            # The incomplete gamma function does not support units
 
-            return integrand(b) - integrand(a)
+            this_integral = self._integral(a.value, b.value, index.value, xc.value) * xc.unit ** (index.value + 1)
 
-        def evaluate(self, x, F, index, xc, a, b):
-            this_integral = self._integral(a, b, index, xc)
+        else:
+
+            this_integral = _get_cached_integral(self, self._integral, a, b, index, xc)
 
-            return F / this_integral * np.power(x, index) * np.exp(-1 * np.divide(x, xc))
+        return F / this_integral * np.power(x, index) * np.exp(-1 * np.divide(x, xc))
 
 
 class Exponential_cutoff(Function1D):
@@ -1350,6 +1510,7 @@ class Exponential_cutoff(Function1D):
             K :
 
                 desc : Normalization
+                is_normalization : yes
                 initial value : 1.0
                 fix : no
 
@@ -1404,10 +1565,12 @@ class DMFitFunction(Function1D):
             
             sigmav : 
                 desc : DM annihilation cross section (cm^3/s)
+                is_normalization : yes
                 initial value : 1.e-26
             
             J :
                 desc : Target total J-factor (GeV^2 cm^-5)
+                is_normalization : yes
                 initial value : 1.e20
                 fix : yes
         """
@@ -1415,62 +1578,10 @@ class DMFitFunction(Function1D):
     __metaclass__ = FunctionMeta
     
     def _setup(self):
-        
-        astroDir = astromodels.__file__
-        astroDir = astroDir.split('__init__.py')[0]
-        tablepath = astroDir+'functions/gammamc_dif.dat'
-        self._data = np.loadtxt(tablepath)
-        
-        """
-            Mapping between the channel codes and the rows in the gammamc file
-            
-            1 : 8, # ee
-            2 : 6, # mumu
-            3 : 3, # tautau
-            4 : 1, # bb
-            5 : 2, # tt
-            6 : 7, # gg
-            7 : 4, # ww
-            8 : 5, # zz
-            9 : 0, # cc
-            10 : 10, # uu
-            11 : 11, # dd
-            12 : 9, # ss
-        """
-        
-        channel_index_mapping = {
-            1 : 8, # ee
-            2 : 6, # mumu
-            3 : 3, # tautau
-            4 : 1, # bb
-            5 : 2, # tt
-            6 : 7, # gg
-            7 : 4, # ww
-            8 : 5, # zz
-            9 : 0, # cc
-            10 : 10, # uu
-            11 : 11, # dd
-            12 : 9, # ss
-        }
-        
-        # Number of decades in x = log10(E/M)
-        ndec = 10.0
-        xedge = np.linspace(0,1.0,251)
-        self._x = 0.5*(xedge[1:]+xedge[:-1])*ndec - ndec
-
-        ichan = channel_index_mapping[int(self.channel.value)]
-
-        # These are the mass points
-        self._mass = np.array([2.0,4.0,6.0,8.0,10.0,
-                       25.0,50.0,80.3,91.2,100.0,
-                       150.0,176.0,200.0,250.0,350.0,500.0,750.0,
-                       1000.0,1500.0,2000.0,3000.0,5000.0,7000.0,1E4])
-        self._dn = self._data.reshape((12,24,250))
-            
-        self._dn_interp = RegularGridInterpolator([self._mass,self._x],
-                                                    self._dn[ichan,:,:],
-                                                    bounds_error=False,
-                                                    fill_value=None)
+
+        # The tables and the interpolators are shared by all the instances, and loaded only when needed (see the
+        # dark_matter_tables module). The interpolator for the current channel is selected in evaluate, so that a
+        # change of the channel is taken into account
 
         if self.mass.value > 10000:
             print "Warning: DMFitFunction only appropriate for masses <= 10 TeV"
@@ -1512,7 +1623,7 @@ class DMFitFunction(Function1D):
         
         xm = np.log10(np.divide(xx,mass)) - 3.0
         phip = 1./(8.*np.pi)*np.power(mass,-2)*(sigmav*J) # units of this should be 1 / cm**2 / s
-        dn = self._dn_interp((mass,xm))
+        dn = dark_matter_tables.get_interpolator('fermi', channel)((mass,xm))
         dn[xm > 0] = 0
         
         return np.multiply(phip,np.divide(dn,x))
@@ -1548,10 +1659,12 @@ class DMSpectra(Function1D):
             
             sigmav :
                 desc : DM annihilation cross section (cm^3/s)
+                is_normalization : yes
                 initial value : 1.e-26
             
             J :
                 desc : Target total J-factor (GeV^2 cm^-5)
+                is_normalization : yes
                 initial value : 1.e20
                 fix : yes
         """
@@ -1559,87 +1672,13 @@ class DMSpectra(Function1D):
     __metaclass__ = FunctionMeta
     
     def _setup(self):
-        
-        astroDir = astromodels.__file__
-        astroDir = astroDir.split('__init__.py')[0]
-        tablepath_h = astroDir+'functions/dmSpecTab.npy'
-        self._data_h = np.load(tablepath_h)
-        tablepath_f = astroDir+'functions/gammamc_dif.dat'
-        self._data_f = np.loadtxt(tablepath_f)
-        
-        """
-            Mapping between the channel codes and the rows in the gammamc file
-            dmSpecTab.npy created to match this mapping too
-            
-            1 : 8, # ee
-            2 : 6, # mumu
-            3 : 3, # tautau
-            4 : 1, # bb
-            5 : 2, # tt
-            6 : 7, # gg
-            7 : 4, # ww
-            8 : 5, # zz
-            9 : 0, # cc
-            10 : 10, # uu
-            11 : 11, # dd
-            12 : 9, # ss
-            """
-        
-        channel_index_mapping = {
-            1 : 8, # ee
-            2 : 6, # mumu
-            3 : 3, # tautau
-            4 : 1, # bb
-            5 : 2, # tt
-            6 : 7, # gg
-            7 : 4, # ww
-            8 : 5, # zz
-            9 : 0, # cc
-            10 : 10, # uu
-            11 : 11, # dd
-            12 : 9, # ss
-        }
-        
-        # Number of decades in x = log10(E/M)
-        ndec = 10.0
-        xedge = np.linspace(0,1.0,251)
-        self._x = 0.5*(xedge[1:]+xedge[:-1])*ndec - ndec
-        
-        ichan = channel_index_mapping[int(self.channel.value)]
-        
-        # These are the mass points in GeV
-        self._mass_h = np.array([50.,61.2,74.91,91.69,112.22,137.36,168.12,205.78,251.87,308.29,
-                               377.34,461.86,565.31,691.93,846.91,1036.6,1268.78,1552.97,1900.82,
-                               2326.57,2847.69,3485.53,4266.23,5221.81,6391.41,7823.0,9575.23,
-                               11719.94,14345.03,17558.1,21490.85,26304.48,32196.3,39407.79,48234.54,
-                               59038.36,72262.07,88447.7,108258.66,132506.99,162186.57,198513.95,
-                               242978.11,297401.58,364015.09,445549.04,545345.37,667494.6,817003.43,1000000.])
-            
-       
-        # These are the mass points in GeV
-        self._mass_f = np.array([2.0,4.0,6.0,8.0,10.0,
-                              25.0,50.0,80.3,91.2,100.0,
-                              150.0,176.0,200.0,250.0,350.0,500.0,750.0,
-                              1000.0,1500.0,2000.0,3000.0,5000.0,7000.0,1E4])
-                              
-        self._mass = np.append(self._mass_f,self._mass_h[27:])
-        
-        self._dn_f = self._data_f.reshape((12,24,250))
-        self._dn_h = self._data_h
-        
-        self._dn = np.zeros((12,len(self._mass),250))
-        self._dn[:,0:24,:] = self._dn_f
-        self._dn[:,24:,:] = self._dn_h[:,27:,:]
-        
-        self._dn_interp = RegularGridInterpolator([self._mass,self._x],
-                                                   self._dn[ichan,:,:],
-                                                   bounds_error=False,
-                                                   fill_value=None)
-    
+
+        # The tables (Fermi and HAWC combined) and the interpolators are shared by all the instances, and loaded only
+        # when needed (see the dark_matter_tables module)
+
         if self.channel.value in [1,6,7] and self.mass.value > 10000.:
             print "ERROR: currently spectra for selected channel and mass not implemented."
             print "Spectra for channels ['ee','gg','WW'] currently not available for mass > 10 TeV"
-    
 
     def _set_units(self, x_unit, y_unit):
     
@@ -1677,7 +1716,7 @@ class DMSpectra(Function1D):
         
         xm = np.log10(np.divide(xx,mass)) - 3.0
         phip = 1./(8.*np.pi)*np.power(mass,-2)*(sigmav*J) # units of this should be 1 / cm**2
-        dn = self._dn_interp((mass,xm)) # note this is unitless (dx = d(xm))
+        dn = dark_matter_tables.get_interpolator('combined', channel)((mass,xm)) # note this is unitless (dx = d(xm))
         dn[xm > 0] = 0
         
         return np.multiply(phip,np.divide(dn,x))
@@ -1,10 +1,13 @@
 import numpy as np
-from astropy.coordinates import SkyCoord, ICRS, BaseCoordinateFrame
+from astropy.coordinates import ICRS, BaseCoordinateFrame
 
 from astromodels.functions.function import Function2D, FunctionMeta
 from astromodels.utils.angular_distance import angular_distance
+from astromodels.utils.coordinate_transforms import transform_coordinates, get_grid_fingerprint
 
 from astropy.io import fits
+from astropy.wcs import WCS
+from astropy.wcs.utils import wcs_to_celestial_frame
 
 class Latitude_galactic_diffuse(Function2D):
     r"""
@@ -55,10 +58,9 @@ class Latitude_galactic_diffuse(Function2D):
 
     def evaluate(self, x, y, K, sigma_b):
 
-        # We assume x and y are R.A. and Dec
-        _coord = SkyCoord(ra=x, dec=y, frame=self._frame, unit="deg")
-
-        b = _coord.transform_to('galactic').b.value
+        # We assume x and y are R.A. and Dec. The transformation is cached, since the grid is usually the same
+        # for all the evaluations
+        _, b = transform_coordinates(x, y, self._frame, 'galactic')
 
         return K * np.exp(-b ** 2 / (2 * sigma_b ** 2))
 
@@ -117,6 +119,15 @@ class Gaussian_on_sphere(Function2D):
         return np.power(180 / np.pi, 2) * 1. / (2 * np.pi * sigma ** 2) * np.exp(
             -0.5 * np.power(angsep, 2) / sigma ** 2)
 
+    # Truncation radius for the sparse evaluation, in units of sigma. Beyond 5 sigma the Gaussian is less than
+    # 4e-6 times its peak
+
+    truncation_sigmas = 5.0
+
+    def get_truncation_radius(self):
+
+        return self.truncation_sigmas * self.sigma.value
+
     def get_boundaries(self):
 
         # Truncate the gaussian at 2 times the max of sigma allowed
@@ -202,6 +213,12 @@ class Disk_on_sphere(Function2D):
 
         return np.power(180 / np.pi, 2) * 1. / (np.pi * radius ** 2) * (angsep <= radius)
 
+    def get_truncation_radius(self):
+
+        # The disk is exactly zero outside of the radius
+
+        return self.radius.value
+
     def get_boundaries(self):
 
         # Truncate the disk at 2 times the max of radius allowed
@@ -254,77 +271,230 @@ class SpatialTemplate_2D(Function2D):
     __metaclass__ = FunctionMeta
     
     def _set_units(self, x_unit, y_unit, z_unit):
-        
+
         self.K.unit = z_unit
-    
+
     # This is optional, and it is only needed if we need more setup after the
     # constructor provided by the meta class
-    
+
     def _setup(self):
-        
+
         self._frame = ICRS()
-    
-    def load_file(self,fitsfile,ihdu=0):
-        
-        with fits.open(fitsfile) as f:
-            self._refXpix = f[ihdu].header['CRPIX1']
-            self._refYpix = f[ihdu].header['CRPIX2']
-            self._delXpix = f[ihdu].header['CDELT1']
-            self._delYpix = f[ihdu].header['CDELT2']
-            self._refX = f[ihdu].header['CRVAL1'] # assumed to be RA
-            self._refY = f[ihdu].header['CRVAL2'] # assumed to be DEC
+
+        self._fitsfile = None
+
+        self._template_cache = None
+
+    def load_file(self, fitsfile, ihdu=0, interpolation='nearest'):
+        """
+        Load the template from a FITS file. The image is memory-mapped (not read in memory), and the WCS in the header
+        is used to find the pixels corresponding to the input coordinates.
+
+        :param fitsfile: name of the FITS file
+        :param ihdu: number of the HDU containing the template (default: 0)
+        :param interpolation: 'nearest' (value of the pixel containing each point) or 'bilinear' (interpolation
+        among the 4 nearest pixel centers)
+        :return: (none)
+        """
+
+        assert interpolation in ('nearest', 'bilinear'), "Interpolation must be either 'nearest' or 'bilinear'"
+
+        with fits.open(fitsfile, memmap=True) as f:
+
+            header = f[ihdu].header
+
+            # The data are still accessible after closing the file
+
             self._map = f[ihdu].data
-            self._nX = f[ihdu].header['NAXIS1']
-            self._nY = f[ihdu].header['NAXIS2']
-    
+
+        self._wcs = WCS(header).celestial
+
+        self._nX = header['NAXIS1']
+        self._nY = header['NAXIS2']
+
+        # Frame of the template (for example Galactic if the header uses GLON/GLAT)
+
+        self._map_frame = wcs_to_celestial_frame(self._wcs)
+
+        self._fitsfile = fitsfile
+        self._ihdu = ihdu
+        self._interpolation = interpolation
+
+        # Values of the template on the last grid of coordinates
+
+        self._template_cache = None
+
+    def __getstate__(self):
+
+        # The template is not copied or pickled, it is read again from the file instead (so that copies of this
+        # function share the same memory map)
+
+        dict_state, slots_state = super(SpatialTemplate_2D, self).__getstate__()
+
+        dict_state = dict((key, value) for key, value in dict_state.iteritems()
+                          if key not in ('_map', '_wcs', '_map_frame', '_template_cache'))
+
+        return dict_state, slots_state
+
+    def __setstate__(self, state):
+
+        super(SpatialTemplate_2D, self).__setstate__(state)
+
+        if self._fitsfile is not None:
+
+            self.load_file(self._fitsfile, self._ihdu, self._interpolation)
+
     def set_frame(self, new_frame):
         """
             Set a new frame for the coordinates (the default is ICRS J2000)
-            
+
             :param new_frame: a coordinate frame from astropy
             :return: (none)
             """
         assert isinstance(new_frame, BaseCoordinateFrame)
-        
+
         self._frame = new_frame
-    
-    def evaluate(self, x, y, K):
-        
-        # We assume x and y are R.A. and Dec
-        _coord = SkyCoord(ra=x, dec=y, frame=self._frame, unit="deg")
-        
-        Xpix = np.add(np.divide(np.subtract(x,self._refX),self._delXpix),self._refXpix)
-        Ypix = np.add(np.divide(np.subtract(y,self._refY),self._delYpix),self._refYpix)
-        
-        Xpix = Xpix.astype(int)
-        Ypix = Ypix.astype(int)
-        
+
+        self._template_cache = None
+
+    def _get_template_values(self, x, y):
+
+        # Returns the values of the template at the provided coordinates. They are computed only once for each
+        # grid of coordinates, since the grid usually does not change during a fit
+
+        fingerprint = get_grid_fingerprint(x, y)
+
+        if self._template_cache is not None and self._template_cache[0] == fingerprint:
+
+            return self._template_cache[1]
+
+        # Coordinates in the frame of the template, then pixel coordinates (0-based, the center of the first pixel
+        # is 0.0)
+
+        lon, lat = transform_coordinates(x, y, self._frame, self._map_frame)
+
+        with np.errstate(invalid='ignore'):
+
+            Xpix, Ypix = self._wcs.wcs_world2pix(lon, lat, 0)
+
+        if self._interpolation == 'nearest':
+
+            values = self._get_pixel_values(np.floor(Xpix + 0.5), np.floor(Ypix + 0.5))
+
+        else:
+
+            x0 = np.floor(Xpix)
+            y0 = np.floor(Ypix)
+
+            wx = Xpix - x0
+            wy = Ypix - y0
+
+            values = ((1 - wx) * (1 - wy) * self._get_pixel_values(x0, y0) +
+                      wx * (1 - wy) * self._get_pixel_values(x0 + 1, y0) +
+                      (1 - wx) * wy * self._get_pixel_values(x0, y0 + 1) +
+                      wx * wy * self._get_pixel_values(x0 + 1, y0 + 1))
+
+        self._template_cache = (fingerprint, values)
+
+        return values
+
+    def _get_pixel_values(self, Xpix, Ypix):
+
+        # Returns the values of the pixels (zero for pixels outside of the template)
+
+        out = np.zeros(Xpix.shape)
+
         # find pixels that are in the template ROI, otherwise return zero
-        iz = np.where((Xpix<self._nX) & (Xpix>=0) & (Ypix<self._nY) & (Ypix>=0))[0]
-        out = np.zeros((len(x)))
-        out[iz] = self._map[Xpix[iz].astype(int),Ypix[iz]]
-        
-        #pdb.set_trace()
-        
-        return np.multiply(K,out)
+        with np.errstate(invalid='ignore'):
+
+            iz = (Xpix < self._nX) & (Xpix >= 0) & (Ypix < self._nY) & (Ypix >= 0)
+
+        # The first axis of the image is Y (NAXIS2)
+        out[iz] = self._map[Ypix[iz].astype(int), Xpix[iz].astype(int)]
+
+        return out
+
+    def evaluate(self, x, y, K):
+
+        # We assume x and y are R.A. and Dec (or in general coordinates in the frame set with set_frame)
+        return np.multiply(K, self._get_template_values(x, y))
 
     def get_boundaries(self):
-    
-        min_ra = (0-np.int(self._refXpix))*self._delXpix + self._refX
-        max_ra = ((self._nX-1)-np.int(self._refXpix))*self._delXpix + self._refX
-        
-        min_dec = (0-np.int(self._refYpix))*self._delYpix + self._refY
-        max_dec = ((self._nY-1)-np.int(self._refYpix))*self._delYpix + self._refY
-        
-        min_lon = min([min_ra,max_ra])
-        max_lon = max([min_ra,max_ra])
-        
-        min_lat = min([min_dec,max_dec])
-        max_lat = max([min_dec,max_dec])
-        
-        
-        return (min_lon, max_lon), (min_lat, max_lat)
 
+        # Outer edges of the pixels on the border of the template, going around it in order (so that the border is a
+        # closed line)
+
+        edge_x = np.arange(self._nX + 1) - 0.5
+        edge_y = np.arange(self._nY + 1) - 0.5
+
+        border_x = np.concatenate([edge_x, np.zeros(self._nY) + self._nX - 0.5, edge_x[::-1],
+                                   np.zeros(self._nY) - 0.5])
+        border_y = np.concatenate([np.zeros(self._nX + 1) - 0.5, edge_y[1:], np.zeros(self._nX + 1) + self._nY - 0.5,
+                                   edge_y[-2::-1]])
+
+        with np.errstate(invalid='ignore'):
+
+            lon, lat = self._wcs.wcs_pix2world(border_x, border_y, 0)
+
+        if not (np.all(np.isfinite(lon)) and np.all(np.isfinite(lat))):
+
+            # The border goes beyond the valid region of the projection (for example for an all-sky template in an
+            # AIT projection), so the template can cover any part of the sky
+
+            return (0.0, 360.0), (-90.0, 90.0)
+
+        # Convert them to the frame of the input coordinates
+
+        lon, lat = transform_coordinates(lon, lat, self._map_frame, self._frame)
+
+        min_lat = np.min(lat)
+        max_lat = np.max(lat)
+
+        # Follow the longitude along the border, without jumps at lon = 0. If the border goes around the sphere, the
+        # template contains a pole, so it covers all longitudes up to the pole (the latitude and the longitude have no
+        # extremes inside the template otherwise, so the border is enough)
+
+        steps = (np.diff(np.append(lon, lon[0])) + 180.0) % 360.0 - 180.0
+
+        winding = int(np.round(np.sum(steps) / 360.0))
+
+        if winding != 0:
+
+            if self._contains_pole(90.0):
+
+                max_lat = 90.0
+
+            else:
+
+                min_lat = -90.0
+
+            return (0.0, 360.0), (min_lat, max_lat)
+
+        unwrapped_lon = lon[0] + np.concatenate([[0.0], np.cumsum(steps[:-1])])
+
+        min_lon = np.min(unwrapped_lon)
+        max_lon = np.max(unwrapped_lon)
+
+        if max_lon - min_lon >= 360.0:
+
+            return (0.0, 360.0), (min_lat, max_lat)
+
+        # If min_lon > max_lon the box goes across lon = 0
+
+        return (min_lon % 360.0, max_lon % 360.0), (min_lat, max_lat)
+
+    def _contains_pole(self, pole_lat):
+
+        # Returns whether the pole at the provided latitude (in the frame of the input coordinates) is inside the
+        # template (the pole is tested at a few longitudes, since some projections map it to a line)
+
+        pole_lon, pole_lat = transform_coordinates(np.array([0.0, 90.0, 180.0, 270.0]), np.zeros(4) + pole_lat,
+                                                   self._frame, self._map_frame)
+
+        with np.errstate(invalid='ignore'):
 
+            Xpix, Ypix = self._wcs.wcs_world2pix(pole_lon, pole_lat, 0)
 
+            inside = (Xpix >= -0.5) & (Xpix <= self._nX - 0.5) & (Ypix >= -0.5) & (Ypix <= self._nY - 0.5)
 
+        return bool(np.any(inside))
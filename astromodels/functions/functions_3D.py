@@ -5,6 +5,7 @@ from astromodels.functions.function import Function3D, FunctionMeta
 import numpy as np
 
 from astromodels.utils.angular_distance import angular_distance
+from astromodels.utils.coordinate_transforms import get_grid_fingerprint
 
 
 class Continuous_injection_diffusion(Function3D):
@@ -82,37 +83,144 @@ class Continuous_injection_diffusion(Function3D):
         self.piv.unit = z_unit
         self.piv2.unit = z_unit
 
-    def evaluate(self, x, y, z, lon0, lat0, rdiff0, delta, piv, piv2):
+    # Maximum number of elements of the temporary arrays used during the evaluation. The output is filled in chunks
+    # of energies, each one of them with at most this number of elements
+
+    max_chunk_elements = 2 ** 20
+
+    def _get_angular_separations(self, lon, lat, lon0, lat0):
+
+        # The angular separations are computed again only if the grid or the center change (and not when the
+        # diffusion radius changes)
+
+        key = (get_grid_fingerprint(lon, lat), lon0, lat0)
+
+        cache = self.__dict__.get('_angsep_cache')
+
+        if cache is not None and cache[0] == key:
+
+            return cache[1]
+
+        angsep = np.asarray(angular_distance(lon, lat, lon0, lat0), dtype=float).reshape(-1)
+
+        self._angsep_cache = (key, angsep)
+
+        return angsep
+
+    def _get_relative_diffusion_radii(self, energy, delta, piv, piv2):
+
+        # Returns rdiff(E) / rdiff0, which changes only with the energies, delta and the pivots
 
-        lon, lat = x, y
-        energy = z
+        key = (get_grid_fingerprint(energy, 0.0), delta, piv, piv2)
+
+        cache = self.__dict__.get('_rdiff_cache')
+
+        if cache is not None and cache[0] == key:
+
+            return cache[1]
 
         # energy in kev -> TeV.
         # NOTE: the use of piv2 is necessary to preserve dimensional correctness: the logarithm can only be taken
         # of a dimensionless quantity, so there must be a pivot there.
-        try:
 
-            rdiff = rdiff0 * np.power(energy / piv, (delta - 1.) / 2. * (0.54 + 0.046 * np.log10(energy / piv2)))
+        energy = np.asarray(energy, dtype=float).reshape(-1)
+
+        relative_rdiff = np.power(energy / piv, (delta - 1.) / 2. * (0.54 + 0.046 * np.log10(energy / piv2)))
+
+        self._rdiff_cache = (key, relative_rdiff)
+
+        return relative_rdiff
+
+    @staticmethod
+    def _fill_chunk(out, angsep, rdiff):
+
+        # Compute the function for all the pixels and the energies of this chunk, writing directly in out. This is
+        # the same formula as in the latex description, written as a function of angsep / rdiff:
+        # (180 / pi)^2 * 1.2154 / (pi^1.5 * rdiff^2 * (angsep / rdiff + 0.06)) * exp(-(angsep / rdiff)^2)
+
+        np.divide(angsep[:, np.newaxis], rdiff, out=out)
+
+        denominator = out + 0.06
+        denominator *= rdiff ** 2 / (np.power(180.0 / np.pi, 2) * 1.2154 / (np.pi * np.sqrt(np.pi)))
+
+        np.square(out, out=out)
+        np.negative(out, out=out)
+        np.exp(out, out=out)
+
+        out /= denominator
+
+    def iter_energy_chunks(self, x, y, z, chunk_size=None):
+        """
+        Evaluate the function with the current values of the parameters, one chunk of energies at the time. This
+        is useful to process large grids without allocating the whole output.
+
+        :param x: longitudes
+        :param y: latitudes
+        :param z: energies
+        :param chunk_size: number of energies in each chunk (default: as many as allowed by max_chunk_elements)
+        :return: a generator of (energy slice, array with shape (n_pixels, n_energies_in_chunk))
+        """
+
+        angsep = self._get_angular_separations(x, y, self.lon0.value, self.lat0.value)
+
+        rdiff = self.rdiff0.value * self._get_relative_diffusion_radii(z, self.delta.value, self.piv.value,
+                                                                       self.piv2.value)
+
+        if chunk_size is None:
+
+            chunk_size = max(1, self.max_chunk_elements // max(angsep.shape[0], 1))
+
+        for start in range(0, rdiff.shape[0], chunk_size):
+
+            energy_slice = slice(start, start + chunk_size)
+
+            this_rdiff = rdiff[energy_slice]
+
+            out = np.empty((angsep.shape[0], this_rdiff.shape[0]))
+
+            self._fill_chunk(out, angsep, this_rdiff)
+
+            yield energy_slice, out
+
+    def evaluate(self, x, y, z, lon0, lat0, rdiff0, delta, piv, piv2):
+
+        if isinstance(rdiff0, u.Quantity):
+
+            # Work without units, then add the unit of the result (1 / rdiff0.unit^2)
+
+            unit = rdiff0.unit ** (-2)
 
-        except ValueError:
+            x, y = x.to(lon0.unit).value, y.to(lat0.unit).value
+            z = z.to(piv.unit).value
+
+            lon0, lat0, rdiff0 = lon0.value, lat0.value, rdiff0.value
+            delta, piv, piv2 = delta.value, piv.value, piv2.to(piv.unit).value
+
+        else:
 
-            # This happens when using units, because astropy.units fails with the message:
-            # "ValueError: Quantities and Units may only be raised to a scalar power"
+            unit = None
 
-            # Work around the problem with this loop, which is slow but using units is only for testing purposes or
-            # single calls, so it shouldn't matter too much
-            rdiff = np.array( map(lambda x: (rdiff0 * np.power(energy/ piv, x)).value,
-                                  (delta - 1.) / 2. * (0.54 + 0.046 * np.log10(energy / piv2)))) * rdiff0.unit
+        angsep = self._get_angular_separations(x, y, lon0, lat0)
 
-        angsep = angular_distance(lon, lat, lon0, lat0)
+        rdiff = rdiff0 * self._get_relative_diffusion_radii(z, delta, piv, piv2)
 
-        pi = np.pi
+        # The output is in Fortran order, so that each chunk of energies is contiguous in memory
 
-        rdiffs, angseps = np.meshgrid(rdiff, angsep)
+        result = np.empty((angsep.shape[0], rdiff.shape[0]), order='F')
 
-        return np.power(180.0 / pi, 2) * 1.2154 / (pi * np.sqrt(pi) * rdiffs * (angseps + 0.06 * rdiffs)) * \
-               np.exp(-np.power(angseps, 2) / rdiffs ** 2)
+        chunk_size = max(1, self.max_chunk_elements // max(angsep.shape[0], 1))
+
+        for start in range(0, rdiff.shape[0], chunk_size):
+
+            self._fill_chunk(result[:, start:start + chunk_size], angsep, rdiff[start:start + chunk_size])
+
+        if unit is not None:
+
+            return result * unit
+
+        else:
 
+            return result
 
     def get_boundaries(self):
 
@@ -260,6 +260,7 @@ class TemplateModel(Function1D):
             K :
 
                 desc : Normalization (freeze this to 1 if the template provides the normalization by itself)
+                is_normalization : yes
                 initial value : 1.0
 
             scale :
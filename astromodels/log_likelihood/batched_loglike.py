@@ -0,0 +1,399 @@
+__author__ = 'giacomov'
+
+import exceptions
+
+import numpy as np
+
+from astromodels.parameter import SettingOutOfBounds
+from astromodels.functions.function import CompositeFunction
+
+
+class GradientNotAvailable(exceptions.Exception):
+    pass
+
+
+def _product(factors):
+
+    # Product of numbers and arrays with different (but compatible) shapes
+
+    result = 1.0
+
+    for factor in factors:
+
+        result = result * factor
+
+    return result
+
+
+class BatchedLogLike(object):
+    """
+    Computes the log-likelihood of the data for many sets of values of the free parameters of a model at once, as
+    needed for example by ensemble samplers. The expected values are the sum of the fluxes of all the point sources
+    (including the sources in catalogs) at x, multiplied by the exposure.
+
+    When all the free parameters are parameters of the spectral functions of point sources (not of catalogs) and
+    there are no links, the spectral functions are evaluated once for all the samples, using broadcasting (functions
+    which do not support arrays of parameters are evaluated sample by sample, which is correct but slower). A function
+    whose only free parameters are normalizations (see Function.normalization_parameters) is not evaluated at all, as
+    its shape is computed once and scaled. Otherwise the free parameters are set sample by sample, and restored to
+    their original values at the end.
+
+    The gradient is available when all the free parameters are normalizations (see has_gradient).
+
+    Samples with values outside of the boundaries of the parameters have a log-likelihood of -inf.
+
+    :param model: the model (the free parameters are taken at construction and they should not change afterwards)
+    :param x: the values of the independent variable (for example the energies) without units
+    :param statistic: an instance of one of the statistics in astromodels.log_likelihood.statistics
+    :param exposure: number or array multiplying the fluxes to get the expected values (default: 1)
+    """
+
+    def __init__(self, model, x, statistic, exposure=1.0):
+
+        self._model = model
+
+        self._x = np.array(x, dtype=float, ndmin=1)
+
+        assert self._x.ndim == 1, "x must be a 1d array"
+
+        self._statistic = statistic
+
+        assert statistic.n_bins == self._x.shape[0], "The statistic and x must have the same number of bins"
+
+        self._exposure = np.array(np.broadcast_to(np.asarray(exposure, dtype=float), self._x.shape))
+
+        self._free_parameters = model.free_parameters
+
+        self._free_parameters_list = self._free_parameters.values()
+
+        self._min_values = np.array([-np.inf if parameter.min_value is None else parameter.min_value
+                                     for parameter in self._free_parameters_list])
+
+        self._max_values = np.array([np.inf if parameter.max_value is None else parameter.max_value
+                                     for parameter in self._free_parameters_list])
+
+        # Find which column of the matrix of values corresponds to each parameter of the spectral functions
+
+        column_of = dict((id(parameter), i) for i, parameter in enumerate(self._free_parameters_list))
+
+        self._functions = []
+
+        n_found = 0
+
+        for source in model.point_sources.values():
+
+            for component in source.components.values():
+
+                function = component.shape
+
+                free_columns = dict((parameter_name, column_of[id(parameter)])
+                                    for parameter_name, parameter in function.parameters.iteritems()
+                                    if id(parameter) in column_of)
+
+                n_found += len(free_columns)
+
+                self._functions.append((function, free_columns))
+
+        self._is_batchable = (n_found == len(self._free_parameters_list)) and not model.linked_parameters
+
+        self._has_gradient = self._is_batchable and \
+                             all(set(free_columns.keys()) <= set(function.normalization_parameters.keys())
+                                 for function, free_columns in self._functions)
+
+    @property
+    def free_parameters(self):
+        """
+        Returns the dictionary of the free parameters, in the same order as the columns of the matrix of values
+        """
+
+        return self._free_parameters
+
+    @property
+    def n_free(self):
+        """
+        Number of free parameters
+        """
+
+        return len(self._free_parameters_list)
+
+    @property
+    def is_batchable(self):
+        """
+        Whether all the samples are evaluated at once (see the class documentation)
+        """
+
+        return self._is_batchable
+
+    @property
+    def has_gradient(self):
+        """
+        Whether the analytic gradient is available (see the class documentation)
+        """
+
+        return self._has_gradient
+
+    def _get_values_matrix(self, values):
+
+        values = np.array(values, dtype=float, ndmin=2)
+
+        assert values.ndim == 2 and values.shape[1] == self.n_free, "The values must be a matrix with shape " \
+                                                                    "(n_samples, %s)" % self.n_free
+
+        return values
+
+    def _get_valid_rows(self, values):
+
+        return np.all((values >= self._min_values) & (values <= self._max_values), axis=1)
+
+    def get_expected(self, values):
+        """
+        Returns the expected values for each sample
+
+        :param values: matrix of values of the free parameters with shape (n_samples, n_free) (or a 1d array for one
+        sample)
+        :return: array with shape (n_samples, n_bins) (NaN for the samples out of the boundaries)
+        """
+
+        values = self._get_values_matrix(values)
+
+        valid = self._get_valid_rows(values)
+
+        expected = np.empty((values.shape[0], self._x.shape[0]))
+        expected.fill(np.nan)
+
+        if np.any(valid):
+
+            if self._is_batchable:
+
+                expected[valid] = self._get_batched_fluxes(values[valid], False)[0] * self._exposure
+
+            else:
+
+                expected[valid] = self._get_fluxes_sample_by_sample(values[valid]) * self._exposure
+
+        return expected
+
+    def log_like(self, values):
+        """
+        Returns the log-likelihood for each sample
+
+        :param values: matrix of values of the free parameters with shape (n_samples, n_free) (or a 1d array for one
+        sample)
+        :return: array of log-likelihoods with shape (n_samples,)
+        """
+
+        values = self._get_values_matrix(values)
+
+        valid = self._get_valid_rows(values)
+
+        log_like = np.empty(values.shape[0])
+        log_like.fill(-np.inf)
+
+        if np.any(valid):
+
+            log_like[valid] = self._statistic.log_like(self.get_expected(values[valid]))
+
+        return log_like
+
+    def __call__(self, values):
+
+        return self.log_like(values)
+
+    def log_like_and_gradient(self, values):
+        """
+        Returns the log-likelihood and its gradient with respect to the free parameters for each sample. This is
+        possible only if has_gradient is True.
+
+        :param values: matrix of values of the free parameters with shape (n_samples, n_free) (or a 1d array for one
+        sample)
+        :return: (log-likelihoods with shape (n_samples,), gradients with shape (n_samples, n_free)). The gradient of
+        the samples out of the boundaries is NaN
+        """
+
+        if not self._has_gradient:
+
+            raise GradientNotAvailable("The analytic gradient is available only if all the free parameters are "
+                                       "normalizations of the spectral functions of point sources")
+
+        values = self._get_values_matrix(values)
+
+        valid = self._get_valid_rows(values)
+
+        log_like = np.empty(values.shape[0])
+        log_like.fill(-np.inf)
+
+        gradient = np.empty(values.shape)
+        gradient.fill(np.nan)
+
+        if np.any(valid):
+
+            fluxes, derivatives = self._get_batched_fluxes(values[valid], True)
+
+            expected = fluxes * self._exposure
+
+            log_like[valid] = self._statistic.log_like(expected)
+
+            d_log_like = self._statistic.d_log_like(expected) * self._exposure
+
+            valid_gradient = np.empty((expected.shape[0], self.n_free))
+
+            for i, derivative in enumerate(derivatives):
+
+                valid_gradient[:, i] = np.sum(d_log_like * derivative, axis=1)
+
+            gradient[valid] = valid_gradient
+
+        return log_like, gradient
+
+    def _get_batched_fluxes(self, values, compute_derivatives):
+
+        # Returns the sum of the fluxes of all the point sources for all the samples, and (if compute_derivatives is
+        # True) the derivatives of the sum with respect to each free parameter
+
+        n_samples = values.shape[0]
+        n_bins = self._x.shape[0]
+
+        fluxes = np.zeros((n_samples, n_bins))
+
+        derivatives = [np.zeros((n_samples, n_bins)) for _ in range(self.n_free)] if compute_derivatives else None
+
+        for function, free_columns in self._functions:
+
+            if isinstance(function, CompositeFunction):
+
+                # The parameters of a composite function are those of the functions composing it, so it is evaluated
+                # by going through them (it has no normalization parameters, so there are no derivatives)
+
+                fluxes += self._evaluate_composite(function, values, free_columns)
+
+                continue
+
+            kwargs = {}
+
+            for parameter_name, parameter in function.parameters.iteritems():
+
+                if parameter_name in free_columns:
+
+                    kwargs[parameter_name] = values[:, free_columns[parameter_name]][:, np.newaxis]
+
+                else:
+
+                    kwargs[parameter_name] = parameter.value
+
+            # f(x) = K * g(x) where K is the product of the normalizations
+
+            normalization_names = function.normalization_parameters.keys()
+
+            normalizations = [kwargs[name] for name in normalization_names]
+
+            for parameter_name in normalization_names:
+
+                kwargs[parameter_name] = 1.0
+
+            if set(free_columns.keys()) <= set(normalization_names):
+
+                # The shape does not change from sample to sample (and it is cached by the function)
+
+                shape = function.get_unnormalized_shape(self._x).reshape(1, n_bins)
+
+            else:
+
+                shape = self._evaluate_sample_by_sample_if_needed(function, kwargs, n_samples)
+
+            fluxes += _product(normalizations) * shape
+
+            if compute_derivatives:
+
+                for i, parameter_name in enumerate(normalization_names):
+
+                    if parameter_name in free_columns:
+
+                        derivatives[free_columns[parameter_name]] += \
+                            _product(normalizations[:i] + normalizations[i + 1:]) * shape
+
+        # Catalogs of point sources do not depend on the free parameters
+
+        for catalog in self._model.point_source_catalogs.values():
+
+            fluxes += catalog.get_fluxes(self._x).sum(axis=0)
+
+        return fluxes, derivatives
+
+    def _evaluate_composite(self, function, values, free_columns):
+
+        # Evaluate a composite function for all the samples at once, with the free parameters taken from the matrix
+        # of values (functions which do not support arrays of parameters are evaluated sample by sample)
+
+        values_of = dict((id(function.parameters[parameter_name]), values[:, column][:, np.newaxis])
+                         for parameter_name, column in free_columns.iteritems())
+
+        def get_value(parameter):
+
+            return values_of.get(id(parameter), parameter.value)
+
+        return function._evaluate_with_values(self._x[np.newaxis, :], get_value)
+
+    def _evaluate_sample_by_sample_if_needed(self, function, kwargs, n_samples):
+
+        # Evaluate the function for all the samples at once. If this does not work (the function does not support
+        # arrays of parameters), evaluate it sample by sample
+
+        n_bins = self._x.shape[0]
+
+        try:
+
+            shape = np.asarray(function.evaluate(self._x[np.newaxis, :], **kwargs), dtype=float)
+
+        except (ValueError, IndexError, TypeError):
+
+            shape = None
+
+        if shape is None or shape.shape != (n_samples, n_bins):
+
+            shape = np.empty((n_samples, n_bins))
+
+            for i in range(n_samples):
+
+                this_kwargs = dict((parameter_name, value[i, 0] if isinstance(value, np.ndarray) else value)
+                                   for parameter_name, value in kwargs.iteritems())
+
+                shape[i, :] = function.evaluate(self._x, **this_kwargs)
+
+        return shape
+
+    def _get_fluxes_sample_by_sample(self, values):
+
+        # Set the values of the free parameters for each sample and evaluate all the point sources, then restore
+        # the original values
+
+        original_values = [parameter.value for parameter in self._free_parameters_list]
+
+        fluxes = np.zeros((values.shape[0], self._x.shape[0]))
+
+        try:
+
+            for i in range(values.shape[0]):
+
+                try:
+
+                    for parameter, value in zip(self._free_parameters_list, values[i]):
+
+                        parameter.value = value
+
+                except SettingOutOfBounds:
+
+                    fluxes[i, :] = np.nan
+
+                    continue
+
+                for j in range(self._model.get_number_of_point_sources()):
+
+                    fluxes[i, :] += self._model.get_point_source_fluxes(j, self._x)
+
+        finally:
+
+            for parameter, value in zip(self._free_parameters_list, original_values):
+
+                parameter.value = value
+
+        return fluxes
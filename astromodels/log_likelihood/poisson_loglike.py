@@ -1,5 +1,8 @@
 __author__ = 'giacomov'
 
+import numpy as np
+
+
 class LogLike(object):
 
     def __init__(self, x, y, model):
@@ -0,0 +1,195 @@
+__author__ = 'giacomov'
+
+import numpy as np
+from scipy.special import gammaln
+
+
+# All the statistics work on a matrix of expected values with one row per sample (i.e., per set of values of the
+# parameters) and one column per bin, and return one log-likelihood per row. The terms depending only on the data
+# are computed once in the constructor.
+
+
+def _as_matrix(expected, n_bins):
+
+    expected = np.asarray(expected, dtype=float)
+
+    if expected.ndim == 1:
+
+        expected = expected[np.newaxis, :]
+
+    assert expected.shape[1] == n_bins, "The expected values must have %s bins" % n_bins
+
+    return expected
+
+
+class PoissonStatistic(object):
+    """
+    Poisson log-likelihood (Cash statistic) for the observed counts y_i given the expected counts m_i:
+
+        log(L) = sum_i y_i log(m_i) - m_i - log(y_i!)
+
+    The log(y_i!) term is computed only once. A sample with a negative expected value, or with an expected value of
+    zero in a bin with counts, has a log-likelihood of -inf.
+
+    :param counts: observed counts in each bin
+    """
+
+    def __init__(self, counts):
+
+        self._counts = np.array(counts, dtype=float, ndmin=1)
+
+        assert np.all(self._counts >= 0), "Counts cannot be negative"
+
+        # Only bins with counts contribute to the y log(m) term
+
+        self._with_counts = self._counts > 0
+
+        self._counts_in_bins_with_counts = self._counts[self._with_counts]
+
+        self._log_factorials = np.sum(gammaln(self._counts + 1))
+
+    @property
+    def n_bins(self):
+
+        return self._counts.shape[0]
+
+    def log_like(self, expected):
+        """
+        Returns the log-likelihood of each sample
+
+        :param expected: expected counts, with shape (n_samples, n_bins) or (n_bins,)
+        :return: array of log-likelihoods with shape (n_samples,)
+        """
+
+        expected = _as_matrix(expected, self.n_bins)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+
+            log_like = np.dot(np.log(expected[:, self._with_counts]), self._counts_in_bins_with_counts)
+
+        log_like -= expected.sum(axis=1)
+        log_like -= self._log_factorials
+
+        log_like[np.isnan(log_like) | np.any(expected < 0, axis=1)] = -np.inf
+
+        return log_like
+
+    def d_log_like(self, expected):
+        """
+        Returns the derivative of the log-likelihood with respect to the expected counts in each bin
+
+        :param expected: expected counts, with shape (n_samples, n_bins) or (n_bins,)
+        :return: array with shape (n_samples, n_bins)
+        """
+
+        expected = _as_matrix(expected, self.n_bins)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+
+            derivative = np.where(self._with_counts, self._counts / expected, 0.0) - 1.0
+
+        return derivative
+
+
+class PoissonWithBackgroundStatistic(PoissonStatistic):
+    """
+    Poisson log-likelihood for the observed counts y_i, when the source model m_i adds to a known background b_i
+    (expected background counts, not fitted):
+
+        log(L) = sum_i y_i log(m_i + b_i) - (m_i + b_i) - log(y_i!)
+
+    :param counts: observed counts in each bin
+    :param background: expected background counts in each bin
+    """
+
+    def __init__(self, counts, background):
+
+        super(PoissonWithBackgroundStatistic, self).__init__(counts)
+
+        self._background = np.array(np.broadcast_to(np.asarray(background, dtype=float), self._counts.shape))
+
+        assert np.all(self._background >= 0), "The background cannot be negative"
+
+    def log_like(self, expected):
+        """
+        Returns the log-likelihood of each sample
+
+        :param expected: expected source counts, with shape (n_samples, n_bins) or (n_bins,)
+        :return: array of log-likelihoods with shape (n_samples,)
+        """
+
+        return super(PoissonWithBackgroundStatistic, self).log_like(_as_matrix(expected, self.n_bins) +
+                                                                    self._background)
+
+    def d_log_like(self, expected):
+        """
+        Returns the derivative of the log-likelihood with respect to the expected source counts in each bin
+
+        :param expected: expected source counts, with shape (n_samples, n_bins) or (n_bins,)
+        :return: array with shape (n_samples, n_bins)
+        """
+
+        return super(PoissonWithBackgroundStatistic, self).d_log_like(_as_matrix(expected, self.n_bins) +
+                                                                      self._background)
+
+
+class GaussianStatistic(object):
+    """
+    Gaussian log-likelihood for the measurements y_i with errors sigma_i, given the expected values m_i:
+
+        log(L) = -0.5 * chi2 - sum_i log(sqrt(2 pi) sigma_i),    chi2 = sum_i (y_i - m_i)^2 / sigma_i^2
+
+    The normalization term is computed only once.
+
+    :param y: measured values in each bin
+    :param sigma: errors on the measured values (array or number)
+    """
+
+    def __init__(self, y, sigma):
+
+        self._y = np.array(y, dtype=float, ndmin=1)
+
+        sigma = np.array(np.broadcast_to(np.asarray(sigma, dtype=float), self._y.shape))
+
+        assert np.all(sigma > 0), "The errors must be positive"
+
+        self._inverse_variance = 1.0 / sigma ** 2
+
+        self._normalization = np.sum(np.log(np.sqrt(2 * np.pi) * sigma))
+
+    @property
+    def n_bins(self):
+
+        return self._y.shape[0]
+
+    def chi2(self, expected):
+        """
+        Returns the chi square of each sample
+
+        :param expected: expected values, with shape (n_samples, n_bins) or (n_bins,)
+        :return: array with shape (n_samples,)
+        """
+
+        residuals = self._y - _as_matrix(expected, self.n_bins)
+
+        return np.dot(residuals * residuals, self._inverse_variance)
+
+    def log_like(self, expected):
+        """
+        Returns the log-likelihood of each sample
+
+        :param expected: expected values, with shape (n_samples, n_bins) or (n_bins,)
+        :return: array of log-likelihoods with shape (n_samples,)
+        """
+
+        return -0.5 * self.chi2(expected) - self._normalization
+
+    def d_log_like(self, expected):
+        """
+        Returns the derivative of the log-likelihood with respect to the expected value in each bin
+
+        :param expected: expected values, with shape (n_samples, n_bins) or (n_bins,)
+        :return: array with shape (n_samples, n_bins)
+        """
+
+        return (self._y - _as_matrix(expected, self.n_bins)) * self._inverse_variance
@@ -1,17 +1,33 @@
 __author__ = 'giacomov'
 
 import collections
+import contextlib
+import itertools
 import os
 import warnings
 
-from astromodels.sources.source import Source, POINT_SOURCE, EXTENDED_SOURCE, PARTICLE_SOURCE
+import numpy as np
+import scipy.stats
+import astropy.units as u
+
+from astromodels.sources.source import Source, POINT_SOURCE, EXTENDED_SOURCE, PARTICLE_SOURCE, POINT_SOURCE_CATALOG
+from astromodels.sources.point_source import PointSource
 
 from astromodels.my_yaml import my_yaml
 from astromodels.utils.disk_usage import disk_usage
 from astromodels.utils.table import dict_to_table
 from astromodels.parameter import Parameter, IndependentVariable
+from astromodels.parameter import get_value_generation, get_links_generation, get_link_dependencies
+from astromodels.parameter import add_value_change_listener, remove_value_change_listener, SettingOutOfBounds
+from astromodels.parameter import get_value_resolver
 from astromodels.tree import Node, DuplicatedNode
-from astromodels.functions.function import get_function
+from astromodels.functions.function import get_function, CompositeFunction
+from astromodels.utils.spatial_index import SpatialIndex
+from astromodels.utils.coordinate_transforms import get_grid_fingerprint
+from astromodels.utils.garbage_collection import paused_garbage_collector
+from astromodels.profiling import get_report
+from astromodels.trajectory import Trajectory
+from astromodels.units import get_units
 
 
 class ModelFileExists(IOError):
@@ -39,6 +55,28 @@ class ModelInternalError(ValueError):
     pass
 
 
+class NoPriorDefined(ValueError):
+
+    pass
+
+
+def _from_unit_cube(prior, cube):
+
+    # Transform an array of values in the unit interval with the provided prior, which might support only numbers
+
+    if not hasattr(prior, 'from_unit_cube'):
+
+        raise NoPriorDefined("The prior %s does not provide from_unit_cube" % prior.name)
+
+    try:
+
+        return np.asarray(prior.from_unit_cube(cube), dtype=float).reshape(cube.shape)
+
+    except (ValueError, TypeError):
+
+        return np.array([prior.from_unit_cube(x) for x in cube], dtype=float)
+
+
 class Model(Node):
 
     def __init__(self, *sources):
@@ -62,6 +100,10 @@ class Model(Node):
 
         self._particle_sources = collections.OrderedDict()
 
+        # Dictionary to keep catalogs of point sources
+
+        self._point_source_catalogs = collections.OrderedDict()
+
         # Loop over the provided sources and process them
 
         for source in sources:
@@ -101,6 +143,10 @@ class Model(Node):
 
                 self._particle_sources[source.name] = source
 
+            elif source.source_type == POINT_SOURCE_CATALOG:
+
+                self._point_source_catalogs[source.name] = source
+
             else:
 
                 raise InvalidInput("Input sources must be either a point source or an extended source")
@@ -110,15 +156,152 @@ class Model(Node):
         self._point_sources_list = self._point_sources.values()
         self._extended_sources_list = self._extended_sources.values()
         self._particle_sources_list = self._particle_sources.values()
+        self._point_source_catalogs_list = self._point_source_catalogs.values()
 
         # Now make the list of all the existing parameters
 
         self._update_parameters()
 
+        # This will contain the linked parameters sorted so that each one comes after the linked parameters it
+        # depends on (see _get_links_order)
+
+        self._links_order = []
+        self._links_order_generation = None
+        self._links_values_generation = None
+
+        # Spatial index of the boundaries of the extended sources (see _get_extended_sources_index)
+
+        self._extended_sources_index = None
+        self._extended_sources_boundaries = None
+
+        # Result of the last query of the index, as (fingerprint of the grid, index, list of indexes of the points
+        # inside each source), so that evaluating all the extended sources on the same grid needs only one query
+
+        self._extended_sources_hits = None
+
+        # Subscribers to the changes of the values of the parameters (see subscribe), as {token: (callback, subtree)},
+        # and changes waiting to be notified at the end of a batch update (see batch_update)
+
+        self._subscribers = collections.OrderedDict()
+        self._subscription_tokens = itertools.count()
+
+        self._batch_depth = 0
+        self._pending_changes = collections.OrderedDict()
+
+    @classmethod
+    def from_arrays(cls, names, ra, dec, function_class, **parameter_values):
+        """
+        Create a model made of point sources with the same type of spectral function, from arrays of names,
+        positions and values of the parameters. The sources are built with PointSource.many, which is much faster than
+        creating them one by one::
+
+            >>> model = Model.from_arrays(['src1', 'src2'], [10.0, 20.0], [-5.0, 5.0], Powerlaw,
+            ...                           K=[1e-3, 2e-3], index=[-2.1, -2.5])
+
+        For very large catalogs, where the parameters of most sources are fixed, consider using a PointSourceCatalog
+        instead.
+
+        :param names: names of the sources
+        :param ra: Equatorial J2000 Right Ascension (ICRS) of the sources (array or number)
+        :param dec: Equatorial J2000 Declination (ICRS) of the sources (array or number)
+        :param function_class: the class of the spectral function (like Powerlaw), or an instance of it
+        :param parameter_values: values of the parameters of the spectral function, either arrays with one element
+        per source or numbers (used for all the sources)
+        :return: a new model
+        """
+
+        with paused_garbage_collector():
+
+            return cls(*PointSource.many(names, ra, dec, function_class, **parameter_values))
+
     def _update_parameters(self):
 
         self._parameters = self._find_instances(Parameter)
 
+    @staticmethod
+    def _sort_links(linked_parameters):
+        """
+        Sort the provided linked parameters in topological order, i.e., so that every parameter comes after all the
+        linked parameters its value depends on (through the auxiliary variable or through the parameters of the law).
+
+        :param linked_parameters: list of linked parameters
+        :return: the sorted list (including also linked dependencies not in the input list)
+        """
+
+        order = []
+        visited = set()
+
+        for parameter in linked_parameters:
+
+            # Depth-first search, appending a parameter only after all its dependencies have been appended.
+            # There cannot be cycles, as they are refused when the link is created
+
+            stack = [(parameter, False)]
+
+            while stack:
+
+                this_parameter, dependencies_done = stack.pop()
+
+                if dependencies_done:
+
+                    order.append(this_parameter)
+
+                    continue
+
+                if id(this_parameter) in visited:
+
+                    continue
+
+                visited.add(id(this_parameter))
+
+                stack.append((this_parameter, True))
+
+                for dependency in get_link_dependencies(this_parameter):
+
+                    if dependency.has_auxiliary_variable() and id(dependency) not in visited:
+
+                        stack.append((dependency, False))
+
+        return order
+
+    def _get_links_order(self):
+        """
+        Returns the linked parameters in topological order. The graph of the links is rebuilt only if a link has been
+        created or removed since the last call.
+
+        :return: list of linked parameters
+        """
+
+        if self._links_order_generation != get_links_generation():
+
+            self._links_order = self._sort_links(self.linked_parameters.values())
+
+            self._links_order_generation = get_links_generation()
+
+        return self._links_order
+
+    def _update_linked_parameters(self):
+        """
+        Compute the values of all linked parameters by evaluating each law once, following the topological order of
+        the links. Nothing is done if no parameter has changed since the last call. After this, reading the value
+        of a linked parameter just returns the cached value.
+
+        :return: (none)
+        """
+
+        if self._links_values_generation == get_value_generation():
+
+            return
+
+        for parameter in self._get_links_order():
+
+            # Reading the value triggers the evaluation of the law, if needed. Since the dependencies come first, they
+            # have already been computed and this does not trigger any further evaluation
+
+            _ = parameter.value
+
+        self._links_values_generation = get_value_generation()
+
     @property
     def parameters(self):
         """
@@ -180,6 +363,443 @@ class Model(Node):
 
         return linked_parameter_dictionary
 
+    def subscribe(self, callback, subtree=None):
+        """
+        Register a function which will be called when the values of the parameters of this model change, with the
+        list of the paths of the changed parameters as argument. Every assignment which changes a value produces one
+        call, except within a batch update (see batch_update) where all the changes are notified with one call at the
+        end. Assignments which do not change the value are not notified, and neither are the changes of the values of
+        linked parameters (which are computed through their laws). Changes of the value made by a new minimum or
+        maximum (which moves the value inside the new boundaries) or by a new unit (which converts the value to the
+        new unit) are notified as well.
+
+            >>> token = model.subscribe(rebuild_cache, subtree='src1.spectrum')
+            >>> with model.batch_update():
+            ...     model.src1.spectrum.main.Powerlaw.K = 2.0
+            ...     model.src1.spectrum.main.Powerlaw.index = -2.2
+            >>> # rebuild_cache was called once with both paths
+            >>> model.unsubscribe(token)
+
+        NOTE: the model is kept alive as long as it has subscribers.
+
+        :param callback: a callable accepting a list of paths
+        :param subtree: if provided, only the changes of the parameters below this path (for example the name of a
+        source) are notified to this subscriber
+        :return: a token to be used with unsubscribe
+        """
+
+        if subtree is not None and subtree not in self:
+
+            raise InvalidInput("%s is not a path in the model" % subtree)
+
+        if not self._subscribers:
+
+            add_value_change_listener(self._on_value_change)
+
+        token = next(self._subscription_tokens)
+
+        self._subscribers[token] = (callback, subtree)
+
+        return token
+
+    def unsubscribe(self, token):
+        """
+        Remove a subscriber added with subscribe
+
+        :param token: the token returned by subscribe
+        :return: (none)
+        """
+
+        self._subscribers.pop(token)
+
+        if not self._subscribers:
+
+            remove_value_change_listener(self._on_value_change)
+
+    @contextlib.contextmanager
+    def batch_update(self):
+        """
+        A context manager which defers the notifications to the subscribers (see subscribe) until it exits. Then, each
+        subscriber is called once with all the parameters changed within the block (each path is listed once). Batch
+        updates can be nested: the notifications are sent at the end of the outermost one.
+
+        :return: (none)
+        """
+
+        self._batch_depth += 1
+
+        try:
+
+            yield
+
+        finally:
+
+            self._batch_depth -= 1
+
+            if self._batch_depth == 0 and self._pending_changes:
+
+                paths = self._pending_changes.keys()
+
+                self._pending_changes.clear()
+
+                self._notify(paths)
+
+    def set_free_parameters_values(self, values):
+        """
+        Set the values of all the free parameters at once, in the same order as free_parameters. If any value is
+        outside of the boundaries of its parameter nothing is changed. The subscribers (see subscribe) receive one
+        notification with all the changed parameters.
+
+        :param values: a sequence with one value for each free parameter
+        :return: (none)
+        """
+
+        free_parameters = self.free_parameters.values()
+
+        if len(values) != len(free_parameters):
+
+            raise InvalidInput("Expected %s values, got %s" % (len(free_parameters), len(values)))
+
+        self._set_parameters_values(free_parameters, values)
+
+    def _set_parameters_values(self, parameters, values):
+
+        # Check all the values before changing any of them
+
+        for parameter, value in zip(parameters, values):
+
+            if (parameter.min_value is not None and value < parameter.min_value) or \
+               (parameter.max_value is not None and value > parameter.max_value):
+
+                raise SettingOutOfBounds("The value %s for parameter %s is outside of its boundaries (%s, %s)"
+                                         % (value, parameter.path, parameter.min_value, parameter.max_value))
+
+        with self.batch_update():
+
+            for parameter, value in zip(parameters, values):
+
+                parameter.value = value
+
+    def open_trajectory(self, filename, parameters=None, overwrite=False):
+        """
+        Create a trajectory file, i.e., a compact append-only store of the values of parameters of this model (for
+        example the samples of a Markov chain). Call record() on the returned trajectory to append the current
+        values, and use restore_from to set the parameters to the values of one row. See
+        astromodels.trajectory.Trajectory.
+
+        :param filename: name of the file
+        :param parameters: paths of the parameters to record (default: the current free parameters)
+        :param overwrite: whether an existing file can be overwritten (default: False)
+        :return: an instance of Trajectory
+        """
+
+        if parameters is None:
+
+            parameters = self.free_parameters
+
+        else:
+
+            for path in parameters:
+
+                if path not in self:
+
+                    raise InvalidInput("%s is not a path in the model" % path)
+
+            parameters = collections.OrderedDict((path, self[path]) for path in parameters)
+
+        return Trajectory(filename, parameters.keys(), [parameter.unit for parameter in parameters.values()],
+                          mode='w', overwrite=overwrite, parameters=parameters.values())
+
+    def restore_from(self, trajectory, row):
+        """
+        Set the parameters of this model to the values stored in one row of a trajectory (see open_trajectory). The
+        values are converted if the units of the parameters differ from those in the trajectory. If any value is
+        outside of the boundaries of its parameter nothing is changed. The subscribers (see subscribe) receive one
+        notification.
+
+        :param trajectory: an instance of Trajectory (see also astromodels.trajectory.read_trajectory)
+        :param row: number of the row (negative numbers count from the end)
+        :return: (none)
+        """
+
+        values = np.array(trajectory[row], dtype=float)
+
+        parameters = []
+
+        for i, (path, unit) in enumerate(zip(trajectory.paths, trajectory.units)):
+
+            if path not in self:
+
+                raise InvalidInput("The parameter %s in the trajectory is not a path in the model" % path)
+
+            parameter = self[path]
+
+            if str(parameter.unit) != unit:
+
+                values[i] = (values[i] * u.Unit(unit)).to(parameter.unit).value
+
+            parameters.append(parameter)
+
+        self._set_parameters_values(parameters, values)
+
+    def _get_path_in_model(self, node):
+
+        # Returns the path of the node with respect to this model, or None if the node does not belong to this model
+
+        names = []
+
+        while node is not self:
+
+            parent = node._get_parent()
+
+            if parent is None:
+
+                return None
+
+            names.append(node.name)
+
+            node = parent
+
+        return ".".join(reversed(names))
+
+    def _on_value_change(self, parameter):
+
+        path = self._get_path_in_model(parameter)
+
+        if path is None:
+
+            return
+
+        if self._batch_depth > 0:
+
+            self._pending_changes[path] = True
+
+        else:
+
+            self._notify([path])
+
+    def _notify(self, paths):
+
+        for callback, subtree in self._subscribers.values():
+
+            if subtree is None:
+
+                these_paths = paths
+
+            else:
+
+                these_paths = [path for path in paths if path == subtree or path.startswith(subtree + ".")]
+
+            if these_paths:
+
+                callback(these_paths)
+
+    def _get_prior_groups(self):
+
+        # Group the free parameters by type of prior, as {type: (list of columns, list of priors)}, so that the priors
+        # of the same type can be evaluated with one call. Composite functions are never grouped, because the names
+        # of their parameters depend on the expression
+
+        groups = collections.OrderedDict()
+
+        for i, (parameter_name, parameter) in enumerate(self.free_parameters.iteritems()):
+
+            if not parameter.has_prior():
+
+                raise NoPriorDefined("The free parameter %s has no prior" % parameter_name)
+
+            prior = parameter.prior
+
+            key = id(prior) if isinstance(prior, CompositeFunction) else type(prior)
+
+            columns, priors = groups.setdefault(key, ([], []))
+
+            columns.append(i)
+            priors.append(prior)
+
+        return groups.values()
+
+    @staticmethod
+    def _get_prior_parameters(priors):
+
+        # Values of the parameters of the priors in a group, as {parameter name: array with one element per prior}
+
+        return dict((parameter_name, np.array([prior.parameters[parameter_name].value for prior in priors]))
+                    for parameter_name in priors[0].parameters.keys())
+
+    def _get_points_matrix(self, points):
+
+        points = np.array(points, dtype=float, ndmin=2)
+
+        n_free = len(self.free_parameters)
+
+        if points.ndim != 2 or points.shape[1] != n_free:
+
+            raise InvalidInput("The points must be a matrix with shape (n_points, %s)" % n_free)
+
+        return points
+
+    def prior_transform(self, cube):
+        """
+        Transform points in the unit hypercube into values of the free parameters, by applying the inverse of the
+        cumulative distribution of the prior of each parameter (as needed by nested sampling). All the free
+        parameters must have a prior. The priors of the same type are transformed with one call (see for example
+        Uniform_prior.evaluate_from_unit_cube). The values of the parameters are not changed.
+
+        :param cube: matrix with shape (n_points, n_free), with values between 0 and 1, with one column for each free
+        parameter in the same order as free_parameters (or a 1d array for one point)
+        :return: matrix of values of the free parameters with the same shape as the input
+        """
+
+        single_point = np.ndim(cube) == 1
+
+        cube = self._get_points_matrix(cube)
+
+        values = np.empty_like(cube)
+
+        for columns, priors in self._get_prior_groups():
+
+            this_cube = cube[:, columns]
+
+            these_values = None
+
+            if hasattr(priors[0], 'evaluate_from_unit_cube'):
+
+                try:
+
+                    these_values = np.asarray(priors[0].evaluate_from_unit_cube(this_cube,
+                                                                                **self._get_prior_parameters(priors)),
+                                              dtype=float)
+
+                except (ValueError, IndexError, TypeError):
+
+                    these_values = None
+
+            if these_values is None or these_values.shape != this_cube.shape:
+
+                # Transform parameter by parameter
+
+                these_values = np.empty_like(this_cube)
+
+                for j, prior in enumerate(priors):
+
+                    these_values[:, j] = _from_unit_cube(prior, this_cube[:, j])
+
+            values[:, columns] = these_values
+
+        return values[0] if single_point else values
+
+    def log_prior(self, theta):
+        """
+        Returns the logarithm of the prior probability density of points in the space of the free parameters, i.e.,
+        the sum of the logarithms of the priors of all the free parameters (-inf if any of them is zero). All the free
+        parameters must have a prior. The priors of the same type are evaluated with one call. The values of the
+        parameters are not changed.
+
+        :param theta: matrix of values with shape (n_points, n_free), with one column for each free parameter in the
+        same order as free_parameters (or a 1d array for one point)
+        :return: array with shape (n_points,) (or a number for one point)
+        """
+
+        single_point = np.ndim(theta) == 1
+
+        theta = self._get_points_matrix(theta)
+
+        log_prior = np.zeros(theta.shape[0])
+
+        for columns, priors in self._get_prior_groups():
+
+            this_theta = theta[:, columns]
+
+            density = None
+
+            if not isinstance(priors[0], CompositeFunction):
+
+                try:
+
+                    density = np.asarray(priors[0].evaluate(this_theta, **self._get_prior_parameters(priors)),
+                                         dtype=float)
+
+                except (ValueError, IndexError, TypeError):
+
+                    density = None
+
+            if density is None or density.shape != this_theta.shape:
+
+                # Evaluate parameter by parameter
+
+                density = np.empty_like(this_theta)
+
+                for j, prior in enumerate(priors):
+
+                    density[:, j] = prior(this_theta[:, j])
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+
+                log_prior += np.sum(np.log(density), axis=1)
+
+        log_prior[np.isnan(log_prior)] = -np.inf
+
+        return log_prior[0] if single_point else log_prior
+
+    def sample_initial_points(self, n_points, variance=0.1, seed=None):
+        """
+        Draw random points close to the current values of the free parameters, for example to initialize the walkers
+        of an ensemble sampler. Each parameter is drawn from a normal distribution centered on its current value with
+        a standard deviation of abs(variance * value), truncated at the boundaries of the parameter (as in
+        Parameter.get_randomized_value), but all the values are drawn with one call. The values of the parameters are
+        not changed.
+
+        :param n_points: number of points
+        :param variance: relative width of the distributions (default: 0.1)
+        :param seed: seed for the random number generator, or an instance of numpy.random.RandomState. Use the same
+        seed to get the same points (default: None, i.e., different points at each call)
+        :return: matrix with shape (n_points, n_free), with one column for each free parameter in the same order as
+        free_parameters
+        """
+
+        if isinstance(seed, np.random.RandomState):
+
+            random_state = seed
+
+        else:
+
+            random_state = np.random.RandomState(seed)
+
+        free_parameters = self.free_parameters.values()
+
+        values = np.array([parameter.value for parameter in free_parameters], dtype=float)
+
+        min_values = np.array([-np.inf if parameter.min_value is None else parameter.min_value
+                               for parameter in free_parameters], dtype=float)
+
+        max_values = np.array([np.inf if parameter.max_value is None else parameter.max_value
+                               for parameter in free_parameters], dtype=float)
+
+        std = np.abs(variance * values)
+
+        # Parameters with a value of zero (or a variance of zero) cannot be randomized
+
+        degenerate = (std == 0)
+
+        std[degenerate] = 1.0
+
+        # Boundaries in units of standard deviations (a truncated normal with infinite boundaries is a normal)
+
+        a = (min_values - values) / std
+        b = (max_values - values) / std
+
+        samples = scipy.stats.truncnorm.rvs(a, b, loc=values, scale=std, size=(n_points, len(free_parameters)),
+                                            random_state=random_state)
+
+        samples = np.array(samples, dtype=float, ndmin=2).reshape(n_points, len(free_parameters))
+
+        samples[:, degenerate] = values[degenerate]
+
+        # Protect against round-off errors at the boundaries
+
+        return np.clip(samples, min_values, max_values)
+
     def __getitem__(self, path):
         """
         Get a parameter from a path like "source_1.component.powerlaw.logK". This might be useful in certain
@@ -261,6 +881,16 @@ class Model(Node):
         """
         return self._particle_sources
 
+    @property
+    def point_source_catalogs(self):
+        """
+        Returns the dictionary of all defined catalogs of point sources
+
+        :return: collections.OrderedDict()
+
+        """
+        return self._point_source_catalogs
+
     @property
     def sources(self):
         """
@@ -272,7 +902,7 @@ class Model(Node):
 
         sources = collections.OrderedDict()
 
-        for d in (self.point_sources, self.extended_sources, self.particle_sources):
+        for d in (self.point_sources, self.extended_sources, self.particle_sources, self.point_source_catalogs):
 
             sources.update(d)
 
@@ -435,6 +1065,15 @@ class Model(Node):
 
             representation += "(none)"
 
+        # Print the name of the catalogs of point sources, if there are any
+
+        if self._point_source_catalogs:
+
+            representation += "%s%sPoint source catalogs: " % (div, div)
+
+            representation += ",".join("%s (%i sources)" % (name, catalog.n_sources)
+                                       for name, catalog in self._point_source_catalogs.iteritems())
+
         representation += "%s%sFree parameters:%s" % (div, div, div)
 
         parameters_dict = collections.OrderedDict()
@@ -574,11 +1213,33 @@ class Model(Node):
 
     def get_number_of_point_sources(self):
         """
-        Return the number of point sources
+        Return the number of point sources (including the sources in the catalogs of point sources)
 
         :return: number of point sources
         """
-        return len(self._point_sources)
+        return len(self._point_sources) + sum(catalog.n_sources for catalog in self._point_source_catalogs_list)
+
+    def _get_point_source_catalog_row(self, id):
+
+        # Returns the catalog and the row for the id-th point source, or (None, id) if the id corresponds to a point
+        # source not in a catalog. The sources in the catalogs come after the other point sources, in the order
+        # in which the catalogs were added to the model
+
+        row = id - len(self._point_sources_list)
+
+        if row < 0:
+
+            return None, id
+
+        for catalog in self._point_source_catalogs_list:
+
+            if row < catalog.n_sources:
+
+                return catalog, row
+
+            row -= catalog.n_sources
+
+        raise IndexError("Point source id %s out of range" % id)
 
     def get_point_source_position(self, id):
         """
@@ -588,23 +1249,177 @@ class Model(Node):
         :return: a tuple with R.A. and Dec.
         """
 
+        catalog, row = self._get_point_source_catalog_row(id)
+
+        if catalog is not None:
+
+            return catalog.ra[row], catalog.dec[row]
+
         pts = self._point_sources_list[id]
 
         return pts.position.get_ra(), pts.position.get_dec()
 
     def get_point_source_fluxes(self, id, energies):
         """
-        Get the fluxes from the id-th point source
+        Get the fluxes from the id-th point source. For sources in a catalog the fluxes of all the sources in the
+        catalog are computed at once and kept, so that looping over all the sources costs only one evaluation per
+        catalog
 
         :param id: id of the source
         :param energies: energies at which you need the flux
         :return: fluxes
         """
 
+        self._update_linked_parameters()
+
+        catalog, row = self._get_point_source_catalog_row(id)
+
+        if catalog is not None:
+
+            return catalog.get_source_fluxes(row, energies)
+
         return self._point_sources_list[id](energies)
 
+    def evaluate_over(self, variable, values, energies, source_name=None):
+        """
+        Compute the differential flux of the point sources for many values of an independent variable (for example
+        the time, to get a light curve), with one vectorized evaluation instead of a loop over the values. The values
+        of the variable are propagated through the laws of the linked parameters (also chained links and composite
+        functions), as if the variable had been set to each value in turn, but the state of the model (including the
+        value of the variable) is not changed.
+
+        The spectral functions (and the laws) are evaluated with arrays of parameters: functions which do not support
+        that are evaluated once for each value of the variable.
+
+        :param variable: the independent variable (an instance of IndependentVariable, or its path in the model)
+        :param values: array of values of the variable (in the units of the variable)
+        :param energies: array of energies (without units, in the current energy unit, or a Quantity)
+        :param source_name: if provided, compute the flux of this point source only (default: the sum of all the point
+        sources)
+        :return: array with shape (n_values, n_energies)
+        """
+
+        if isinstance(variable, basestring):
+
+            if variable not in self:
+
+                raise InvalidInput("%s is not a path in the model" % variable)
+
+            variable = self[variable]
+
+        values = np.array(values, dtype=float, ndmin=1)
+
+        if values.ndim != 1:
+
+            raise InvalidInput("The values of the variable must be a 1d array")
+
+        # The values of the parameters which depend on the variable are arrays with shape (n_values, 1), so that they
+        # broadcast against the energies (with shape (1, n_energies)). The others are numbers
+
+        get_value = get_value_resolver({id(variable): values[:, np.newaxis]})
+
+        return self._get_fluxes_with_values(energies, get_value, source_name, values.shape[0])
+
+    def evaluate_at(self, theta, energies, source_name=None):
+        """
+        Compute the differential flux of the point sources for the provided values of the free parameters, without
+        using nor changing the values stored in the parameters: the values of the linked parameters are computed from
+        theta through their laws. As the state of the model is never changed, many threads can evaluate the same model
+        at different points at the same time (without the need of cloning it). Functions which keep an internal state
+        (like the XSpec models) are not safe to use in this way.
+
+        :param theta: values of the free parameters, in the same order as free_parameters, or a matrix with shape
+        (n_points, n_free) to evaluate many points with one vectorized evaluation
+        :param energies: array of energies (without units, in the current energy unit, or a Quantity)
+        :param source_name: if provided, compute the flux of this point source only (default: the sum of all the point
+        sources)
+        :return: array with shape (n_energies,) (or (n_points, n_energies) for a matrix of values)
+        """
+
+        # Do not use free_parameters, which updates the dictionary of the parameters stored in the model
+
+        free_parameters = [parameter for parameter in self._find_instances(Parameter).values() if parameter.free]
+
+        theta = np.array(theta, dtype=float)
+
+        single_point = theta.ndim == 1
+
+        if theta.ndim not in (1, 2) or theta.shape[-1] != len(free_parameters):
+
+            raise InvalidInput("The values must be an array with %s elements, or a matrix with shape (n_points, %s)"
+                               % (len(free_parameters), len(free_parameters)))
+
+        if single_point:
+
+            values = dict((id(parameter), value) for parameter, value in zip(free_parameters, theta))
+
+        else:
+
+            values = dict((id(parameter), theta[:, j, np.newaxis]) for j, parameter in enumerate(free_parameters))
+
+        fluxes = self._get_fluxes_with_values(energies, get_value_resolver(values), source_name,
+                                              1 if single_point else theta.shape[0])
+
+        return fluxes[0] if single_point else fluxes
+
+    def _get_fluxes_with_values(self, energies, get_value, source_name, n_rows):
+
+        # Sum of the differential fluxes of the point sources (or of the requested one) with the values of the
+        # parameters given by get_value (see get_value_resolver), as an array with shape (n_rows, n_energies)
+
+        if isinstance(energies, u.Quantity):
+
+            energies = energies.to(get_units().energy).value
+
+        energies = np.array(energies, dtype=float, ndmin=1)
+
+        x = energies[np.newaxis, :]
+
+        if source_name is None:
+
+            sources = list(self._point_sources_list)
+
+        elif source_name in self._point_sources:
+
+            sources = [self._point_sources[source_name]]
+
+        else:
+
+            raise InvalidInput("%s is not a point source in the model" % source_name)
+
+        fluxes = np.zeros((n_rows, energies.shape[0]))
+
+        if source_name is None:
+
+            for catalog in self._point_source_catalogs_list:
+
+                # The sources with a view are evaluated as the other point sources, as their parameters might be
+                # free or linked. The columns of the catalog are used (but not changed) for the others
+
+                without_view = np.ones(catalog.n_sources, dtype=bool)
+
+                without_view[[catalog.get_index(name) for name in catalog.views.keys()]] = False
+
+                fluxes += catalog._evaluate_all(energies)[without_view].sum(axis=0)
+
+                sources.extend(catalog.views.values())
+
+        for source in sources:
+
+            for component in source.components.values():
+
+                fluxes += component.shape._evaluate_with_values(x, get_value)
+
+        return fluxes
+
     def get_point_source_name(self, id):
 
+        catalog, row = self._get_point_source_catalog_row(id)
+
+        if catalog is not None:
+
+            return catalog.names[row]
+
         return self._point_sources_list[id].name
 
     def get_number_of_extended_sources(self):
@@ -615,7 +1430,7 @@ class Model(Node):
         """
         return len(self._extended_sources)
 
-    def get_extended_source_fluxes(self, id, j2000_ra, j2000_dec, energies):
+    def get_extended_source_fluxes(self, id, j2000_ra, j2000_dec, energies, only_inside_footprint=False):
         """
         Get the flux of the id-th extended sources at the given position at the given energies
 
@@ -623,10 +1438,35 @@ class Model(Node):
         :param j2000_ra: R.A. where the flux is desired
         :param j2000_dec: Dec. where the flux is desired
         :param energies: energies at which the flux is desired
+        :param only_inside_footprint: if True, the source is evaluated only at the positions inside its boundaries
+        (see get_extended_source_boundaries), while the flux elsewhere is set to the minimum flux returned by the
+        extended sources (1e-60)
         :return: flux array
         """
 
-        return self._extended_sources_list[id](j2000_ra, j2000_dec, energies)
+        self._update_linked_parameters()
+
+        source = self._extended_sources_list[id]
+
+        if not only_inside_footprint:
+
+            return source(j2000_ra, j2000_dec, energies)
+
+        inside = self._get_extended_sources_hits(j2000_ra, j2000_dec)[id]
+
+        j2000_ra = np.asarray(j2000_ra)
+        j2000_dec = np.asarray(j2000_dec)
+        energies = np.atleast_1d(energies)
+
+        fluxes = np.empty((j2000_ra.shape[0], energies.shape[0]))
+
+        fluxes.fill(1e-60)
+
+        if inside.shape[0] > 0:
+
+            fluxes[inside, :] = source(j2000_ra[inside], j2000_dec[inside], energies)
+
+        return fluxes
 
     def get_extended_source_name(self, id):
         """
@@ -644,9 +1484,76 @@ class Model(Node):
 
         return ra_min, ra_max, dec_min, dec_max
 
+    def _get_extended_sources_index(self):
+
+        # Returns the spatial index of the boundaries of the extended sources, which is built again only if the
+        # boundaries have changed (for example because the position of a source changed). The boundaries are always
+        # computed again, since they can change without any change of the values of the parameters (for example with
+        # a new maximum for the size of a source, or a new template), and this is cheap compared to a query
+
+        boundaries = tuple(source.get_boundaries() for source in self._extended_sources_list)
+
+        if self._extended_sources_index is None or boundaries != self._extended_sources_boundaries:
+
+            self._extended_sources_index = SpatialIndex(boundaries)
+            self._extended_sources_boundaries = boundaries
+
+        return self._extended_sources_index
+
+    def _get_extended_sources_hits(self, j2000_ra, j2000_dec):
+
+        # Returns the indexes of the positions inside the boundaries of each extended source. The result is kept
+        # until the grid or the index change, so that looping over the sources on the same grid costs one query
+
+        index = self._get_extended_sources_index()
+
+        fingerprint = get_grid_fingerprint(j2000_ra, j2000_dec)
+
+        if self._extended_sources_hits is None or self._extended_sources_hits[0] != fingerprint or \
+                self._extended_sources_hits[1] is not index:
+
+            hits = index.query(j2000_ra, j2000_dec)
+
+            # The arrays are shared among the callers, so they must not be modified
+
+            for indexes in hits:
+
+                indexes.flags.writeable = False
+
+            self._extended_sources_hits = (fingerprint, index, hits)
+
+        return self._extended_sources_hits[2]
+
+    def get_extended_sources_at(self, j2000_ra, j2000_dec):
+        """
+        Find which extended sources cover the given positions, according to their boundaries
+
+        :param j2000_ra: R.A. (array or float)
+        :param j2000_dec: Dec. (array or float)
+        :return: a list with one array for each extended source (in the same order as the ids), containing the indexes
+        of the positions inside the boundaries of the source
+        """
+
+        return list(self._get_extended_sources_hits(j2000_ra, j2000_dec))
+
     def is_inside_any_extended_source(self, j2000_ra, j2000_dec):
+        """
+        Returns whether the given positions are inside the boundaries of at least one extended source
+
+        :param j2000_ra: R.A. (array or float)
+        :param j2000_dec: Dec. (array or float)
+        :return: a boolean, or an array of booleans if the input are arrays
+        """
+
+        inside = self._get_extended_sources_index().is_inside_any(j2000_ra, j2000_dec)
+
+        if np.ndim(j2000_ra) == 0:
+
+            return bool(inside[0])
+
+        else:
 
-        return True
+            return inside.reshape(np.shape(j2000_ra))
 
     def get_number_of_particle_sources(self):
         """
@@ -666,8 +1573,21 @@ class Model(Node):
         :return: fluxes
         """
 
+        self._update_linked_parameters()
+
         return self._particle_sources_list[id]._get_flux(energies)
 
     def get_particle_source_name(self, id):
 
-        return self._particle_sources_list[id].name
\ No newline at end of file
+        return self._particle_sources_list[id].name
+
+    def profile_report(self):
+        """
+        Returns the report of the calls of the functions and sources of this model (including the laws of linked
+        parameters), with their paths in the model. The calls are recorded only while the instrumentation is enabled
+        (see astromodels.profiling.enable).
+
+        :return: an instance of astromodels.profiling.ProfileReport (which can be exported to JSON or CSV)
+        """
+
+        return get_report(self)
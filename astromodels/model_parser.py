@@ -7,10 +7,11 @@ from astromodels import polarization
 from astromodels.sources import point_source
 from astromodels.sources import particle_source
 from astromodels.sources import extended_source
+from astromodels.sources import point_source_catalog
 from astromodels import parameter
 from astromodels import model
 from astromodels.my_yaml import my_yaml
-from astromodels.sources.source import POINT_SOURCE, EXTENDED_SOURCE, PARTICLE_SOURCE
+from astromodels.sources.source import POINT_SOURCE, EXTENDED_SOURCE, PARTICLE_SOURCE, POINT_SOURCE_CATALOG
 import re
 
 class ModelIOError(IOError):
@@ -131,7 +132,8 @@ class ModelParser(object):
 
                 assert isinstance(res, point_source.PointSource) or \
                        isinstance(res, extended_source.ExtendedSource) or \
-                       isinstance(res, particle_source.ParticleSource)
+                       isinstance(res, particle_source.ParticleSource) or \
+                       isinstance(res, point_source_catalog.PointSourceCatalog)
 
                 self._sources.append(res)
 
@@ -234,14 +236,16 @@ class SourceParser(object):
 
             # Point source or extended source?
 
-            source_type = re.findall('\((%s|%s|%s)\)' % (POINT_SOURCE, EXTENDED_SOURCE, PARTICLE_SOURCE),
+            source_type = re.findall('\((%s|%s|%s|%s)\)' % (POINT_SOURCE, EXTENDED_SOURCE, PARTICLE_SOURCE,
+                                                             POINT_SOURCE_CATALOG),
                                      source_name)[-1]
 
         except IndexError:
 
             raise ModelSyntaxError("Don't recognize type for source '%s'. "
-                                   "Valid types are '%s', '%s' or '%s'." %
-                                   (source_name, POINT_SOURCE, EXTENDED_SOURCE, PARTICLE_SOURCE))
+                                   "Valid types are '%s', '%s', '%s' or '%s'." %
+                                   (source_name, POINT_SOURCE, EXTENDED_SOURCE, PARTICLE_SOURCE,
+                                    POINT_SOURCE_CATALOG))
 
         else:
 
@@ -270,6 +274,10 @@ class SourceParser(object):
 
             self._parsed_source = self._parse_particle_source(source_definition)
 
+        elif source_type == POINT_SOURCE_CATALOG:
+
+            self._parsed_source = self._parse_point_source_catalog(source_definition)
+
     @property
     def extra_setups(self):
 
@@ -344,6 +352,72 @@ class SourceParser(object):
 
         return this_point_source
 
+    def _parse_point_source_catalog(self, catalog_definition):
+
+        # Get the columns
+
+        for key in ('spectral_shape', 'names', 'ra', 'dec', 'parameters'):
+
+            if key not in catalog_definition:
+
+                raise ModelSyntaxError("Point source catalog %s is missing the '%s' attribute"
+                                       % (self._source_name, key))
+
+        try:
+
+            spectral_shape = function.get_function(catalog_definition['spectral_shape'])
+
+        except function.UnknownFunction:
+
+            raise ModelSyntaxError("Function %s, specified as spectral shape for the point source catalog %s, is not "
+                                   "a known function" % (catalog_definition['spectral_shape'], self._source_name))
+
+        parameter_values = {}
+
+        for parameter_name, parameter_definition in catalog_definition['parameters'].iteritems():
+
+            # Set the bounds before the values, as in the ShapeParser
+
+            this_parameter = spectral_shape.parameters[parameter_name]
+
+            if 'min_value' in parameter_definition:
+                this_parameter.min_value = parameter_definition['min_value']
+
+            if 'max_value' in parameter_definition:
+                this_parameter.max_value = parameter_definition['max_value']
+
+            if 'unit' in parameter_definition:
+                this_parameter.unit = ShapeParser._fix(parameter_definition['unit'])
+
+            parameter_values[parameter_name] = parameter_definition['value']
+
+        this_catalog = point_source_catalog.PointSourceCatalog(self._source_name, catalog_definition['names'],
+                                                               catalog_definition['ra'], catalog_definition['dec'],
+                                                               spectral_shape, **parameter_values)
+
+        # Now the views of single sources (if any). They are parsed as point sources, then the paths of their links
+        # and extra setups are prefixed with the name of the catalog
+
+        for view_name, view_definition in catalog_definition.get('views', {}).iteritems():
+
+            view_parser = SourceParser("%s (%s)" % (view_name, POINT_SOURCE), view_definition)
+
+            this_catalog._attach_view(view_parser.get_source())
+
+            for link in view_parser.links:
+
+                link['parameter_path'] = "%s.%s" % (self._source_name, link['parameter_path'])
+
+                self._links.append(link)
+
+            for extra_setup in view_parser.extra_setups:
+
+                extra_setup['function_path'] = "%s.%s" % (self._source_name, extra_setup['function_path'])
+
+                self._extra_setups.append(extra_setup)
+
+        return this_catalog
+
     def _parse_sky_direction(self, sky_direction_definition):
 
         # Instance the SkyDirection class using the coordinates provided
@@ -15,6 +15,7 @@ import scipy.stats
 import numpy as np
 
 from astromodels.tree import Node
+from astromodels.dual_access_class import _get_slot_names
 
 
 def _behaves_like_a_number(obj):
@@ -66,6 +67,191 @@ class CannotConvertValueToNewUnits(Warning):
     pass
 
 
+class CircularLink(exceptions.Exception):
+    pass
+
+
+# The following counters keep track of changes in the state of the parameters. The first one is incremented every
+# time the value of any parameter (or independent variable) changes, the second one every time a link (i.e., an
+# auxiliary variable) is created or removed. Linked parameters use the former to know whether the value computed
+# through their law is still valid, while the Model uses the latter to know when the graph of links must be rebuilt.
+
+_value_generation = 0
+_links_generation = 0
+
+
+def _value_changed():
+
+    global _value_generation
+
+    _value_generation += 1
+
+
+def _links_changed():
+
+    global _links_generation
+
+    _links_generation += 1
+
+    # A new (or removed) link also changes the value of the parameters involved
+
+    _value_changed()
+
+
+# Functions called (with the parameter as argument) every time the value of a parameter changes. This is empty
+# unless somebody is listening (like a Model with subscribers, see Model.subscribe), so that in the common case the
+# setter of the value only pays for one check
+
+_value_change_listeners = []
+
+
+def add_value_change_listener(listener):
+    """
+    Add a function which will be called every time the value of any parameter (or independent variable) changes,
+    with the parameter as argument
+
+    :param listener: a callable accepting one argument
+    :return: (none)
+    """
+
+    _value_change_listeners.append(listener)
+
+
+def remove_value_change_listener(listener):
+    """
+    Remove a function added with add_value_change_listener
+
+    :param listener: the callable
+    :return: (none)
+    """
+
+    _value_change_listeners.remove(listener)
+
+
+def _notify_value_change(parameter):
+
+    for listener in list(_value_change_listeners):
+
+        listener(parameter)
+
+
+def get_value_generation():
+    """
+    Returns a number which changes every time the value of any parameter changes
+
+    :return: an integer
+    """
+
+    return _value_generation
+
+
+def get_links_generation():
+    """
+    Returns a number which changes every time a link between parameters is created or removed
+
+    :return: an integer
+    """
+
+    return _links_generation
+
+
+def get_link_dependencies(parameter):
+    """
+    Returns the parameters which the value of the provided parameter directly depends on, i.e., the auxiliary
+    variable and the parameters of the law. The list is empty if the parameter is not linked.
+
+    :param parameter: a Parameter or IndependentVariable instance
+    :return: a list of parameters
+    """
+
+    if not parameter.has_auxiliary_variable():
+
+        return []
+
+    variable, law = parameter.auxiliary_variable
+
+    return [variable] + law.parameters.values()
+
+
+def get_value_resolver(values):
+    """
+    Returns a function which gives the value of a parameter for a set of values provided explicitly, without reading
+    or writing the values stored in the linked parameters: the laws are evaluated on the spot (see
+    Function.evaluate_with). This never changes the state of any parameter, so it can be used by many threads at the
+    same time.
+
+    :param values: dictionary {id(parameter): value} of the provided values (numbers, or arrays with shape (n, 1) to
+    resolve n sets of values at once)
+    :return: a function accepting a parameter and returning its value: the provided value, the value computed
+    through its law for a linked parameter, or the current value otherwise
+    """
+
+    resolved_values = dict(values)
+
+    def get_value(parameter):
+
+        try:
+
+            return resolved_values[id(parameter)]
+
+        except KeyError:
+
+            pass
+
+        if parameter.has_auxiliary_variable():
+
+            auxiliary_variable, law = parameter.auxiliary_variable
+
+            value = law._evaluate_with_values(np.array(get_value(auxiliary_variable), dtype=float, ndmin=2),
+                                              get_value)
+
+            if value.size == 1:
+
+                value = float(value.flat[0])
+
+        else:
+
+            value = parameter._value
+
+        resolved_values[id(parameter)] = value
+
+        return value
+
+    return get_value
+
+
+def _depends_on(parameters, target):
+    """
+    Returns True if any of the provided parameters is, or depends (directly or through a chain of links) on, target
+
+    :param parameters: list of parameters to start the search from
+    :param target: the parameter to look for
+    :return: True or False
+    """
+
+    visited = set()
+
+    to_visit = list(parameters)
+
+    while to_visit:
+
+        this_parameter = to_visit.pop()
+
+        if this_parameter is target:
+
+            return True
+
+        if id(this_parameter) in visited:
+
+            continue
+
+        visited.add(id(this_parameter))
+
+        to_visit.extend(get_link_dependencies(this_parameter))
+
+    return False
+
+
 def accept_quantity(input_type=float, allow_none=False):
     """
         A class-method decorator which allow a given method (typically the set_value method) to receive both a
@@ -123,8 +309,36 @@ def accept_quantity(input_type=float, allow_none=False):
     return accept_quantity_wrapper
 
 
+class _ParameterDocumentation(object):
+    """
+    Descriptor used as __doc__ for the parameters, so that the documentation of an instance is its description (which
+    cannot be stored in the __doc__ of the instance, as parameters have no __dict__) while the documentation of the
+    class stays the docstring of the class
+    """
+
+    def __init__(self, class_documentation):
+
+        self._class_documentation = class_documentation
+
+    def __get__(self, instance, owner):
+
+        if instance is None or instance._desc is None:
+
+            return self._class_documentation
+
+        else:
+
+            return instance._desc
+
+
 class ParameterBase(Node):
 
+    # Parameters are by far the most numerous objects in a model, so they use __slots__ to keep their footprint small
+
+    __slots__ = ('_callbacks', '_unit', '_value', '_min_value', '_max_value', '_desc')
+
+    __doc__ = _ParameterDocumentation(None)
+
     def __init__(self, name, value, min_value=None, max_value=None, desc=None, unit=u.dimensionless_unscaled):
 
         # Make this a node
@@ -133,8 +347,9 @@ class ParameterBase(Node):
 
         # Callbacks are executed any time the value for the parameter changes (i.e., its value changes)
 
-        # We start from a empty list of callbacks.
-        self._callbacks = []
+        # We start from a empty list of callbacks. This is an (immutable) empty tuple, so that it can be shared
+        # among all the parameters, and it becomes a list when the first callback is added.
+        self._callbacks = ()
 
         # Assign to members
 
@@ -174,14 +389,10 @@ class ParameterBase(Node):
         self._max_value = None  # this will be overwritten immediately in the next line
         self.max_value = max_value
 
-        # Store description
+        # Store description (this is also used as documentation, see _ParameterDocumentation)
 
         self._desc = desc
 
-        # Make the description the documentation as well
-
-        self.__doc__ = desc
-
         # Now perform a very lazy check that we can perform math operations on value, minimum and maximum
         # (i.e., they are numbers)
 
@@ -227,6 +438,8 @@ class ParameterBase(Node):
 
         # (self._unit is the OLD unit here)
 
+        old_value = self._value
+
         if self._unit != u.dimensionless_unscaled:
 
             # This will fail if the new unit is not compatible with the old one
@@ -259,6 +472,14 @@ class ParameterBase(Node):
 
         self._unit = new_unit
 
+        _value_changed()
+
+        # The value is now expressed in the new unit
+
+        if _value_change_listeners and self._value != old_value:
+
+            _notify_value_change(self)
+
     def _get_unit(self):
 
         return self._unit
@@ -328,8 +549,18 @@ class ParameterBase(Node):
             # Save the value as a pure floating point to avoid the overhead of the astropy.units machinery when
             # not needed
 
+            old_value = self._value
+
             self._value = value
 
+            # Signal that the state has changed, so that the values of the linked parameters will be recomputed
+
+            _value_changed()
+
+            if _value_change_listeners and value != old_value:
+
+                _notify_value_change(self)
+
     @property
     def as_quantity(self):
         """
@@ -388,6 +619,12 @@ class ParameterBase(Node):
 
             self._value = self._min_value
 
+            _value_changed()
+
+            if _value_change_listeners:
+
+                _notify_value_change(self)
+
     min_value = property(_get_min_value, _set_min_value,
                          doc='Gets or sets the minimum allowed value for the parameter')
 
@@ -419,6 +656,12 @@ class ParameterBase(Node):
                           exceptions.RuntimeWarning)
             self._value = self._max_value
 
+            _value_changed()
+
+            if _value_change_listeners:
+
+                _notify_value_change(self)
+
     max_value = property(_get_max_value, _set_max_value,
                          doc='Gets or sets the maximum allowed value for the parameter')
 
@@ -461,20 +704,50 @@ class ParameterBase(Node):
         ignored. More than one callback can be specified. In that case, the callbacks will be called in the same order
         they have been entered."""
 
+        if not self._callbacks:
+
+            self._callbacks = []
+
         self._callbacks.append(callback)
 
     def empty_callbacks(self):
         """Remove all callbacks for this parameter"""
-        self._callbacks = []
+        self._callbacks = ()
 
     def duplicate(self):
         """
-        Returns an exact copy of the current parameter
+        Returns an exact copy of the current parameter. The copy is independent of the current parameter.
+
+        :return: the new parameter
         """
 
-        # Deep copy everything to make sure that there are no ties between the new instance and the old one
+        if self._children or self._callbacks or self.has_auxiliary_variable():
+
+            # Deep copy everything to make sure that there are no ties between the new instance and the old one
+
+            new_parameter = copy.deepcopy(self)
+
+        else:
+
+            # All the attributes are immutable (numbers, strings, units...), so we can just copy the references in
+            # a new instance, which is much faster than a deepcopy (this matters when creating many functions,
+            # see FunctionMeta.class_init). The new parameter is not attached to any tree.
+
+            new_parameter = object.__new__(type(self))
+
+            for name in _get_slot_names(type(self)):
+
+                try:
 
-        new_parameter = copy.deepcopy(self)
+                    object.__setattr__(new_parameter, name, object.__getattribute__(self, name))
+
+                except AttributeError:
+
+                    # Slot not set
+
+                    continue
+
+            new_parameter._set_parent(None)
 
         return new_parameter
 
@@ -538,15 +811,25 @@ class Parameter(ParameterBase):
     :param prior: the parameter's prior (default: None)
     """
 
+    __slots__ = ('_aux_variable', '_aux_variable_generation', '_free', '_delta', '_prior', '_old_free')
+
+    __doc__ = _ParameterDocumentation(__doc__)
+
     def __init__(self, name, value, min_value=None, max_value=None, delta=None, desc=None, free=True, unit='',
                  prior=None):
 
         # NOTE: we need to set up _aux_variable immediately because we are overriding the value getter which
         # needs this
 
-        # by default we have no auxiliary variable
+        # by default we have no auxiliary variable (this becomes a dictionary with the law and the variable in
+        # add_auxiliary_variable)
+
+        self._aux_variable = None
+
+        # This keeps track of the state for which the value has been computed through the law (if any), see the
+        # value getter
 
-        self._aux_variable = {}
+        self._aux_variable_generation = None
 
         # This extends ParameterBase by adding the possibility for free/fix, and a delta for fitting purposes, as
         # well as a prior
@@ -606,7 +889,17 @@ class Parameter(ParameterBase):
 
         if self._aux_variable:
 
-            self._value = self._aux_variable['law'](self._aux_variable['variable'].value)
+            # The law is evaluated only if something has changed since the last time it was evaluated, otherwise
+            # the cached value is still valid
+
+            if self._aux_variable_generation != _value_generation:
+
+                # (the law returns a 0-d array, which would break a law depending on this parameter, so we cast
+                # the result to a float)
+
+                self._value = float(self._aux_variable['law'](self._aux_variable['variable'].value))
+
+                self._aux_variable_generation = _value_generation
 
         return self._value
 
@@ -626,6 +919,24 @@ class Parameter(ParameterBase):
 
     # Define the property "prior"
 
+    def duplicate(self):
+        """
+        Returns an exact copy of the current parameter (including the prior, if any). The copy is independent of the
+        current parameter.
+
+        :return: the new parameter
+        """
+
+        new_parameter = super(Parameter, self).duplicate()
+
+        # The prior is the only attribute which is not immutable
+
+        if self._prior is not None and new_parameter._prior is self._prior:
+
+            new_parameter._prior = self._prior.duplicate()
+
+        return new_parameter
+
     def _get_prior(self):
 
         return self._prior
@@ -723,6 +1034,14 @@ class Parameter(ParameterBase):
 
     def add_auxiliary_variable(self, variable, law):
 
+        # Make sure that the new link does not create a cycle, i.e., that neither the variable nor the parameters
+        # of the law depend (directly or through other links) on this parameter
+
+        if _depends_on([variable] + law.parameters.values(), self):
+
+            raise CircularLink("Cannot link parameter %s to %s, as this would create a circular "
+                               "dependency" % (self.name, variable.name))
+
         # Assign units to the law
         law.set_units(variable.unit, self.unit)
 
@@ -740,8 +1059,11 @@ class Parameter(ParameterBase):
 
             raise NotCallableOrErrorInCall("The provided law for the auxiliary variable failed on call")
 
-        self._aux_variable['law'] = law
-        self._aux_variable['variable'] = variable
+        self._aux_variable = {'law': law, 'variable': variable}
+
+        # Signal the change in the links, so the value will be computed with the new law
+
+        _links_changed()
 
         # Now add the law as an attribute (through the mother class DualAccessClass),
         # so the user will be able to access its parameters as this.name.parameter_name
@@ -785,7 +1107,9 @@ class Parameter(ParameterBase):
 
             # Clean up the dictionary
 
-            self._aux_variable = {}
+            self._aux_variable = None
+
+            _links_changed()
 
             # Set the parameter to the status it has before the auxiliary variable was created
 
@@ -928,6 +1252,10 @@ class IndependentVariable(ParameterBase):
     An independent variable like time or energy.
     """
 
+    __slots__ = ()
+
+    __doc__ = _ParameterDocumentation(__doc__)
+
     # Override the constructor to make the unit specification mandatory
 
     def __init__(self, name, value, unit, min_value=None, max_value=None, desc=None):
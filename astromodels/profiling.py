@@ -0,0 +1,399 @@
+__author__ = 'giacomov'
+
+import collections
+import csv
+import functools
+import json
+import timeit
+
+import numpy as np
+
+from astromodels.functions.function import Function, Function1D, Function2D, CompositeFunction
+from astromodels.sources.source import Source
+from astromodels.sources.point_source import PointSource
+from astromodels.sources.extended_source import ExtendedSource
+from astromodels.sources.point_source_catalog import PointSourceCatalog
+
+# Opt-in instrumentation of the evaluation of functions and sources:
+#
+#   >>> import astromodels.profiling
+#   >>> astromodels.profiling.enable()
+#   >>> ... (fit) ...
+#   >>> print(model.profile_report())
+#   >>> astromodels.profiling.disable()
+#
+# enable() replaces the __call__ methods of the functions and of the sources with timed versions, and disable() puts
+# back the original ones, so the instrumentation costs nothing when it is disabled.
+
+_timer = timeit.default_timer
+
+# Source classes whose evaluation is timed (the functions are found by going through the subclasses of Function)
+
+_source_classes = (PointSource, ExtendedSource, PointSourceCatalog)
+
+# Classes whose _call_without_units is memoized, so that the cache hits can be counted
+
+_memoized_classes = (Function1D, Function2D)
+
+# Original methods replaced by enable(), as a list of (class, name of the method, original function)
+
+_patched = []
+
+# Records of the instances which have been called since the last reset, as {id: record}. The record keeps a
+# reference to the instance, so that the id cannot be reused by another object
+
+_records = {}
+
+# Stack of the timed calls in progress, as [instance, time spent in nested timed calls], used to compute the time
+# spent in each instance excluding the instances it calls (for example a composite function calling its components,
+# or a source calling its spectral shape)
+
+_stack = []
+
+
+class _Record(object):
+
+    __slots__ = ('instance', 'calls', 'total_time', 'self_time', 'input_size', 'cache_hits', 'cache_misses')
+
+    def __init__(self, instance):
+
+        self.instance = instance
+
+        self.calls = 0
+        self.total_time = 0.0
+        self.self_time = 0.0
+        self.input_size = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+def _get_record(instance):
+
+    try:
+
+        return _records[id(instance)]
+
+    except KeyError:
+
+        record = _records[id(instance)] = _Record(instance)
+
+        return record
+
+
+def _make_timed_call(original):
+
+    @functools.wraps(original)
+    def timed_call(instance, *args, **kwargs):
+
+        if _stack and _stack[-1][0] is instance:
+
+            # A __call__ calling the __call__ of the parent class: count it only once
+
+            return original(instance, *args, **kwargs)
+
+        frame = [instance, 0.0]
+
+        _stack.append(frame)
+
+        start = _timer()
+
+        try:
+
+            return original(instance, *args, **kwargs)
+
+        finally:
+
+            elapsed = _timer() - start
+
+            _stack.pop()
+
+            if _stack:
+
+                _stack[-1][1] += elapsed
+
+            record = _get_record(instance)
+
+            record.calls += 1
+            record.total_time += elapsed
+            record.self_time += elapsed - frame[1]
+
+            # The input size is the number of elements of the first argument (energies for spectra, positions for
+            # spatial shapes and extended sources)
+
+            if args:
+
+                record.input_size += np.size(args[0])
+
+    return timed_call
+
+
+def _make_counted_call(original):
+
+    # The memoize decorator does not expose hits and misses, but a miss always changes the number of elements in
+    # its cache (it adds one result, or it removes old results when the cache is full), while a hit does not
+
+    cache = original.input_object.cache
+
+    @functools.wraps(original)
+    def counted_call(instance, *args, **kwargs):
+
+        n_cached = len(cache)
+
+        result = original(instance, *args, **kwargs)
+
+        record = _get_record(instance)
+
+        if len(cache) == n_cached:
+
+            record.cache_hits += 1
+
+        else:
+
+            record.cache_misses += 1
+
+        return result
+
+    counted_call.input_object = original.input_object
+
+    return counted_call
+
+
+def _get_all_subclasses(cls):
+
+    subclasses = [cls]
+
+    for subclass in cls.__subclasses__():
+
+        subclasses.extend(_get_all_subclasses(subclass))
+
+    return subclasses
+
+
+def _patch(cls, name, make_wrapper):
+
+    original = cls.__dict__[name]
+
+    _patched.append((cls, name, original))
+
+    setattr(cls, name, make_wrapper(original))
+
+
+def is_enabled():
+    """
+    Returns whether the instrumentation is enabled
+    """
+
+    return len(_patched) > 0
+
+
+def enable():
+    """
+    Enable the instrumentation. From now on, the calls of all functions (including the laws of linked parameters)
+    and of point sources, extended sources and catalogs are recorded: number of calls, wall time, input size and
+    (for the memoized functions) cache hits. Use get_report or Model.profile_report to see the results.
+
+    NOTE: only the function classes which exist when this is called are instrumented.
+
+    :return: (none)
+    """
+
+    if is_enabled():
+
+        return
+
+    classes = set(_get_all_subclasses(Function))
+    classes.update(_source_classes)
+
+    for cls in classes:
+
+        if '__call__' in cls.__dict__:
+
+            _patch(cls, '__call__', _make_timed_call)
+
+    for cls in _memoized_classes:
+
+        _patch(cls, '_call_without_units', _make_counted_call)
+
+
+def disable():
+    """
+    Disable the instrumentation, restoring the original methods. The records are kept (see reset).
+
+    :return: (none)
+    """
+
+    while _patched:
+
+        cls, name, original = _patched.pop()
+
+        setattr(cls, name, original)
+
+    del _stack[:]
+
+
+def reset():
+    """
+    Remove all the records (and the references to the instrumented instances)
+
+    :return: (none)
+    """
+
+    _records.clear()
+
+
+def get_report(root=None):
+    """
+    Returns the report of the calls recorded since the last reset.
+
+    :param root: if provided, only the functions and sources below this node (for example a model) are reported, in
+    the order of the tree, with their paths relative to it. Otherwise all the instrumented instances are reported,
+    with their paths in the tree they belong to.
+    :return: an instance of ProfileReport
+    """
+
+    if root is None:
+
+        instances = [(".".join(record.instance._get_path()) or record.instance.name, record.instance)
+                     for record in _records.values()]
+
+    else:
+
+        instances = []
+
+        for path, instance in root._find_instances((Function, Source)).iteritems():
+
+            instances.append((path, instance))
+
+            if isinstance(instance, CompositeFunction):
+
+                # The functions composing a composite function are not nodes of the tree: use the names they have in
+                # the expression of the composite function (like Powerlaw{1})
+
+                instances.extend(("%s.%s{%i}" % (path, function.name, i + 1), function)
+                                 for i, function in enumerate(instance.functions))
+
+    rows = []
+
+    for path, instance in instances:
+
+        record = _records.get(id(instance))
+
+        if record is None or record.instance is not instance:
+
+            continue
+
+        n_cache_calls = record.cache_hits + record.cache_misses
+
+        row = collections.OrderedDict()
+
+        row['path'] = path
+        row['type'] = type(instance).__name__
+        row['calls'] = record.calls
+        row['total_time'] = record.total_time
+        row['self_time'] = record.self_time
+        row['mean_time'] = record.total_time / record.calls if record.calls > 0 else 0.0
+        row['mean_input_size'] = record.input_size / float(record.calls) if record.calls > 0 else 0.0
+        row['cache_hits'] = record.cache_hits
+        row['cache_misses'] = record.cache_misses
+        row['cache_hit_rate'] = record.cache_hits / float(n_cache_calls) if n_cache_calls > 0 else None
+
+        rows.append(row)
+
+    if root is None:
+
+        rows.sort(key=lambda row: row['total_time'], reverse=True)
+
+    return ProfileReport(rows)
+
+
+class ProfileReport(object):
+    """
+    The report of the calls of functions and sources (see get_report and Model.profile_report). Each row contains:
+    path, type (name of the class), calls, total_time (wall time in seconds, including the time spent in the functions
+    called by this one), self_time (wall time in seconds, excluding it), mean_time, mean_input_size (mean number of
+    elements of the first argument), cache_hits, cache_misses and cache_hit_rate (None if the function is not
+    memoized).
+    """
+
+    columns = ('path', 'type', 'calls', 'total_time', 'self_time', 'mean_time', 'mean_input_size', 'cache_hits',
+               'cache_misses', 'cache_hit_rate')
+
+    def __init__(self, rows):
+
+        self._rows = list(rows)
+
+    @property
+    def rows(self):
+        """
+        List of the rows of the report (as dictionaries)
+        """
+
+        return self._rows
+
+    def __len__(self):
+
+        return len(self._rows)
+
+    def __getitem__(self, path):
+        """
+        Returns the row for the given path
+        """
+
+        for row in self._rows:
+
+            if row['path'] == path:
+
+                return row
+
+        raise KeyError("No record for %s" % path)
+
+    def to_json(self, filename=None):
+        """
+        Returns the report as a JSON string, and optionally write it to a file
+
+        :param filename: if provided, the report is written to this file
+        :return: the JSON string
+        """
+
+        output = json.dumps(self._rows, indent=2, separators=(',', ': '))
+
+        if filename is not None:
+
+            with open(filename, "w+") as f:
+
+                f.write(output)
+
+        return output
+
+    def to_csv(self, filename):
+        """
+        Write the report as a CSV file (one line per row, with a header)
+
+        :param filename: name of the output file
+        :return: (none)
+        """
+
+        with open(filename, "wb") as f:
+
+            writer = csv.DictWriter(f, fieldnames=self.columns)
+
+            writer.writeheader()
+
+            for row in self._rows:
+
+                writer.writerow(row)
+
+    def __repr__(self):
+
+        lines = ["%-50s %-20s %8s %12s %12s %10s %10s" % ('path', 'type', 'calls', 'total (s)', 'self (s)',
+                                                           'input size', 'cache hit')]
+
+        for row in self._rows:
+
+            hit_rate = '-' if row['cache_hit_rate'] is None else '%.0f%%' % (100 * row['cache_hit_rate'])
+
+            lines.append("%-50s %-20s %8i %12.4g %12.4g %10.1f %10s" % (row['path'], row['type'], row['calls'],
+                                                                       row['total_time'], row['self_time'],
+                                                                       row['mean_input_size'], hit_rate))
+
+        return "\n".join(lines)
@@ -6,6 +6,7 @@ import collections
 
 from astromodels.parameter import Parameter
 from astromodels.tree import Node
+from astromodels.utils.coordinate_transforms import rotate_coordinates
 
 
 class WrongCoordinatePair(ValueError):
@@ -129,7 +130,7 @@ class SkyDirection(Node):
 
             # Transform from L,B to R.A., Dec
 
-            return self.sky_coord.transform_to('icrs').ra.value
+            return self._get_converted_position()[0]
 
     def get_dec(self):
         """
@@ -146,7 +147,7 @@ class SkyDirection(Node):
 
             # Transform from L,B to R.A., Dec
 
-            return self.sky_coord.transform_to('icrs').dec.value
+            return self._get_converted_position()[1]
 
     def get_l(self):
         """
@@ -163,7 +164,7 @@ class SkyDirection(Node):
 
             # Transform from L,B to R.A., Dec
 
-            return self.sky_coord.transform_to('galactic').l.value
+            return self._get_converted_position()[0]
 
     def get_b(self):
         """
@@ -180,27 +181,78 @@ class SkyDirection(Node):
 
             # Transform from L,B to R.A., Dec
 
-            return self.sky_coord.transform_to('galactic').b.value
+            return self._get_converted_position()[1]
+
+    def _get_position(self):
+
+        # Returns the current coordinates in the frame used to define this direction
+
+        if self._coord_type == 'galactic':
+
+            return self._children['l'].value, self._children['b'].value
+
+        else:
+
+            return self._children['ra'].value, self._children['dec'].value
+
+    def _get_converted_position(self):
+
+        # Returns the position in the other frame (ICRS if this direction is defined with Galactic coordinates,
+        # Galactic otherwise). The result is kept until the coordinates change
+
+        position = self._get_position()
+
+        cache = self.__dict__.get('_converted_position_cache')
+
+        if cache is not None and cache[0] == position:
+
+            return cache[1]
+
+        if self._coord_type == 'galactic':
+
+            converted_position = rotate_coordinates(position[0], position[1], 'galactic', 'icrs')
+
+        else:
+
+            converted_position = rotate_coordinates(position[0], position[1], 'icrs', 'galactic')
+
+        converted_position = (float(converted_position[0]), float(converted_position[1]))
+
+        self._converted_position_cache = (position, converted_position)
+
+        return converted_position
 
     def _get_sky_coord(self):
 
+        # The SkyCoord instance is kept until the coordinates change
+
+        position = self._get_position()
+
+        cache = self.__dict__.get('_sky_coord_cache')
+
+        if cache is not None and cache[0] == position:
+
+            return cache[1]
+
         if self._coord_type == 'galactic':
 
-            l = self._children['l'].value
-            b = self._children['b'].value
+            l, b = position
 
-            return coordinates.SkyCoord(l=l, b=b,
-                                        frame='galactic', equinox=self._equinox,
-                                        unit="deg")
+            sky_coord = coordinates.SkyCoord(l=l, b=b,
+                                             frame='galactic', equinox=self._equinox,
+                                             unit="deg")
 
         else:
 
-            ra = self._children['ra'].value
-            dec = self._children['dec'].value
+            ra, dec = position
+
+            sky_coord = coordinates.SkyCoord(ra=ra, dec=dec,
+                                             frame='icrs', equinox=self._equinox,
+                                             unit="deg")
+
+        self._sky_coord_cache = (position, sky_coord)
 
-            return coordinates.SkyCoord(ra=ra, dec=dec,
-                                        frame='icrs', equinox=self._equinox,
-                                        unit="deg")
+        return sky_coord
 
     @property
     def sky_coord(self):
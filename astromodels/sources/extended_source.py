@@ -125,18 +125,25 @@ class ExtendedSource(Source, Node):
 
         return self._spatial_shape
 
-    def __call__(self, lon, lat, energies):
+    def __call__(self, lon, lat, energies, sparse=False):
         """
         Returns brightness of source at the given position and energy
 
         :param lon: longitude (array or float)
         :param lat: latitude (array or float)
         :param energies: energies (array or float)
+        :param sparse: if True, evaluate the source only at the positions where the spatial shape can be different
+        from zero (see Function.evaluate_sparse), and return a tuple (indexes of these positions, differential flux
+        there). Units are not supported in this mode.
         :return: differential flux at given position and energy
         """
 
         assert type(lat) == type(lon) and type(lon) == type(energies), "Type mismatch in input of call"
 
+        if sparse:
+
+            return self._call_sparse(lon, lat, energies)
+
         # Get the differential flux from the spectral components
 
         results = [component.shape(energies) for component in self.components.values()]
@@ -181,6 +188,28 @@ class ExtendedSource(Source, Node):
 
         return np.maximum(result, 1e-60)
 
+    def _call_sparse(self, lon, lat, energies):
+
+        assert not isinstance(energies, u.Quantity), "Units are not supported in the sparse mode"
+
+        differential_flux = np.sum([component.shape(energies) for component in self.components.values()], 0)
+
+        if self._spatial_shape.n_dim == 2:
+
+            indexes, brightness = self._spatial_shape.evaluate_sparse(lon, lat)
+
+            result = brightness[:, np.newaxis] * differential_flux
+
+        else:
+
+            indexes, result = self._spatial_shape.evaluate_sparse(lon, lat, energies)
+
+            result = result * differential_flux
+
+        # Same lower boundary as the dense evaluation
+
+        return indexes, np.maximum(result, 1e-60)
+
     def _repr__base(self, rich_output=False):
         """
         Representation of the object
@@ -208,6 +237,6 @@ class ExtendedSource(Source, Node):
         """
         Returns the boundaries for this extended source
 
-        :return: a tuple of tuples ((min. lon, max. lon), (min lat, max lat))
+        :return: a tuple of tuples ((min. lon, max. lon), (min lat, max lat)), or None if the source has no boundaries
         """
-        return self.shape.get_boundaries()
+        return self._spatial_shape.get_boundaries()
@@ -1,4 +1,6 @@
 import collections
+import keyword
+import re
 import numpy
 
 import astropy.units as u
@@ -6,14 +8,62 @@ import astropy.units as u
 from astromodels.sources.source import Source, POINT_SOURCE
 from astromodels.sky_direction import SkyDirection
 from astromodels.spectral_component import SpectralComponent
+from astromodels.parameter import SettingOutOfBounds
 from astromodels.utils.pretty_list import dict_to_list
-from astromodels.tree import Node
+from astromodels.utils.valid_variable import is_valid_variable_name
+from astromodels.utils.garbage_collection import paused_garbage_collector
+from astromodels.tree import Node, clone_from_recipe
+from astromodels.functions.function import Function
 from astromodels.units import get_units
 
 
 __author__ = 'giacomov'
 
 
+# Names matching this are surely valid variable names (the others are checked with is_valid_variable_name)
+
+_simple_name = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def _check_names(names):
+
+    # Check all the names of the sources at once (see PointSource.many)
+
+    for name in names:
+
+        if _simple_name.match(name) is None or keyword.iskeyword(name):
+
+            assert is_valid_variable_name(name), "Illegal characters in name %s. You can only use letters and " \
+                                                 "numbers, and + and - (but the name cannot start with -)" % name
+
+    assert len(set(names)) == len(names), "The names of the sources must be unique"
+
+
+def _get_column(values, n_sources, name, min_value, max_value):
+    """
+    Returns an array with one value per source, checking all the values against the boundaries at once
+
+    :param values: array of values, or a number (used for all the sources)
+    :param n_sources: number of sources
+    :param name: name of the quantity (used in the error messages)
+    :param min_value: minimum allowed value (or None)
+    :param max_value: maximum allowed value (or None)
+    :return: a new array of floats
+    """
+
+    column = numpy.array(numpy.broadcast_to(numpy.asarray(values, dtype=float), (n_sources,)))
+
+    if min_value is not None and numpy.any(column < min_value):
+
+        raise SettingOutOfBounds("Some values of %s are smaller than the minimum (%s)" % (name, min_value))
+
+    if max_value is not None and numpy.any(column > max_value):
+
+        raise SettingOutOfBounds("Some values of %s are larger than the maximum (%s)" % (name, max_value))
+
+    return column
+
+
 class PointSource(Source, Node):
     """
     A point source. You can instance this class in many ways.
@@ -140,6 +190,128 @@ class PointSource(Source, Node):
 
             component.shape.set_units(x_unit, y_unit)
 
+    @classmethod
+    def many(cls, names, ra, dec, function_class, **parameter_values):
+        """
+        Create many point sources with Equatorial positions and the same type of spectral function at once::
+
+            >>> sources = PointSource.many(['src1', 'src2'], [10.0, 20.0], [-5.0, 5.0], Powerlaw,
+            ...                            K=[1e-3, 2e-3], index=[-2.1, -2.5])
+
+        The first source is built with the constructor, and the others are copies of it (see Node._clone_tree) with
+        their own name, position and values of the parameters. In this way the units, the parameters and the nodes
+        are set up only once, and all the inputs are checked at once, which makes this much faster than calling the
+        constructor for each source. If the spectral function cannot be copied in this way (for example because it
+        contains tables), the constructor is used for each source.
+
+        :param names: names of the sources
+        :param ra: Equatorial J2000 Right Ascension (ICRS) of the sources (array or number)
+        :param dec: Equatorial J2000 Declination (ICRS) of the sources (array or number)
+        :param function_class: the class of the spectral function (like Powerlaw), or an instance of it (which is
+        not modified)
+        :param parameter_values: values of the parameters of the spectral function, either arrays with one element
+        per source or numbers (used for all the sources). Parameters not specified keep their default value.
+        :return: a list of PointSource instances
+        """
+
+        names = [str(name) for name in names]
+
+        n_sources = len(names)
+
+        assert n_sources > 0, "You need to provide at least one source"
+
+        _check_names(names)
+
+        ra = _get_column(ra, n_sources, 'ra', 0, 360)
+        dec = _get_column(dec, n_sources, 'dec', -90, 90)
+
+        if isinstance(function_class, type):
+
+            spectral_shape = function_class()
+
+        else:
+
+            spectral_shape = function_class.duplicate()
+
+        columns = []
+
+        for parameter_name, parameter in spectral_shape.parameters.iteritems():
+
+            if parameter_name in parameter_values:
+
+                columns.append((parameter, _get_column(parameter_values.pop(parameter_name), n_sources,
+                                                       parameter_name, parameter.min_value, parameter.max_value)))
+
+        assert len(parameter_values) == 0, "Unknown parameters for %s: %s" % (spectral_shape.name,
+                                                                                ",".join(parameter_values.keys()))
+
+        # The first source is the template for the others
+
+        template = cls(names[0], ra=ra[0], dec=dec[0], spectral_shape=spectral_shape)
+
+        for parameter, column in columns:
+
+            parameter.value = column[0]
+
+        sources = [template]
+
+        # The garbage collector is paused while building the new objects (see paused_garbage_collector)
+
+        with paused_garbage_collector():
+
+            if template._can_clone_tree():
+
+                recipe = template._get_clone_recipe()
+
+                # Find the position in the recipe of the nodes to be changed
+
+                index_of = dict((id(node), i) for i, node in enumerate(template._get_subtree()))
+
+                position = template.position
+
+                changes = [(0, '_name', names)]
+                changes.append((index_of[id(position.ra)], '_value', ra.tolist()))
+                changes.append((index_of[id(position.dec)], '_value', dec.tolist()))
+
+                # The delta of the positional parameters depends on their value (see Parameter)
+
+                for parameter, column in ((position.ra, ra), (position.dec, dec)):
+
+                    changes.append((index_of[id(parameter)], '_delta',
+                                    numpy.where(column != 0, 0.1 * numpy.abs(column), 0.1).tolist()))
+
+                for parameter, column in columns:
+
+                    changes.append((index_of[id(parameter)], '_value', column.tolist()))
+
+                # Each function needs its own unique identifier, otherwise composite functions made with the spectra
+                # of different sources would mix them up
+
+                function_indexes = [i for i, node in enumerate(template._get_subtree()) if isinstance(node, Function)]
+
+                for i in range(1, n_sources):
+
+                    overrides = [(index, attribute_name, values[i]) for index, attribute_name, values in changes]
+
+                    overrides.extend((index, '_uuid', "{" + str(Function._generate_uuid()) + "}")
+                                     for index in function_indexes)
+
+                    sources.append(clone_from_recipe(recipe, overrides)[0])
+
+            else:
+
+                for i in range(1, n_sources):
+
+                    this_shape = spectral_shape.duplicate()
+
+                    for parameter, column in columns:
+
+                        this_shape.parameters[parameter.name].value = column[i]
+
+                    sources.append(cls(names[i], ra=ra[i], dec=dec[i], spectral_shape=this_shape))
+
+        return sources
+
     def __call__(self, x):
 
         results = [component.shape(x) for component in self.components.values()]
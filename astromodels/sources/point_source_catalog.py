@@ -0,0 +1,421 @@
+import collections
+
+import numpy as np
+import astropy.units as u
+
+from astromodels.sources.source import Source, POINT_SOURCE_CATALOG
+from astromodels.sources.point_source import PointSource, _get_column, _check_names
+from astromodels.spectral_component import SpectralComponent
+from astromodels.parameter import get_value_generation
+from astromodels.functions.function import Function1D
+from astromodels.utils.coordinate_transforms import get_grid_fingerprint
+from astromodels.utils.pretty_list import dict_to_list
+from astromodels.tree import Node
+from astromodels.units import get_units
+
+
+__author__ = 'giacomov'
+
+
+class PointSourceCatalog(Source, Node):
+    """
+    A set of point sources sharing the same type of spectral function, like a catalog of sources. Positions and
+    parameters are stored in numpy arrays (one element per source), and the spectra of all the sources are computed
+    with one call of the spectral function, using broadcasting::
+
+        >>> catalog = PointSourceCatalog('my_catalog', ['src1', 'src2'], [10.0, 20.0], [-5.0, 5.0], Powerlaw(),
+        ...                              K=[1e-3, 2e-3], index=[-2.1, -2.5])
+        >>> fluxes = catalog(energies) # shape (2, len(energies))
+
+    The parameters of the sources in the catalog are fixed. To free or link the parameters of one source, get it
+    with get_source: this returns a PointSource which is a view of that source. The view is added to the catalog
+    (so that its parameters are part of the model, with paths like my_catalog.src1.spectrum.main.Powerlaw.K), and
+    from then on the values of its parameters are used for that source.
+
+    NOTE: the spectral function must support arrays of parameters (broadcasting), otherwise the sources are evaluated
+    one at the time (which is correct but slower).
+
+    :param catalog_name: name for the catalog
+    :param names: names of the sources (they must be valid variable names)
+    :param ra: Equatorial J2000 Right Ascension (ICRS) of the sources
+    :param dec: Equatorial J2000 Declination (ICRS) of the sources
+    :param spectral_shape: an instance of a 1d function, used as template for the spectra of all the sources
+    :param parameter_values: values of the parameters of the spectral function, either arrays with one element per
+    source or numbers (used for all the sources). Parameters not specified keep the value of spectral_shape.
+    """
+
+    def __init__(self, catalog_name, names, ra, dec, spectral_shape, **parameter_values):
+
+        assert isinstance(spectral_shape, Function1D), "The spectral shape must be an instance of a 1d function"
+
+        self._names = [str(name) for name in names]
+
+        _check_names(self._names)
+
+        self._name_to_index = dict((name, i) for i, name in enumerate(self._names))
+
+        n_sources = len(self._names)
+
+        self._ra = _get_column(ra, n_sources, 'ra', 0, 360)
+        self._dec = _get_column(dec, n_sources, 'dec', -90, 90)
+
+        # Set the units of the template, as for a point source (energy as x and differential flux as y)
+
+        current_units = get_units()
+
+        self._x_unit = current_units.energy
+        self._y_unit = (current_units.energy * current_units.area * current_units.time) ** (-1)
+
+        self._spectral_shape = spectral_shape
+        self._spectral_shape.set_units(self._x_unit, self._y_unit)
+
+        # Columns of parameters values
+
+        self._parameter_values = collections.OrderedDict()
+
+        for parameter_name, parameter in self._spectral_shape.parameters.iteritems():
+
+            values = parameter_values.pop(parameter_name, parameter.value)
+
+            self._parameter_values[parameter_name] = _get_column(values, n_sources, parameter_name,
+                                                                      parameter.min_value, parameter.max_value)
+
+        assert len(parameter_values) == 0, "Unknown parameters for %s: %s" % (self._spectral_shape.name,
+                                                                                ",".join(parameter_values.keys()))
+
+        # Views of single sources (see get_source)
+
+        self._views = collections.OrderedDict()
+
+        # This changes every time the columns are changed, and it is used to know when the cached fluxes are
+        # not valid anymore
+
+        self._revision = 0
+
+        self._fluxes_cache = None
+
+        Source.__init__(self, [], POINT_SOURCE_CATALOG)
+
+        Node.__init__(self, catalog_name)
+
+    @property
+    def n_sources(self):
+        """
+        Number of sources in the catalog
+        """
+
+        return len(self._names)
+
+    @property
+    def names(self):
+        """
+        List of the names of the sources
+        """
+
+        return list(self._names)
+
+    @property
+    def spectral_shape(self):
+        """
+        The spectral function used as template for all the sources
+        """
+
+        return self._spectral_shape
+
+    @property
+    def ra(self):
+        """
+        Array of the R.A. of the sources (read-only)
+        """
+
+        self._sync_from_views()
+
+        return self._read_only(self._ra)
+
+    @property
+    def dec(self):
+        """
+        Array of the Dec. of the sources (read-only)
+        """
+
+        self._sync_from_views()
+
+        return self._read_only(self._dec)
+
+    @staticmethod
+    def _read_only(array):
+
+        view = array.view()
+        view.flags.writeable = False
+
+        return view
+
+    def get_parameter_values(self, parameter_name):
+        """
+        Returns the values of the provided parameter for all the sources
+
+        :param parameter_name: name of the parameter of the spectral function
+        :return: array (read-only)
+        """
+
+        self._sync_from_views()
+
+        return self._read_only(self._parameter_values[parameter_name])
+
+    def set_parameter_values(self, parameter_name, values):
+        """
+        Set the values of the provided parameter for all the sources (including those with a view)
+
+        :param parameter_name: name of the parameter of the spectral function
+        :param values: array with one element per source, or a number (used for all sources)
+        :return: (none)
+        """
+
+        parameter = self._spectral_shape.parameters[parameter_name]
+
+        self._parameter_values[parameter_name] = _get_column(values, self.n_sources, parameter_name,
+                                                                  parameter.min_value, parameter.max_value)
+
+        self._revision += 1
+
+        for name, view in self._views.iteritems():
+
+            view.spectrum.main.shape.parameters[parameter_name].value = \
+                self._parameter_values[parameter_name][self._name_to_index[name]]
+
+    def get_index(self, name):
+        """
+        Returns the position in the catalog of the source with the given name
+
+        :param name: name of the source
+        :return: an integer
+        """
+
+        return self._name_to_index[name]
+
+    def get_source(self, name_or_index):
+        """
+        Returns a view of one source, as an instance of PointSource. Use this to free or link the parameters of
+        that source. The view is created the first time it is requested, and it becomes part of the catalog.
+
+        :param name_or_index: name or position in the catalog of the source
+        :return: an instance of PointSource
+        """
+
+        if isinstance(name_or_index, basestring):
+
+            name = name_or_index
+
+        else:
+
+            name = self._names[name_or_index]
+
+        try:
+
+            return self._views[name]
+
+        except KeyError:
+
+            i = self._name_to_index[name]
+
+            shape = self._spectral_shape.duplicate()
+
+            for parameter_name, parameter in shape.parameters.iteritems():
+
+                parameter.value = self._parameter_values[parameter_name][i]
+
+                parameter.fix = True
+
+            view = PointSource(name, self._ra[i], self._dec[i], components=[SpectralComponent("main", shape)])
+
+            self._attach_view(view)
+
+            return view
+
+    def _attach_view(self, view):
+
+        # Add the view to the catalog. From now on, the values for this source are taken from the view
+
+        assert view.name in self._name_to_index, "Source %s is not in the catalog %s" % (view.name, self.name)
+
+        assert view.components.keys() == ['main'], "Views of catalog sources have only one component ('main')"
+
+        assert view.spectrum.main.shape.name == self._spectral_shape.name, "The view of %s has a spectral shape " \
+                                                                            "different from the catalog" % view.name
+
+        self._views[view.name] = view
+
+        self._add_child(view)
+
+        self._sync_from_views()
+
+    @property
+    def views(self):
+        """
+        Dictionary of the views created with get_source
+        """
+
+        return self._views
+
+    def _sync_from_views(self):
+
+        # Copy the values of the parameters of the views in the columns
+
+        for name, view in self._views.iteritems():
+
+            i = self._name_to_index[name]
+
+            self._ra[i] = view.position.get_ra()
+            self._dec[i] = view.position.get_dec()
+
+            for parameter_name, parameter in view.spectrum.main.shape.parameters.iteritems():
+
+                self._parameter_values[parameter_name][i] = parameter.value
+
+    def _evaluate_all(self, energies):
+
+        # Compute the spectra of all the sources with one call, by broadcasting the parameters (one row per source)
+        # against the energies (one column per energy)
+
+        parameters = dict((parameter_name, values[:, np.newaxis])
+                          for parameter_name, values in self._parameter_values.iteritems())
+
+        try:
+
+            fluxes = np.asarray(self._spectral_shape.evaluate(energies[np.newaxis, :], **parameters), dtype=float)
+
+        except (ValueError, IndexError, TypeError):
+
+            # The function does not support arrays of parameters
+
+            fluxes = None
+
+        if fluxes is None or fluxes.shape != (self.n_sources, energies.shape[0]):
+
+            # Evaluate the sources one by one
+
+            fluxes = np.empty((self.n_sources, energies.shape[0]))
+
+            for i in range(self.n_sources):
+
+                this_parameters = dict((parameter_name, values[i])
+                                       for parameter_name, values in self._parameter_values.iteritems())
+
+                fluxes[i, :] = self._spectral_shape.evaluate(energies, **this_parameters)
+
+        return fluxes
+
+    def get_fluxes(self, energies):
+        """
+        Returns the differential fluxes of all the sources at the given energies. The result is kept until the
+        energies or any parameter change, so that the fluxes of the single sources (see get_source_fluxes) are cheap.
+        The returned array is the cached one, so it is read-only (make a copy to modify it)
+
+        :param energies: array of energies
+        :return: array with shape (n_sources, n_energies)
+        """
+
+        energies = np.atleast_1d(np.asarray(energies, dtype=float))
+
+        key = (get_grid_fingerprint(energies, 0.0), get_value_generation(), self._revision)
+
+        if self._fluxes_cache is not None and self._fluxes_cache[0] == key:
+
+            return self._fluxes_cache[1]
+
+        self._sync_from_views()
+
+        fluxes = self._evaluate_all(energies)
+
+        fluxes.flags.writeable = False
+
+        self._fluxes_cache = (key, fluxes)
+
+        return fluxes
+
+    def get_source_fluxes(self, name_or_index, energies):
+        """
+        Returns the differential flux of one source at the given energies
+
+        :param name_or_index: name or position in the catalog of the source
+        :param energies: array of energies
+        :return: array of fluxes (a new array, which can be modified)
+        """
+
+        if isinstance(name_or_index, basestring):
+
+            name_or_index = self._name_to_index[name_or_index]
+
+        # Copy the row, so that the cache cannot be modified and the result behaves as the fluxes of a point source
+
+        return np.array(self.get_fluxes(energies)[name_or_index])
+
+    def __call__(self, energies):
+        """
+        Returns the differential fluxes of all the sources at the given energies
+
+        :param energies: energies (array or quantity)
+        :return: array with shape (n_sources, n_energies)
+        """
+
+        if isinstance(energies, u.Quantity):
+
+            return np.array(self.get_fluxes(energies.to(self._x_unit).value)) * self._y_unit
+
+        else:
+
+            return np.array(self.get_fluxes(energies))
+
+    def to_dict(self, minimal=False):
+
+        self._sync_from_views()
+
+        data = collections.OrderedDict()
+
+        data['spectral_shape'] = self._spectral_shape.name
+        data['names'] = list(self._names)
+        data['ra'] = self._ra.tolist()
+        data['dec'] = self._dec.tolist()
+
+        parameters = collections.OrderedDict()
+
+        for parameter_name, values in self._parameter_values.iteritems():
+
+            parameters[parameter_name] = collections.OrderedDict()
+            parameters[parameter_name]['value'] = values.tolist()
+
+            if not minimal:
+
+                parameter = self._spectral_shape.parameters[parameter_name]
+
+                parameters[parameter_name]['min_value'] = parameter.min_value
+                parameters[parameter_name]['max_value'] = parameter.max_value
+                parameters[parameter_name]['unit'] = str(parameter.unit)
+
+        data['parameters'] = parameters
+
+        if self._views:
+
+            data['views'] = collections.OrderedDict((name, view.to_dict(minimal))
+                                                    for name, view in self._views.iteritems())
+
+        return data
+
+    def _repr__base(self, rich_output=False):
+        """
+        Representation of the object
+
+        :param rich_output: if True, generates HTML, otherwise text
+        :return: the representation
+        """
+
+        repr_dict = collections.OrderedDict()
+
+        key = '%s (point source catalog)' % self.name
+
+        repr_dict[key] = collections.OrderedDict()
+        repr_dict[key]['number of sources'] = self.n_sources
+        repr_dict[key]['spectral shape'] = self._spectral_shape.name
+        repr_dict[key]['sources with a view'] = ",".join(self._views.keys()) if self._views else "(none)"
+
+        return dict_to_list(repr_dict, rich_output)
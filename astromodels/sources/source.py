@@ -6,6 +6,7 @@ import exceptions
 PARTICLE_SOURCE = 'particle source'
 POINT_SOURCE = 'point source'
 EXTENDED_SOURCE = 'extended source'
+POINT_SOURCE_CATALOG = 'point source catalog'
 
 
 class UnknownSourceType(exceptions.Exception):
@@ -23,7 +24,7 @@ class Source(object):
 
             self._components[component.name] = component
 
-        if src_type not in (PARTICLE_SOURCE, POINT_SOURCE, EXTENDED_SOURCE):
+        if src_type not in (PARTICLE_SOURCE, POINT_SOURCE, EXTENDED_SOURCE, POINT_SOURCE_CATALOG):
 
             raise UnknownSourceType("Source of type %s is unknown" % src_type)
 
@@ -0,0 +1,52 @@
+import os
+import tempfile
+
+import pytest
+
+from astromodels.benchmarks.runner import run_benchmarks, save_results, load_results, compare, UnknownBenchmark
+
+
+def test_benchmark_suite():
+
+    results = run_benchmarks(quick=True, only=['free_parameters', 'memoize'])
+
+    assert results['metadata']['quick']
+
+    assert len(results['skipped']) == 0
+
+    assert 'Model.free_parameters (100 sources)' in results['results']
+
+    for result in results['results'].values():
+
+        assert result['value'] > 0
+        assert result['unit'] == 's'
+
+    with pytest.raises(UnknownBenchmark):
+
+        run_benchmarks(only=['not_a_benchmark'])
+
+    # Save and read back
+
+    handle, filename = tempfile.mkstemp(suffix='.json')
+
+    os.close(handle)
+
+    try:
+
+        save_results(results, filename)
+
+        assert load_results(filename) == results
+
+    finally:
+
+        os.remove(filename)
+
+    # Compare with a baseline
+
+    baseline = {'results': {'a': {'value': 1.0}, 'b': {'value': 1.0}, 'c': {'value': 1.0}, 'd': {'value': 1.0}}}
+
+    new = {'results': {'a': {'value': 1.1}, 'b': {'value': 1.5}, 'c': {'value': 0.5}, 'e': {'value': 1.0}}}
+
+    comparison = dict((x[0], x[-1]) for x in compare(new, baseline, tolerance=0.2))
+
+    assert comparison == {'a': 'ok', 'b': 'regression', 'c': 'improvement'}
@@ -4,7 +4,10 @@ import astropy.units as u
 import numpy as np
 
 from astromodels.functions.function import FunctionMeta, Function1D, FunctionDefinitionError
-from astromodels.functions.functions import Powerlaw
+from astromodels.functions.function import get_function_classes_creation_times
+from astromodels.functions import definition_cache
+from astromodels.functions.functions import Powerlaw, Band_Calderone
+from astromodels.utils.angular_distance import angular_distance
 
 __author__ = 'giacomov'
 
@@ -534,4 +537,650 @@ def test_function_composition():
 
     for x in ([1,2,3,4],[1,2,3,4] * u.keV, 1.0, np.array([1.0, 2.0, 3.0, 4.0])):
 
-        assert np.all(composite(x) == line(x) + powerlaw(x))
\ No newline at end of file
+        assert np.all(composite(x) == line(x) + powerlaw(x))
+
+def test_duplicate():
+
+    powerlaw = Powerlaw()
+
+    powerlaw.set_units(u.keV, 1.0 / (u.keV * u.cm**2 * u.s))
+
+    powerlaw.index.value = -1.5
+    powerlaw.K.prior = Powerlaw()
+
+    powerlaw_copy = powerlaw.duplicate()
+
+    assert powerlaw_copy.to_dict() == powerlaw.to_dict()
+    assert powerlaw_copy.x_unit == powerlaw.x_unit
+
+    assert powerlaw_copy.K._get_parent() is powerlaw_copy
+
+    # The copy must be independent of the original
+
+    powerlaw_copy.index.value = -2.5
+    powerlaw_copy.K.prior.index.value = -1.0
+
+    assert powerlaw.index.value == -1.5
+    assert powerlaw.K.prior.index.value != -1.0
+
+    assert powerlaw_copy(10.0) != powerlaw(10.0)
+
+    # Composite functions are copied as well
+
+    composite = powerlaw + Powerlaw()
+
+    composite_copy = composite.duplicate()
+
+    composite_copy.index_1.value = -3.0
+
+    assert composite.index_1.value == -1.5
+    assert composite_copy(10.0) != composite(10.0)
+
+
+def test_definition_cache(tmpdir, monkeypatch):
+
+    cache_file = str(tmpdir.join("cache.pkl"))
+
+    monkeypatch.setattr(definition_cache, "_get_cache_file", lambda: cache_file)
+    monkeypatch.setattr(definition_cache, "_cache", None)
+    monkeypatch.setattr(definition_cache, "_cache_is_dirty", False)
+
+    docstring = get_a_function_class().__doc__
+
+    definition = definition_cache.load_function_definition(docstring)
+
+    assert definition['parameters'].keys() == ['a', 'b']
+
+    # Every call must return a new copy
+
+    assert definition_cache.load_function_definition(docstring) is not definition
+
+    # Save and reload from disk
+
+    definition_cache._save_cache()
+
+    monkeypatch.setattr(definition_cache, "_cache", None)
+
+    assert definition_cache.load_function_definition(docstring) == definition
+
+    assert len(definition_cache._cache) == 1
+
+    # A corrupted cache file is ignored
+
+    with open(cache_file, "w+") as f:
+
+        f.write("not a cache")
+
+    monkeypatch.setattr(definition_cache, "_cache", None)
+
+    assert definition_cache.load_function_definition(docstring) == definition
+
+    # A failed write does not leave temporary files behind (a lambda cannot be pickled)
+
+    monkeypatch.setattr(definition_cache, "_cache", {'a': lambda x: x})
+    monkeypatch.setattr(definition_cache, "_cache_is_dirty", True)
+
+    definition_cache._save_cache()
+
+    assert tmpdir.listdir() == [tmpdir.join("cache.pkl")]
+
+    # The time needed to create each class is recorded
+
+    assert 'Test_function' in get_function_classes_creation_times()
+
+
+def test_dark_matter_tables():
+
+    from astromodels.functions.functions import DMFitFunction, DMSpectra
+    from astromodels.functions import dark_matter_tables
+
+    energies = np.logspace(3, 7, 20)
+
+    for function_class, table_name in [(DMFitFunction, 'fermi'), (DMSpectra, 'combined')]:
+
+        f1 = function_class()
+        f2 = function_class()
+
+        # The tables are shared and read-only
+
+        table = dark_matter_tables.get_table(table_name)
+
+        assert not table.flags.writeable
+
+        assert dark_matter_tables.get_table(table_name) is table
+
+        assert np.all(f1(energies) == f2(energies))
+
+        # Changing the channel after creation must change the spectrum
+
+        f2.channel.value = 5
+
+        assert np.any(f1(energies) != f2(energies))
+
+        assert dark_matter_tables.get_interpolator(table_name, 5) is dark_matter_tables.get_interpolator(table_name, 5)
+
+        f2.channel.value = 100
+
+        with pytest.raises(ValueError):
+
+            _ = f2(energies)
+
+
+def test_normalization_parameters():
+
+    class Test_normalized_function(Function1D):
+        r"""
+        description :
+
+            A test function with a normalization
+
+        latex : $ K x^{b} $
+
+        parameters :
+
+            K :
+
+                desc : normalization
+                is_normalization : yes
+                initial value : 1
+
+            b :
+
+                desc : index
+                initial value : 1
+
+        """
+
+        __metaclass__ = FunctionMeta
+
+        n_calls = 0
+
+        def _set_units(self, x_unit, y_unit):
+
+            self.K.unit = y_unit
+
+            self.b.unit = u.dimensionless_unscaled
+
+        def evaluate(self, x, K, b):
+
+            type(self).n_calls += 1
+
+            return K * np.power(x, b)
+
+    my_function = Test_normalized_function()
+
+    assert my_function.normalization_parameters.keys() == ['K']
+
+    assert Powerlaw().normalization_parameters.keys() == ['K']
+
+    assert Band_Calderone().normalization_parameters.keys() == ['F']
+
+    x = np.array([1.0, 2.0, 3.0])
+
+    assert np.all(my_function(x) == x)
+
+    # Changing only the normalization should not trigger a new evaluation of the shape
+
+    my_function.K.value = 2.5
+
+    assert np.all(my_function(x) == 2.5 * x)
+
+    assert Test_normalized_function.n_calls == 1
+
+    assert np.all(my_function.get_unnormalized_shape(x) == x)
+
+    # Changing the index or the grid does
+
+    my_function.b.value = 2.0
+
+    assert np.all(my_function(x) == 2.5 * x ** 2)
+
+    assert np.all(my_function(x + 1) == 2.5 * (x + 1) ** 2)
+
+    assert Test_normalized_function.n_calls == 3
+
+
+def test_synchrotron_cache():
+
+    from astromodels.functions import functions
+
+    if not functions.has_naima:
+
+        pytest.skip("naima is not available")
+
+    import naima
+
+    electrons = functions.Cutoff_powerlaw()
+    electrons.index.value = -2.0
+    electrons.xc.value = 1e10
+
+    synchrotron = functions.Synchrotron()
+    synchrotron.particle_distribution = electrons
+
+    energies = np.logspace(-8, 2, 50)
+
+    def get_naima_flux():
+
+        # A new naima model, with the current parameters
+
+        wrapper = lambda x: electrons(x.to(u.keV).value) / u.keV
+
+        naima_synchrotron = naima.models.Synchrotron(wrapper, synchrotron.B.value * u.Gauss,
+                                                     Eemin=synchrotron.emin.value * u.GeV,
+                                                     Eemax=synchrotron.emax.value * u.GeV,
+                                                     nEed=synchrotron.need.value)
+
+        return naima_synchrotron.flux(energies * u.keV, distance=synchrotron.distance.value * u.kpc).value
+
+    assert np.allclose(synchrotron(energies), get_naima_flux(), rtol=1e-10, atol=0)
+
+    # The naima model is reused, and naima is not called again when only the normalization of the particle
+    # distribution or the distance change
+
+    naima_synchrotron = synchrotron._naima_synchrotron
+
+    luminosity = synchrotron._luminosity_cache[-1]
+
+    electrons.K.value = 2.0
+    synchrotron.distance.value = 2.0
+
+    assert np.allclose(synchrotron(energies), get_naima_flux(), rtol=1e-10, atol=0)
+
+    assert synchrotron._luminosity_cache[-1] is luminosity
+
+    # ...while it is called again when the magnetic field or the shape of the particle distribution change
+
+    synchrotron.B.value = 1e-5
+
+    assert np.allclose(synchrotron(energies), get_naima_flux(), rtol=1e-10, atol=0)
+
+    electrons.xc.value = 1e9
+
+    assert np.allclose(synchrotron(energies), get_naima_flux(), rtol=1e-10, atol=0)
+
+    assert synchrotron._luminosity_cache[-1] is not luminosity
+
+    assert synchrotron._naima_synchrotron is naima_synchrotron
+
+
+def test_flux_normalized_functions():
+
+    from scipy.integrate import quad
+    from astromodels.functions.functions import upper_incomplete_gamma, Powerlaw_flux, Cutoff_powerlaw_flux
+
+    # Incomplete gamma function for positive, null and negative first argument
+
+    for s in [1.5, 0.0, -1.0, -2.3]:
+
+        for x in [0.1, 2.0]:
+
+            expected = quad(lambda t: t ** (s - 1) * np.exp(-t), x, np.inf)[0]
+
+            assert np.isclose(upper_incomplete_gamma(s, x), expected, rtol=1e-6)
+
+    for function_class in [Powerlaw_flux, Cutoff_powerlaw_flux]:
+
+        f = function_class()
+
+        for index in [-2.5, -1.0, -0.5]:
+
+            f.index.value = index
+
+            assert np.isclose(quad(f, f.a.value, f.b.value)[0], f.F.value)
+
+        # The integral is cached, and it is not computed again when only the normalization changes
+
+        integral_cache = f._integral_cache
+
+        f.F.value = 2 * f.F.value
+
+        _ = f(np.array([1.0, 10.0]))
+
+        assert f._integral_cache is integral_cache
+
+        f.index.value = -2.0
+
+        _ = f(np.array([1.0, 10.0]))
+
+        assert f._integral_cache is not integral_cache
+
+    # Arrays of parameters are broadcast against x
+
+    f = Cutoff_powerlaw_flux()
+
+    x = np.logspace(0, 2, 10)
+
+    indexes = np.array([-2.0, -1.5, -0.5])
+
+    batch = f.evaluate(x, f.F.value, indexes[:, np.newaxis], f.xc.value, f.a.value, f.b.value)
+
+    assert batch.shape == (3, 10)
+
+    for i, index in enumerate(indexes):
+
+        f.index.value = index
+
+        assert np.allclose(batch[i], f(x))
+
+
+def test_coordinate_transform_cache():
+
+    from astropy.coordinates import SkyCoord, FK5
+    from astromodels.functions.functions_2D import Latitude_galactic_diffuse
+    from astromodels.utils import coordinate_transforms
+
+    coordinate_transforms.clear_transform_cache()
+
+    ra = np.linspace(0, 359, 100)
+    dec = np.linspace(-89, 89, 100)
+
+    f = Latitude_galactic_diffuse()
+    f.sigma_b.value = 30.0
+
+    b = SkyCoord(ra=ra, dec=dec, frame='icrs', unit='deg').galactic.b.deg
+
+    assert np.allclose(f(ra, dec), np.exp(-b ** 2 / (2 * 30.0 ** 2)))
+
+    # The same grid (even in a different array) reuses the cached transformation
+
+    l1, b1 = coordinate_transforms.transform_coordinates(ra.copy(), dec.copy(), 'icrs', 'galactic')
+    l2, b2 = coordinate_transforms.transform_coordinates(ra, dec, 'icrs', 'galactic')
+
+    assert l1 is l2 and b1 is b2
+
+    assert not b1.flags.writeable
+
+    # A different source frame gives a different transformation
+
+    f.set_frame(FK5(equinox='J1950'))
+    f.sigma_b.value = 20.0
+
+    b_fk5 = SkyCoord(ra=ra, dec=dec, frame=FK5(equinox='J1950'), unit='deg').galactic.b.deg
+
+    assert np.allclose(f(ra, dec), np.exp(-b_fk5 ** 2 / (2 * 20.0 ** 2)))
+
+    assert len(coordinate_transforms._transform_cache) == 2
+
+    # Single positions work as well, both with the rotations and with astropy
+
+    for frame in ('galactic', FK5(equinox='J1950')):
+
+        lon, lat = coordinate_transforms.transform_coordinates(10.0, 20.0, 'icrs', frame)
+
+        reference = SkyCoord(ra=10.0, dec=20.0, frame='icrs', unit='deg').transform_to(frame).spherical
+
+        assert np.isclose(lon, reference.lon.deg) and np.isclose(lat, reference.lat.deg)
+
+
+def test_spatial_template(tmpdir):
+
+    from astropy.io import fits
+    from astromodels.functions.functions_2D import SpatialTemplate_2D
+
+    # A non-square template in a CAR projection, with 1 deg pixels centered at R.A. = 100 and Dec. = 20
+
+    n_x, n_y = 20, 10
+
+    data = np.arange(n_x * n_y, dtype=float).reshape(n_y, n_x)
+
+    header = fits.Header()
+    header['CTYPE1'] = 'RA---CAR'
+    header['CTYPE2'] = 'DEC--CAR'
+    header['CRPIX1'] = 10.5
+    header['CRPIX2'] = 5.5
+    header['CRVAL1'] = 100.0
+    header['CRVAL2'] = 0.0
+    header['CDELT1'] = -1.0
+    header['CDELT2'] = 1.0
+
+    fitsfile = str(tmpdir.join("template.fits"))
+
+    fits.PrimaryHDU(data=data, header=header).writeto(fitsfile)
+
+    template = SpatialTemplate_2D()
+    template.load_file(fitsfile)
+
+    # Centers of some pixels (the R.A. decreases with the pixel index)
+
+    i = np.array([0, 3, 19, 7])
+    j = np.array([0, 9, 4, 2])
+
+    ra = 100.0 - (i - 9.5)
+    dec = j - 4.5
+
+    assert np.allclose(template(ra, dec), data[j, i])
+
+    # The values on a grid are computed once, then only K changes
+
+    values = template._template_cache[1]
+
+    template.K.value = 3.0
+
+    assert np.allclose(template(ra, dec), 3.0 * data[j, i])
+
+    assert template._template_cache[1] is values
+
+    # Points outside of the template are zero
+
+    assert np.all(template(np.array([10.0, 100.0]), np.array([0.0, 60.0])) == 0)
+
+    # Bilinear interpolation: at the center of the pixels it gives the pixel values, between two pixels the mean
+
+    template.load_file(fitsfile, interpolation='bilinear')
+    template.K.value = 1.0
+
+    assert np.allclose(template(ra[:2], dec[:2]), data[j[:2], i[:2]])
+
+    assert np.isclose(template(np.array([ra[1] - 0.5]), np.array([dec[1] - 0.5]))[0],
+                      np.mean(data[j[1] - 1:j[1] + 1, i[1]:i[1] + 2]))
+
+    # Copies read the template again from the file
+
+    template_copy = template.duplicate()
+
+    assert np.allclose(template_copy(ra, dec), template(ra, dec))
+
+    # The boundaries include the whole pixels on the border
+
+    (min_ra, max_ra), (min_dec, max_dec) = template.get_boundaries()
+
+    assert np.isclose(min_ra, 100.0 - 10.0) and np.isclose(max_ra, 100.0 + 10.0)
+    assert np.isclose(min_dec, -5.0) and np.isclose(max_dec, 5.0)
+
+    # A template going across R.A. = 0
+
+    header['CRVAL1'] = 5.0
+
+    fits.PrimaryHDU(data=data, header=header).writeto(fitsfile, clobber=True)
+
+    template.load_file(fitsfile)
+
+    (min_ra, max_ra), (min_dec, max_dec) = template.get_boundaries()
+
+    assert np.isclose(min_ra, 355.0) and np.isclose(max_ra, 15.0)
+
+    # A template around the north pole: the boundaries must cover all R.A. up to the pole, even if the border of the
+    # template is at Dec. < 81
+
+    polar_header = fits.Header()
+    polar_header['CTYPE1'] = 'RA---TAN'
+    polar_header['CTYPE2'] = 'DEC--TAN'
+    polar_header['CRPIX1'] = 10.5
+    polar_header['CRPIX2'] = 10.5
+    polar_header['CRVAL1'] = 0.0
+    polar_header['CRVAL2'] = 90.0
+    polar_header['CDELT1'] = -1.0
+    polar_header['CDELT2'] = 1.0
+
+    polar_file = str(tmpdir.join("polar_template.fits"))
+
+    fits.PrimaryHDU(data=np.ones((20, 20)), header=polar_header).writeto(polar_file)
+
+    template.load_file(polar_file)
+
+    (min_ra, max_ra), (min_dec, max_dec) = template.get_boundaries()
+
+    assert min_ra == 0.0 and max_ra == 360.0
+    assert max_dec == 90.0 and 75.0 < min_dec < 77.0
+
+    assert np.all(template(np.array([0.0, 123.0, 250.0]), np.array([90.0, 89.0, 85.0])) == 1.0)
+
+
+def test_continuous_injection_diffusion():
+
+    from astromodels.functions.functions_3D import Continuous_injection_diffusion
+
+    f = Continuous_injection_diffusion()
+
+    lon = np.array([0.0, 0.5, 1.0, 359.0, 2.0])
+    lat = np.array([0.0, 0.5, -1.0, 0.2, 2.0])
+    energies = np.logspace(6, 10, 7)
+
+    def expected(rdiff0):
+
+        rdiff = rdiff0 * np.power(energies / 2e10, (0.5 - 1.) / 2. * (0.54 + 0.046 * np.log10(energies / 1e9)))
+
+        angsep = angular_distance(lon, lat, 0.0, 0.0)[:, np.newaxis]
+
+        return np.power(180.0 / np.pi, 2) * 1.2154 / (np.pi * np.sqrt(np.pi) * rdiff * (angsep + 0.06 * rdiff)) * \
+               np.exp(-np.power(angsep, 2) / rdiff ** 2)
+
+    assert np.allclose(f(lon, lat, energies), expected(1.0))
+
+    # Changing the radius does not compute again the angular separations
+
+    angsep_cache = f._angsep_cache
+
+    f.rdiff0.value = 2.5
+
+    assert np.allclose(f(lon, lat, energies), expected(2.5))
+
+    assert f._angsep_cache is angsep_cache
+
+    # Evaluation in chunks of energies
+
+    f.max_chunk_elements = 10
+
+    assert np.allclose(f(lon, lat, energies[::-1]), expected(2.5)[:, ::-1])
+
+    chunks = list(f.iter_energy_chunks(lon, lat, energies, chunk_size=3))
+
+    assert len(chunks) == 3
+
+    assert np.allclose(np.concatenate([chunk for _, chunk in chunks], axis=1), expected(2.5))
+
+
+def test_sparse_evaluation():
+
+    from astromodels.functions.functions_2D import Gaussian_on_sphere, Disk_on_sphere
+    from astromodels.functions.functions_3D import Continuous_injection_diffusion
+    from astromodels.sources.extended_source import ExtendedSource
+
+    np.random.seed(0)
+
+    lon = np.random.uniform(0, 360, 100000)
+    lat = np.rad2deg(np.arcsin(np.random.uniform(-1, 1, 100000)))
+
+    gaussian = Gaussian_on_sphere()
+    gaussian.lon0.value = 359.0
+    gaussian.lat0.value = 60.0
+    gaussian.sigma.value = 2.0
+
+    disk = Disk_on_sphere()
+    disk.lon0.value = 120.0
+    disk.lat0.value = -30.0
+    disk.radius.value = 3.0
+
+    for shape in [gaussian, disk]:
+
+        dense = shape(lon, lat)
+
+        indexes, values = shape.evaluate_sparse(lon, lat)
+
+        # Only a small fraction of the points is evaluated, and outside of them the function is negligible
+
+        assert 0 < indexes.shape[0] < lon.shape[0] / 100
+
+        assert np.allclose(values, dense[indexes])
+
+        outside = np.ones(lon.shape[0], dtype=bool)
+        outside[indexes] = False
+
+        assert np.all(dense[outside] < 1e-5 * dense.max())
+
+        assert np.allclose(shape.evaluate_sparse(lon, lat, dense=True)[indexes], dense[indexes])
+
+    # The disk is selected exactly
+
+    assert np.all(disk.evaluate_sparse(lon, lat, dense=True) == disk(lon, lat))
+
+    # 3D functions without a truncation radius use their boundaries
+
+    diffusion = Continuous_injection_diffusion()
+
+    energies = np.array([1e8, 1e9])
+
+    indexes, values = diffusion.evaluate_sparse(lon, lat, energies)
+
+    assert values.shape == (indexes.shape[0], 2)
+
+    assert np.allclose(values, diffusion(lon, lat, energies)[indexes])
+
+    # Sparse mode for extended sources
+
+    source = ExtendedSource("ext", gaussian, Powerlaw())
+
+    indexes, fluxes = source(lon, lat, energies, sparse=True)
+
+    assert np.allclose(fluxes, source(lon, lat, energies)[indexes])
+
+
+def test_evaluate_with():
+
+    from astromodels.functions.functions import Cutoff_powerlaw
+    from astromodels.functions.functions_2D import Gaussian_on_sphere
+    from astromodels.functions.function import UnknownParameter
+
+    energies = np.logspace(0, 3, 30)
+
+    powerlaw = Powerlaw()
+
+    result = powerlaw.evaluate_with({'K': 2.0, 'index': -2.2}, energies)
+
+    # The state did not change
+
+    assert powerlaw.K.value == 1.0
+    assert powerlaw.index.value == -2.0
+
+    powerlaw.K.value = 2.0
+    powerlaw.index.value = -2.2
+
+    assert np.allclose(result, powerlaw(energies))
+
+    with pytest.raises(UnknownParameter):
+
+        powerlaw.evaluate_with({'not_a_parameter': 1.0}, energies)
+
+    # Composite function
+
+    composite = Powerlaw() * Cutoff_powerlaw(K=1.0)
+
+    result = composite.evaluate_with({'index_1': -1.5, 'xc_2': 300.0}, energies)
+
+    composite.index_1.value = -1.5
+    composite.xc_2.value = 300.0
+
+    assert np.allclose(result, composite(energies))
+
+    # Function of two variables
+
+    shape = Gaussian_on_sphere()
+
+    ra = np.linspace(-1, 1, 10)
+    dec = np.zeros(10)
+
+    result = shape.evaluate_with({'sigma': 0.5}, ra, dec)
+
+    shape.sigma.value = 0.5
+
+    assert np.allclose(result, shape(ra, dec))
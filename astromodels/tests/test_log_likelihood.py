@@ -0,0 +1,190 @@
+import pytest
+
+import numpy as np
+from scipy.special import gammaln
+
+from astromodels.sources.point_source import PointSource
+from astromodels.functions.functions import Powerlaw, Cutoff_powerlaw
+from astromodels.model import Model
+from astromodels.log_likelihood.statistics import PoissonStatistic, PoissonWithBackgroundStatistic, \
+    GaussianStatistic
+from astromodels.log_likelihood.batched_loglike import BatchedLogLike, GradientNotAvailable
+
+__author__ = 'giacomov'
+
+
+def test_statistics():
+
+    counts = np.array([0.0, 1.0, 5.0, 10.0])
+    expected = np.array([[0.5, 2.0, 4.0, 11.0],
+                         [1.0, 1.0, 5.0, 10.0]])
+
+    poisson = PoissonStatistic(counts)
+
+    reference = np.sum(counts * np.log(expected) - expected - gammaln(counts + 1), axis=1)
+
+    assert np.allclose(poisson.log_like(expected), reference)
+    assert np.allclose(poisson.log_like(expected[0]), reference[:1])
+
+    # Expected zero where there are counts, or negative expected values, are impossible
+
+    assert poisson.log_like([1.0, 0.0, 1.0, 1.0])[0] == -np.inf
+    assert poisson.log_like([-1.0, 1.0, 1.0, 1.0])[0] == -np.inf
+
+    # Expected zero where there are no counts is fine
+
+    assert np.isfinite(poisson.log_like([0.0, 1.0, 1.0, 1.0])[0])
+
+    background = np.array([0.1, 0.2, 0.3, 0.4])
+
+    with_background = PoissonWithBackgroundStatistic(counts, background)
+
+    assert np.allclose(with_background.log_like(expected), poisson.log_like(expected + background))
+
+    sigma = np.array([1.0, 2.0, 3.0, 4.0])
+
+    gaussian = GaussianStatistic(counts, sigma)
+
+    chi2 = np.sum((counts - expected) ** 2 / sigma ** 2, axis=1)
+
+    assert np.allclose(gaussian.chi2(expected), chi2)
+    assert np.allclose(gaussian.log_like(expected), -0.5 * chi2 - np.sum(np.log(np.sqrt(2 * np.pi) * sigma)))
+
+    # Derivatives
+
+    step = 1e-6
+
+    for statistic in (poisson, with_background, gaussian):
+
+        numerical = (statistic.log_like(expected + np.array([0, 0, step, 0])) - statistic.log_like(expected)) / step
+
+        assert np.allclose(statistic.d_log_like(expected)[:, 2], numerical, rtol=1e-4, atol=1e-5)
+
+
+def test_batched_log_like():
+
+    energies = np.logspace(0, 2, 20)
+
+    src1 = PointSource('src1', 10.0, 10.0, spectral_shape=Powerlaw(K=10.0, index=-1.5))
+    src2 = PointSource('src2', 20.0, 20.0, spectral_shape=Cutoff_powerlaw(K=5.0, index=-1.0, xc=30.0))
+
+    model = Model(src1, src2)
+
+    exposure = 2.0
+
+    counts = np.random.RandomState(0).poisson(exposure * (src1(energies) + src2(energies)))
+
+    # Free parameters are src1 K and index, and src2 K (fixing the others)
+
+    src2.spectrum.main.Cutoff_powerlaw.index.fix = True
+    src2.spectrum.main.Cutoff_powerlaw.xc.fix = True
+
+    log_like = BatchedLogLike(model, energies, PoissonStatistic(counts), exposure=exposure)
+
+    assert log_like.n_free == 3
+    assert log_like.is_batchable
+    assert not log_like.has_gradient
+
+    samples = np.array([[10.0, -1.5, 5.0],
+                        [8.0, -1.7, 6.0],
+                        [12.0, -20.0, 6.0]])  # The last one is out of bounds
+
+    results = log_like(samples)
+
+    # Compare with setting the parameters one by one
+
+    for i in range(2):
+
+        src1.spectrum.main.Powerlaw.K.value, src1.spectrum.main.Powerlaw.index.value, \
+            src2.spectrum.main.Cutoff_powerlaw.K.value = samples[i]
+
+        expected = exposure * (src1(energies) + src2(energies))
+
+        assert np.allclose(results[i], np.sum(counts * np.log(expected) - expected - gammaln(counts + 1)))
+
+    assert results[2] == -np.inf
+
+    # The gradient is available when only normalizations are free
+
+    with pytest.raises(GradientNotAvailable):
+
+        log_like.log_like_and_gradient(samples)
+
+    src1.spectrum.main.Powerlaw.index.fix = True
+
+    log_like = BatchedLogLike(model, energies, PoissonStatistic(counts), exposure=exposure)
+
+    assert log_like.has_gradient
+
+    samples = np.array([[10.0, 5.0], [8.0, 6.0]])
+
+    values, gradient = log_like.log_like_and_gradient(samples)
+
+    assert np.allclose(values, log_like(samples))
+
+    step = 1e-6
+
+    for j in range(2):
+
+        shifted = samples.copy()
+        shifted[:, j] += step
+
+        assert np.allclose(gradient[:, j], (log_like(shifted) - values) / step, rtol=1e-4)
+
+    # A link makes the evaluation go sample by sample, with the same results
+
+    model.link(src2.spectrum.main.Cutoff_powerlaw.xc, src1.spectrum.main.Powerlaw.K)
+
+    log_like = BatchedLogLike(model, energies, PoissonStatistic(counts), exposure=exposure)
+
+    assert not log_like.is_batchable
+
+    original_K = src1.spectrum.main.Powerlaw.K.value
+
+    results = log_like(samples)
+
+    assert src1.spectrum.main.Powerlaw.K.value == original_K
+
+    for i in range(2):
+
+        src1.spectrum.main.Powerlaw.K.value, src2.spectrum.main.Cutoff_powerlaw.K.value = samples[i]
+
+        expected = exposure * (src1(energies) + src2(energies))
+
+        assert np.allclose(results[i], np.sum(counts * np.log(expected) - expected - gammaln(counts + 1)))
+
+
+def test_batched_log_like_composite():
+
+    energies = np.logspace(0, 2, 20)
+
+    spectrum = Powerlaw(K=10.0, index=-1.5) + Cutoff_powerlaw(K=5.0, index=-1.0, xc=30.0)
+
+    src = PointSource('src', 10.0, 10.0, spectral_shape=spectrum)
+
+    model = Model(src)
+
+    counts = np.random.RandomState(0).poisson(src(energies))
+
+    # Only the index of the power law is free
+
+    for parameter_name, parameter in spectrum.parameters.iteritems():
+
+        parameter.fix = (parameter_name != 'index_1')
+
+    log_like = BatchedLogLike(model, energies, PoissonStatistic(counts))
+
+    assert log_like.n_free == 1
+    assert log_like.is_batchable
+
+    samples = np.array([[-1.5], [-2.0]])
+
+    results = log_like(samples)
+
+    for i in range(2):
+
+        spectrum.index_1.value = samples[i, 0]
+
+        expected = src(energies)
+
+        assert np.allclose(results[i], np.sum(counts * np.log(expected) - expected - gammaln(counts + 1)))
@@ -1,5 +1,6 @@
 import pytest
 import os
+import numpy as np
 
 import astropy.units as u
 
@@ -11,7 +12,7 @@ from astromodels.sources.extended_source import ExtendedSource
 from astromodels.sources.particle_source import ParticleSource
 from astromodels.functions.functions import Powerlaw
 from astromodels.functions.functions_2D import Gaussian_on_sphere
-from astromodels.parameter import Parameter
+from astromodels.parameter import Parameter, IndependentVariable, CircularLink
 from astromodels.model_parser import load_model
 
 
@@ -274,6 +275,42 @@ def test_links():
     m.unlink(m.one.spectrum.main.Powerlaw.K)
 
 
+def test_chained_links():
+
+    mg = ModelGetter()
+
+    m = mg.model
+
+    # one.K depends on two.K, which in turn depends on ext_one.K
+
+    m.link(m.one.spectrum.main.Powerlaw.K, m.two.spectrum.main.Powerlaw.K)
+    m.link(m.two.spectrum.main.Powerlaw.K, m.ext_one.spectrum.main.Powerlaw.K)
+
+    # The linked parameters must be resolved in topological order
+
+    order = m._get_links_order()
+
+    assert order.index(m.two.spectrum.main.Powerlaw.K) < order.index(m.one.spectrum.main.Powerlaw.K)
+
+    new_value = 1.23456
+    m.ext_one.spectrum.main.Powerlaw.K.value = new_value
+
+    m.get_point_source_fluxes(0, np.array([1.0, 10.0]))
+
+    assert m.one.spectrum.main.Powerlaw.K.value == new_value
+    assert m.two.spectrum.main.Powerlaw.K.value == new_value
+
+    # Closing the loop is not allowed
+
+    with pytest.raises(CircularLink):
+
+        m.link(m.ext_one.spectrum.main.Powerlaw.K, m.one.spectrum.main.Powerlaw.K)
+
+    m.unlink(m.one.spectrum.main.Powerlaw.K)
+
+    assert m.one.spectrum.main.Powerlaw.K not in m._get_links_order()
+
+
 def test_external_parameters():
 
     mg = ModelGetter()
@@ -378,3 +415,646 @@ def test_3ML_interface():
 
     pass
 
+
+
+def test_extended_sources_footprint():
+
+    sources = []
+
+    for i, (lon0, lat0) in enumerate([(10.0, 0.0), (359.5, 20.0), (180.0, -45.0)]):
+
+        shape = Gaussian_on_sphere()
+        shape.sigma.value = 0.3
+        shape.sigma.max_value = 1.0
+        shape.lon0.value = lon0
+        shape.lat0.value = lat0
+
+        sources.append(ExtendedSource("ext%i" % i, shape, Powerlaw()))
+
+    m = Model(*sources)
+
+    ra = np.array([10.5, 0.5, 359.0, 180.0, 100.0, 10.0])
+    dec = np.array([0.5, 20.0, 21.0, -46.5, 0.0, 5.0])
+
+    # The boundaries are at 2 times the maximum sigma (and the second source goes across R.A. = 0)
+
+    assert np.all(m.is_inside_any_extended_source(ra, dec) == [True, True, True, True, False, False])
+
+    assert m.is_inside_any_extended_source(10.0, 0.0)
+    assert not m.is_inside_any_extended_source(100.0, 0.0)
+
+    inside = m.get_extended_sources_at(ra, dec)
+
+    assert [list(indexes) for indexes in inside] == [[0], [1, 2], [3]]
+
+    # Evaluating only inside the footprint gives the same fluxes there
+
+    energies = np.array([1.0, 10.0, 100.0])
+
+    for i in range(3):
+
+        all_fluxes = m.get_extended_source_fluxes(i, ra, dec, energies)
+        footprint_fluxes = m.get_extended_source_fluxes(i, ra, dec, energies, only_inside_footprint=True)
+
+        assert footprint_fluxes.shape == all_fluxes.shape
+
+        assert np.allclose(footprint_fluxes[inside[i]], all_fluxes[inside[i]])
+
+    # A single energy works as well
+
+    assert m.get_extended_source_fluxes(0, ra, dec, 10.0, only_inside_footprint=True).shape == (6, 1)
+
+    # Moving a source updates the index
+
+    sources[0].spatial_shape.lon0.value = 100.0
+
+    assert np.all(m.is_inside_any_extended_source(ra, dec) == [False, True, True, True, True, False])
+
+    assert [list(indexes) for indexes in m.get_extended_sources_at(ra, dec)] == [[4], [1, 2], [3]]
+
+    footprint_fluxes = m.get_extended_source_fluxes(0, ra, dec, energies, only_inside_footprint=True)
+
+    assert np.all(footprint_fluxes[[0, 1, 2, 3, 5]] == 1e-60)
+    assert np.all(footprint_fluxes[4] > 1e-60)
+
+    # A new maximum for the size changes the boundaries, even if no value changes
+
+    shape = sources[2].spatial_shape
+
+    assert not m.is_inside_any_extended_source(shape.lon0.value + 4.0, shape.lat0.value)
+
+    shape.sigma.max_value = 5.0
+
+    assert m.is_inside_any_extended_source(shape.lon0.value + 4.0, shape.lat0.value)
+
+    footprint_fluxes = m.get_extended_source_fluxes(2, np.array([shape.lon0.value + 4.0]),
+                                                    np.array([shape.lat0.value]), energies, only_inside_footprint=True)
+
+    assert np.all(footprint_fluxes > 1e-60)
+
+
+def test_profile_report():
+
+    import tempfile
+
+    import astromodels.profiling as profiling
+
+    pts = _get_point_source("one")
+    pts2 = _get_point_source("two")
+
+    m = Model(pts, pts2)
+
+    # Link the index of the second source to the index of the first one with a law
+
+    m.link(pts2.spectrum.main.Powerlaw.index, pts.spectrum.main.Powerlaw.index, Powerlaw())
+
+    energies = np.logspace(0, 3, 50)
+
+    original_call = Powerlaw.__call__
+
+    profiling.reset()
+
+    profiling.enable()
+
+    try:
+
+        assert profiling.is_enabled()
+
+        for i in range(3):
+
+            m.get_point_source_fluxes(0, energies)
+
+        # Same parameters and energies, so the second call is a cache hit
+
+        pts.spectrum.main.Powerlaw.K.value = 2.0
+
+        m.get_point_source_fluxes(0, energies)
+        m.get_point_source_fluxes(0, energies)
+
+    finally:
+
+        profiling.disable()
+
+    assert not profiling.is_enabled()
+
+    # The original methods are restored (so there is no cost when disabled)
+
+    assert Powerlaw.__call__ == original_call
+
+    # Calls made while disabled are not recorded
+
+    m.get_point_source_fluxes(0, energies)
+
+    report = m.profile_report()
+
+    source_row = report['one']
+    function_row = report['one.spectrum.main.Powerlaw']
+
+    assert source_row['calls'] == 5
+    assert function_row['calls'] == 5
+    assert function_row['mean_input_size'] == 50
+
+    assert function_row['cache_hits'] + function_row['cache_misses'] == 5
+    assert function_row['cache_hits'] >= 1
+
+    # The time of the source includes the time of its spectrum
+
+    assert source_row['total_time'] >= function_row['total_time']
+    assert source_row['self_time'] <= source_row['total_time'] - function_row['total_time'] + 1e-9
+
+    # The second source was never evaluated
+
+    with pytest.raises(KeyError):
+
+        report['two']
+
+    # Export
+
+    handle, filename = tempfile.mkstemp()
+
+    os.close(handle)
+
+    try:
+
+        assert len(report.to_json(filename)) > 0
+
+        report.to_csv(filename)
+
+        with open(filename) as f:
+
+            lines = f.readlines()
+
+        assert len(lines) == len(report) + 1
+
+    finally:
+
+        os.remove(filename)
+
+    profiling.reset()
+
+    assert len(m.profile_report()) == 0
+
+
+def test_prior_transform_and_log_prior():
+
+    from astromodels.functions.functions import Uniform_prior, Log_uniform_prior, Gaussian
+    from astromodels.model import NoPriorDefined
+
+    pts = _get_point_source("one")
+    pts2 = _get_point_source("two")
+
+    m = Model(pts, pts2)
+
+    with pytest.raises(NoPriorDefined):
+
+        m.prior_transform([0.5] * len(m.free_parameters))
+
+    pts.spectrum.main.Powerlaw.K.prior = Log_uniform_prior(lower_bound=1e-3, upper_bound=1e3)
+    pts.spectrum.main.Powerlaw.index.prior = Uniform_prior(lower_bound=-3, upper_bound=-1)
+    pts2.spectrum.main.Powerlaw.K.prior = Log_uniform_prior(lower_bound=1e-2, upper_bound=1e2)
+    pts2.spectrum.main.Powerlaw.index.prior = Gaussian(mu=-2, sigma=0.3)
+
+    free_parameters = m.free_parameters.values()
+
+    assert len(free_parameters) == 4
+
+    original_values = [parameter.value for parameter in free_parameters]
+
+    rng = np.random.RandomState(0)
+
+    cube = rng.uniform(0.01, 0.99, size=(100, 4))
+
+    theta = m.prior_transform(cube)
+
+    assert theta.shape == (100, 4)
+
+    # Same as transforming one parameter and one point at the time
+
+    for i in [0, 17, 99]:
+
+        expected = [parameter.prior.from_unit_cube(cube[i, j]) for j, parameter in enumerate(free_parameters)]
+
+        assert np.allclose(theta[i], expected)
+
+        assert np.allclose(m.prior_transform(cube[i]), expected)
+
+    log_prior = m.log_prior(theta)
+
+    assert log_prior.shape == (100,)
+
+    for i in [0, 17, 99]:
+
+        expected = sum(np.log(parameter.prior(theta[i, j])) for j, parameter in enumerate(free_parameters))
+
+        assert np.isclose(log_prior[i], expected)
+
+        assert np.isclose(m.log_prior(theta[i]), expected)
+
+    # Outside of the support of a prior the log-prior is -inf
+
+    theta[0, 1] = 0.0
+
+    assert m.log_prior(theta)[0] == -np.inf
+
+    # The values of the parameters did not change
+
+    assert [parameter.value for parameter in free_parameters] == original_values
+
+    with pytest.raises(InvalidInput):
+
+        m.log_prior(np.zeros((10, 3)))
+
+
+def test_sample_initial_points():
+
+    pts = _get_point_source("one")
+    pts2 = _get_point_source("two")
+
+    m = Model(pts, pts2)
+
+    pts.spectrum.main.Powerlaw.index.bounds = (-2.05, -1.99)
+    pts2.spectrum.main.Powerlaw.K.min_value = 0.95
+
+    free_parameters = m.free_parameters.values()
+
+    original_values = [parameter.value for parameter in free_parameters]
+
+    points = m.sample_initial_points(1000, variance=0.1, seed=1234)
+
+    assert points.shape == (1000, len(free_parameters))
+
+    # Reproducible
+
+    assert np.all(points == m.sample_initial_points(1000, variance=0.1, seed=1234))
+
+    assert not np.all(points == m.sample_initial_points(1000, variance=0.1, seed=4321))
+
+    # Within the boundaries, and close to the current values
+
+    for j, parameter in enumerate(free_parameters):
+
+        if parameter.min_value is not None:
+
+            assert np.all(points[:, j] >= parameter.min_value)
+
+        if parameter.max_value is not None:
+
+            assert np.all(points[:, j] <= parameter.max_value)
+
+        assert np.all(points[:, j] != parameter.value)
+
+        assert abs(np.median(points[:, j]) - parameter.value) < 0.1 * abs(parameter.value)
+
+    # The values of the parameters did not change
+
+    assert [parameter.value for parameter in free_parameters] == original_values
+
+
+def test_change_notifications():
+
+    from astromodels.parameter import SettingOutOfBounds
+
+    pts = _get_point_source("one")
+    pts2 = _get_point_source("two")
+
+    m = Model(pts, pts2)
+
+    all_changes = []
+    changes_of_two = []
+
+    token = m.subscribe(all_changes.append)
+    token2 = m.subscribe(changes_of_two.append, subtree='two')
+
+    with pytest.raises(InvalidInput):
+
+        m.subscribe(all_changes.append, subtree='three')
+
+    # One notification per assignment
+
+    pts.spectrum.main.Powerlaw.K = 2.0
+
+    assert all_changes == [['one.spectrum.main.Powerlaw.K']]
+    assert changes_of_two == []
+
+    # Assignments which do not change the value are not notified
+
+    pts.spectrum.main.Powerlaw.K = 2.0
+
+    assert len(all_changes) == 1
+
+    # One notification for a batch (each path listed once)
+
+    with m.batch_update():
+
+        pts.spectrum.main.Powerlaw.K = 3.0
+        pts2.spectrum.main.Powerlaw.index = -2.5
+        pts.spectrum.main.Powerlaw.K = 4.0
+
+        assert len(all_changes) == 1
+
+    assert all_changes[-1] == ['one.spectrum.main.Powerlaw.K', 'two.spectrum.main.Powerlaw.index']
+    assert changes_of_two == [['two.spectrum.main.Powerlaw.index']]
+
+    # Bulk setter
+
+    free_parameters = m.free_parameters
+
+    m.set_free_parameters_values([1.5, -1.5, 1.5, -1.5])
+
+    assert all_changes[-1] == free_parameters.keys()
+    assert len(all_changes) == 3
+
+    assert [parameter.value for parameter in free_parameters.values()] == [1.5, -1.5, 1.5, -1.5]
+
+    # Nothing is changed if one value is out of bounds
+
+    with pytest.raises(SettingOutOfBounds):
+
+        m.set_free_parameters_values([2.0, -1.5, 2.0, 1e6])
+
+    assert [parameter.value for parameter in free_parameters.values()] == [1.5, -1.5, 1.5, -1.5]
+
+    # Changes made by new boundaries or by new units are notified as well
+
+    with pytest.warns(RuntimeWarning):
+
+        pts.spectrum.main.Powerlaw.K.max_value = 1.2
+
+    assert all_changes[-1] == ['one.spectrum.main.Powerlaw.K']
+
+    pts.spectrum.main.Powerlaw.K.unit = 1 / (u.MeV * u.cm ** 2 * u.s)
+
+    assert all_changes[-1] == ['one.spectrum.main.Powerlaw.K']
+    assert len(all_changes) == 5
+
+    # Parameters of other models are not notified
+
+    other = _get_point_source("one")
+
+    other.spectrum.main.Powerlaw.K = 5.0
+
+    assert len(all_changes) == 5
+
+    m.unsubscribe(token)
+    m.unsubscribe(token2)
+
+    pts.spectrum.main.Powerlaw.K = 1.0
+
+    assert len(all_changes) == 5
+
+
+def test_trajectory():
+
+    import tempfile
+    import shutil
+
+    from astromodels.trajectory import Trajectory, read_trajectory, TrajectoryFileExists
+
+    pts = _get_point_source("one")
+    pts2 = _get_point_source("two")
+
+    m = Model(pts, pts2)
+
+    directory = tempfile.mkdtemp()
+
+    filename = os.path.join(directory, "chain.traj")
+
+    try:
+
+        trajectory = m.open_trajectory(filename)
+
+        assert trajectory.paths == m.free_parameters.keys()
+        assert len(trajectory) == 0
+
+        rng = np.random.RandomState(0)
+
+        samples = []
+
+        for i in range(100):
+
+            m.set_free_parameters_values([rng.uniform(1, 2), rng.uniform(-3, -1), rng.uniform(1, 2),
+                                          rng.uniform(-3, -1)])
+
+            samples.append([parameter.value for parameter in m.free_parameters.values()])
+
+            trajectory.record()
+
+        trajectory.record_many(samples)
+
+        trajectory.close()
+
+        with pytest.raises(TrajectoryFileExists):
+
+            m.open_trajectory(filename)
+
+        # Read it back
+
+        trajectory = read_trajectory(filename)
+
+        assert len(trajectory) == 200
+
+        assert np.all(trajectory.rows[:100] == np.array(samples))
+        assert np.all(trajectory.rows[100:] == np.array(samples))
+
+        assert np.all(trajectory.get_column('two.spectrum.main.Powerlaw.index') == np.array(samples * 2)[:, 3])
+
+        assert sum(chunk.shape[0] for chunk in trajectory.iterate_chunks(30)) == 200
+
+        # Restore a row
+
+        m.restore_from(trajectory, 10)
+
+        assert [parameter.value for parameter in m.free_parameters.values()] == samples[10]
+
+        # A different model with the same parameters but different units
+
+        pts3 = _get_point_source("one")
+        pts3.spectrum.main.Powerlaw.K.unit = 1 / (u.MeV * u.cm ** 2 * u.s)
+
+        m2 = Model(pts3, _get_point_source("two"))
+
+        m2.restore_from(trajectory, -1)
+
+        assert np.isclose(pts3.spectrum.main.Powerlaw.K.value, samples[-1][0] * 1000.0)
+
+        # Record only some parameters
+
+        with m.open_trajectory(filename, parameters=['one.spectrum.main.Powerlaw.K'], overwrite=True) as trajectory:
+
+            trajectory.record()
+
+            assert trajectory.n_rows == 1
+
+            assert trajectory[0][0] == pts.spectrum.main.Powerlaw.K.value
+
+        # An incomplete row at the end is ignored, and removed before appending new rows
+
+        with open(filename, "ab") as f:
+
+            f.write("abc")
+
+        assert len(read_trajectory(filename)) == 1
+
+        with Trajectory(filename, mode='a', parameters=[pts.spectrum.main.Powerlaw.K]) as trajectory:
+
+            trajectory.record([5.0])
+
+            assert np.all(trajectory.get_column('one.spectrum.main.Powerlaw.K') == [pts.spectrum.main.Powerlaw.K.value,
+                                                                                    5.0])
+
+            # The current value of the parameter given to the constructor
+
+            trajectory.record()
+
+            assert len(trajectory) == 3 and trajectory[-1][0] == pts.spectrum.main.Powerlaw.K.value
+
+        # A trajectory needs at least one parameter
+
+        with pytest.raises(AssertionError):
+
+            Trajectory(filename, paths=[], units=[], mode='w', overwrite=True)
+
+    finally:
+
+        shutil.rmtree(directory)
+
+
+def test_evaluate_over():
+
+    from astromodels.functions.functions import Line, Constant, Cutoff_powerlaw
+
+    pts = _get_point_source("one")
+    pts2 = PointSource("two", ra=1.0, dec=1.0, spectral_shape=Powerlaw() + Cutoff_powerlaw())
+
+    m = Model(pts, pts2)
+
+    time = IndependentVariable("time", 1.0, u.s)
+
+    m.add_independent_variable(time)
+
+    # A simple law, a composite law and a chained link
+
+    m.link(pts.spectrum.main.Powerlaw.K, time, Line(a=0.1, b=1.0))
+    m.link(pts.spectrum.main.Powerlaw.index, time, Line(a=-0.01, b=-2.0) * Constant(k=1.0))
+    m.link(pts2.spectrum.main.composite.K_1, pts.spectrum.main.Powerlaw.K)
+
+    times = np.linspace(0, 10, 11)
+    energies = np.logspace(0, 3, 20)
+
+    original_fluxes = m.get_point_source_fluxes(0, energies) + m.get_point_source_fluxes(1, energies)
+
+    fluxes = m.evaluate_over(time, times, energies)
+
+    assert fluxes.shape == (11, 20)
+
+    # The state of the model did not change
+
+    assert time.value == 1.0
+
+    assert np.allclose(m.get_point_source_fluxes(0, energies) + m.get_point_source_fluxes(1, energies),
+                       original_fluxes)
+
+    # Same as setting the variable and evaluating
+
+    expected = np.zeros((11, 20))
+
+    expected_one = np.zeros((11, 20))
+
+    for i, t in enumerate(times):
+
+        time.value = t
+
+        expected_one[i] = m.get_point_source_fluxes(0, energies)
+
+        expected[i] = expected_one[i] + m.get_point_source_fluxes(1, energies)
+
+    time.value = 1.0
+
+    assert np.allclose(fluxes, expected)
+
+    assert np.allclose(m.evaluate_over('time', times, energies * u.keV, source_name='one'), expected_one)
+
+    with pytest.raises(InvalidInput):
+
+        m.evaluate_over('time', times, energies, source_name='three')
+
+
+def test_evaluate_at():
+
+    from multiprocessing.pool import ThreadPool
+
+    from astromodels.functions.functions import Line
+    from astromodels.sources.point_source_catalog import PointSourceCatalog
+
+    pts = _get_point_source("one")
+    pts2 = _get_point_source("two")
+
+    catalog = PointSourceCatalog("catalog", ["c1", "c2", "c3"], [1.0, 2.0, 3.0], [0.0, 0.0, 0.0], Powerlaw(),
+                                 K=[1.0, 2.0, 3.0])
+
+    # Free a parameter of one of the sources in the catalog
+
+    catalog.get_source("c2").spectrum.main.Powerlaw.K.free = True
+
+    m = Model(pts, pts2, catalog)
+
+    law = Line(a=1.0, b=0.5)
+
+    law.a.fix = True
+    law.b.fix = True
+
+    m.link(pts2.spectrum.main.Powerlaw.index, pts.spectrum.main.Powerlaw.index, law)
+
+    free_parameters = m.free_parameters.values()
+
+    assert len(free_parameters) == 4
+
+    energies = np.logspace(0, 3, 20)
+
+    def get_fluxes():
+
+        return sum(m.get_point_source_fluxes(i, energies) for i in range(m.get_number_of_point_sources()))
+
+    original_values = [parameter.value for parameter in free_parameters]
+    original_fluxes = get_fluxes()
+
+    rng = np.random.RandomState(0)
+
+    thetas = np.column_stack([rng.uniform(0.5, 2, 20), rng.uniform(-2.5, -1.5, 20), rng.uniform(0.5, 2, 20),
+                              rng.uniform(0.5, 2, 20)])
+
+    # Evaluate from many threads at the same time, and all at once
+
+    pool = ThreadPool(4)
+
+    try:
+
+        fluxes = pool.map(lambda theta: m.evaluate_at(theta, energies), thetas)
+
+    finally:
+
+        pool.close()
+
+    fluxes_at_once = m.evaluate_at(thetas, energies)
+
+    # The state of the model did not change
+
+    assert [parameter.value for parameter in free_parameters] == original_values
+    assert np.allclose(get_fluxes(), original_fluxes)
+
+    # Same as setting the values and evaluating
+
+    for i, theta in enumerate(thetas):
+
+        m.set_free_parameters_values(theta)
+
+        expected = get_fluxes()
+
+        assert np.allclose(fluxes[i], expected)
+        assert np.allclose(fluxes_at_once[i], expected)
+
+        assert np.allclose(m.evaluate_at(theta, energies, source_name='two'), m.get_point_source_fluxes(1, energies))
+
+    with pytest.raises(InvalidInput):
+
+        m.evaluate_at([1.0, 2.0], energies)
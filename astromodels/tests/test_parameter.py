@@ -1,10 +1,11 @@
 import pytest
+import pickle
 
 import astropy.units as u
 
 __author__ = 'giacomov'
 
-from astromodels.parameter import Parameter, SettingOutOfBounds, IndependentVariable
+from astromodels.parameter import Parameter, SettingOutOfBounds, IndependentVariable, CircularLink
 from astromodels.functions.functions import Line
 
 
@@ -212,6 +213,45 @@ def test_duplicate():
     assert p1.to_dict() == p2.to_dict()
 
 
+def test_compact_representation():
+
+    p1 = Parameter('test_parameter', 1.0, min_value=-5.0, max_value=5.0, delta=0.2, desc='test', free=False, unit='MeV')
+
+    # Parameters use __slots__, so they have no __dict__
+
+    assert not hasattr(p1, '__dict__')
+
+    # The description is used as documentation
+
+    assert p1.__doc__ == 'test'
+
+    assert Parameter.__doc__.strip().startswith("Implements a numerical parameter")
+
+    # Parameters without children or callbacks share the same (empty) containers
+
+    p2 = p1.duplicate()
+
+    assert p1._children is p2._children
+
+    # ... but they are still independent
+
+    p2.add_auxiliary_variable(Parameter('aux_variable', 1.0), Line())
+
+    p2.add_callback(lambda value: None)
+
+    assert len(p1._children) == 0
+    assert len(p1._callbacks) == 0
+    assert p2.Line.a.value == 1.0
+
+    # Make sure that pickling works
+
+    for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+
+        p3 = pickle.loads(pickle.dumps(p1, protocol))
+
+        assert p3.to_dict() == p1.to_dict()
+
+
 def test_get_randomized_value():
 
     # Test randomization no boundaries (normal distribution)
@@ -315,4 +355,60 @@ def test_remove_auxiliary_variable():
 
     p1.value = -1.0
 
-    assert p1.value == -1.0
\ No newline at end of file
+    assert p1.value == -1.0
+
+def test_chained_auxiliary_variables():
+
+    t = Parameter('time', 1.0)
+
+    p1 = Parameter('p1', 1.0)
+    p2 = Parameter('p2', 1.0)
+
+    # p2 = 2 t + 1
+
+    law2 = Line()
+    law2.a = 2.0
+    law2.b = 1.0
+
+    p2.add_auxiliary_variable(t, law2)
+
+    # p1 = 3 p2 + 0
+
+    law1 = Line()
+    law1.a = 3.0
+    law1.b = 0.0
+
+    p1.add_auxiliary_variable(p2, law1)
+
+    assert p1.value == 9.0
+
+    t.value = 2.0
+
+    assert p2.value == 5.0
+    assert p1.value == 15.0
+
+    # Changing a parameter of a law must also be propagated
+
+    law2.b = 0.0
+
+    assert p1.value == 12.0
+
+
+def test_circular_auxiliary_variables():
+
+    p1 = Parameter('p1', 1.0)
+    p2 = Parameter('p2', 1.0)
+
+    p2.add_auxiliary_variable(p1, Line())
+
+    with pytest.raises(CircularLink):
+
+        p1.add_auxiliary_variable(p2, Line())
+
+    with pytest.raises(CircularLink):
+
+        p1.add_auxiliary_variable(p1, Line())
+
+    # The failed attempts must not have created any link
+
+    assert p1.has_auxiliary_variable() == False
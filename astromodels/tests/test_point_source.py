@@ -4,6 +4,10 @@ import astropy.units as u
 import numpy as np
 
 from astromodels.sources.point_source import PointSource
+from astromodels.sources.point_source_catalog import PointSourceCatalog
+from astromodels.model import Model
+from astromodels.model_parser import clone_model
+from astromodels.parameter import SettingOutOfBounds
 from astromodels.spectral_component import SpectralComponent
 from astromodels.functions.functions import Powerlaw, Exponential_cutoff, Blackbody, Band
 
@@ -237,4 +241,213 @@ def test_call_with_composite_function_with_units():
 
         spectrum = XS_phabs() * XS_powerlaw() * XS_phabs() + XS_powerlaw()
 
-        one_test(spectrum)
\ No newline at end of file
+        one_test(spectrum)
+
+def test_sky_direction_conversions():
+
+    from astropy.coordinates import SkyCoord
+    from astromodels.sky_direction import SkyDirection
+    from astromodels.utils.angular_distance import angular_distance
+    from astromodels.utils.coordinate_transforms import rotate_coordinates
+
+    # The rotation matrices must agree with astropy to better than 1 milliarcsecond
+
+    one_mas = 1.0 / 3600.0 / 1000.0
+
+    np.random.seed(0)
+
+    lon = np.random.uniform(0, 360, 1000)
+    lat = np.rad2deg(np.arcsin(np.random.uniform(-1, 1, 1000)))
+
+    for from_frame, to_frame in [('icrs', 'galactic'), ('galactic', 'icrs'), ('icrs', 'fk5'), ('fk5', 'galactic')]:
+
+        new_lon, new_lat = rotate_coordinates(lon, lat, from_frame, to_frame)
+
+        expected = SkyCoord(lon, lat, frame=from_frame, unit='deg').transform_to(to_frame).spherical
+
+        assert np.all(angular_distance(new_lon, new_lat, expected.lon.deg, expected.lat.deg) < one_mas)
+
+        assert np.all((new_lon >= 0) & (new_lon < 360))
+
+    # SkyDirection keeps the converted position and the SkyCoord until the coordinates change
+
+    direction = SkyDirection(ra=125.6, dec=-75.3)
+
+    sky_coord = direction.sky_coord
+
+    assert direction.sky_coord is sky_coord
+
+    l, b = direction.get_l(), direction.get_b()
+
+    direction.ra.value = 10.0
+
+    assert direction.sky_coord is not sky_coord
+
+    expected = SkyCoord(ra=10.0, dec=-75.3, frame='icrs', unit='deg').galactic
+
+    assert angular_distance(direction.get_l(), direction.get_b(), expected.l.deg, expected.b.deg) < one_mas
+
+    assert (direction.get_l(), direction.get_b()) != (l, b)
+
+
+def test_point_source_catalog():
+
+    names = ['src%i' % i for i in range(5)]
+    ra = np.linspace(10.0, 50.0, 5)
+    dec = np.linspace(-20.0, 20.0, 5)
+    K = np.linspace(1.0, 5.0, 5)
+    index = np.linspace(-1.5, -2.5, 5)
+
+    catalog = PointSourceCatalog('cat', names, ra, dec, Powerlaw(), K=K, index=index)
+
+    assert catalog.n_sources == 5
+
+    energies = np.logspace(0, 3, 20)
+
+    # The batched evaluation must agree with the evaluation of the single sources
+
+    fluxes = catalog(energies)
+
+    assert fluxes.shape == (5, 20)
+
+    for i in range(5):
+
+        this_source = PointSource(names[i], ra[i], dec[i], spectral_shape=Powerlaw(K=K[i], index=index[i]))
+
+        assert np.allclose(fluxes[i], this_source(energies))
+
+    # Values out of the bounds of the parameters are refused
+
+    with pytest.raises(Exception):
+
+        PointSourceCatalog('cat2', names, ra, dec, Powerlaw(), index=np.linspace(-20, 0, 5))
+
+    # Model accessors
+
+    pts = PointSource('single', 5.0, 5.0, spectral_shape=Powerlaw())
+
+    model = Model(pts, catalog)
+
+    assert model.get_number_of_point_sources() == 6
+    assert model.get_point_source_name(3) == 'src2'
+    assert np.allclose(model.get_point_source_position(3), (ra[2], dec[2]))
+    assert np.allclose(model.get_point_source_fluxes(3, energies), fluxes[2])
+    assert np.allclose(model.get_point_source_fluxes(0, energies), pts(energies))
+
+    # The fluxes of a source in a catalog can be modified by the caller (as those of a point source), without
+    # changing the cache of the catalog
+
+    source_fluxes = model.get_point_source_fluxes(3, energies)
+
+    source_fluxes *= 2.0
+
+    assert np.allclose(model.get_point_source_fluxes(3, energies), fluxes[2])
+
+    # The parameters of the catalog are fixed, until a view is used to free them
+
+    n_free = len(model.free_parameters)
+
+    view = catalog.get_source('src3')
+
+    view.spectrum.main.Powerlaw.index.free = True
+
+    assert len(model.free_parameters) == n_free + 1
+    assert 'cat.src3.spectrum.main.Powerlaw.index' in model.free_parameters
+
+    # Changing the view changes the flux of that source only
+
+    view.spectrum.main.Powerlaw.index.value = -3.0
+
+    new_fluxes = model.get_point_source_fluxes(4, energies)
+
+    assert np.allclose(new_fluxes, PointSource('test', 0.0, 0.0,
+                                               spectral_shape=Powerlaw(K=K[3], index=-3.0))(energies))
+
+    assert np.allclose(model.get_point_source_fluxes(5, energies), fluxes[4])
+
+    # Link a parameter of a view to the single source, and clone the model
+
+    model.link(catalog.get_source('src0').spectrum.main.Powerlaw.K, pts.spectrum.main.Powerlaw.K)
+
+    pts.spectrum.main.Powerlaw.K.value = 3.3
+
+    new_model = clone_model(model)
+
+    new_catalog = new_model.point_source_catalogs['cat']
+
+    assert new_catalog.names == names
+    assert np.allclose(new_catalog.ra, ra)
+    assert new_model.free_parameters.keys() == model.free_parameters.keys()
+    assert new_model.linked_parameters.keys() == model.linked_parameters.keys()
+
+    for i in range(6):
+
+        assert np.allclose(new_model.get_point_source_fluxes(i, energies), model.get_point_source_fluxes(i, energies))
+
+
+def test_many_point_sources():
+
+    names = ['src%i' % i for i in range(10)]
+    ra = np.linspace(0.0, 350.0, 10)
+    dec = np.linspace(-80.0, 80.0, 10)
+    K = np.linspace(1.0, 10.0, 10)
+
+    sources = PointSource.many(names, ra, dec, Powerlaw, K=K, index=-2.5)
+
+    assert len(sources) == 10
+
+    energies = np.logspace(0, 3, 10)
+
+    for i, source in enumerate(sources):
+
+        reference = PointSource(names[i], ra=ra[i], dec=dec[i], spectral_shape=Powerlaw(K=K[i], index=-2.5))
+
+        assert source.name == names[i]
+        assert source.position.get_ra() == ra[i]
+        assert source.position.get_dec() == dec[i]
+        assert source.to_dict() == reference.to_dict()
+        assert np.allclose(source(energies), reference(energies))
+
+    # The sources are independent of each other
+
+    sources[3].spectrum.main.Powerlaw.index.value = -1.0
+
+    assert sources[4].spectrum.main.Powerlaw.index.value == -2.5
+
+    assert sources[3].spectrum.main.Powerlaw.index._get_parent() is sources[3].spectrum.main.Powerlaw
+
+    # Each function has its own identifier, so they can be combined in composite functions
+
+    assert len(set(source.spectrum.main.Powerlaw.uuid for source in sources)) == 10
+
+    composite = sources[1].spectrum.main.Powerlaw + sources[2].spectrum.main.Powerlaw
+
+    assert np.allclose(composite(energies), sources[1](energies) + sources[2](energies))
+
+    # Vectorized checks of the inputs
+
+    with pytest.raises(SettingOutOfBounds):
+
+        PointSource.many(names, ra, dec, Powerlaw, index=np.linspace(-20.0, 0.0, 10))
+
+    with pytest.raises(SettingOutOfBounds):
+
+        PointSource.many(names, ra + 20.0, dec, Powerlaw)
+
+    with pytest.raises(AssertionError):
+
+        PointSource.many(['a', 'a'], [0.0, 1.0], [0.0, 1.0], Powerlaw)
+
+    with pytest.raises(AssertionError):
+
+        PointSource.many(['a', 'b c'], [0.0, 1.0], [0.0, 1.0], Powerlaw)
+
+    # A model from arrays
+
+    model = Model.from_arrays(names, ra, dec, Powerlaw, K=K)
+
+    assert model.get_number_of_point_sources() == 10
+
+    assert model.free_parameters.keys()[:2] == ['src0.spectrum.main.Powerlaw.K', 'src0.spectrum.main.Powerlaw.index']
+
+    assert np.allclose(model.get_point_source_fluxes(5, energies), Powerlaw(K=K[5])(energies))
@@ -0,0 +1,337 @@
+__author__ = 'giacomov'
+
+import collections
+import json
+import os
+import struct
+
+import numpy as np
+
+
+# Format of a trajectory file:
+#
+#   - 8 bytes: the magic string _MAGIC
+#   - 8 bytes: length of the header (unsigned 64 bit integer, little endian)
+#   - the header: a JSON dictionary with the paths and the units of the parameters, padded with spaces to a
+#     multiple of 8 bytes
+#   - the rows: one float64 (little endian) for each parameter, one row after the other
+#
+# Rows are only appended, so the number of rows is given by the size of the file. An incomplete row at the end of
+# the file (for example if the program writing it was killed) is ignored when reading, and removed when the file is
+# opened to append new rows (otherwise all the new rows would be misaligned).
+
+_MAGIC = 'AMTRAJ01'
+
+_DTYPE = np.dtype('<f8')
+
+_FORMAT_VERSION = 1
+
+
+class TrajectoryFileExists(IOError):
+    pass
+
+
+class InvalidTrajectoryFile(IOError):
+    pass
+
+
+class Trajectory(object):
+    """
+    An append-only store of the values of a set of parameters (for example the samples of a Markov chain), on disk.
+    The rows are accessed through a memory map, so that the memory needed does not depend on the length of the
+    trajectory: only the rows actually used are read from disk.
+
+    Use Model.open_trajectory to create a trajectory for the parameters of a model, read_trajectory to open an
+    existing one and Model.restore_from to set the parameters to the values in one row.
+
+        >>> trajectory = model.open_trajectory("chain.traj")
+        >>> for i in range(n_steps):
+        ...     (...step...)
+        ...     trajectory.record()
+        >>> trajectory.close()
+        >>> trajectory = read_trajectory("chain.traj")
+        >>> model.restore_from(trajectory, -1)
+
+    :param filename: name of the file
+    :param paths: paths of the parameters (only needed to create a new file)
+    :param units: units of the parameters, as strings (only needed to create a new file)
+    :param mode: 'r' to read an existing file, 'a' to append rows to an existing file, 'w' to create a new file
+    :param overwrite: whether an existing file can be overwritten (only for mode='w')
+    :param parameters: instances of Parameter (one for each path, in the same order) whose current values are
+    recorded when record() is called without arguments (see Model.open_trajectory)
+    """
+
+    def __init__(self, filename, paths=None, units=None, mode='r', overwrite=False, parameters=None):
+
+        assert mode in ('r', 'a', 'w'), "The mode must be 'r', 'a' or 'w'"
+
+        self._filename = os.path.abspath(os.path.expandvars(os.path.expanduser(filename)))
+
+        if mode == 'w':
+
+            assert paths is not None and units is not None, "You need to provide the paths and the units to create " \
+                                                            "a new trajectory"
+
+            assert len(paths) > 0, "A trajectory needs at least one parameter"
+
+            assert len(paths) == len(units), "You need to provide one unit for each path"
+
+            if os.path.exists(self._filename) and not overwrite:
+
+                raise TrajectoryFileExists("The file %s exists already. If you want to overwrite it, use the "
+                                           "'overwrite=True' option" % self._filename)
+
+            self._write_header(list(paths), [str(unit) for unit in units])
+
+        self._paths, self._units, self._data_offset = self._read_header()
+
+        self._n_parameters = len(self._paths)
+
+        if self._n_parameters == 0:
+
+            raise InvalidTrajectoryFile("The trajectory %s does not contain any parameter" % self._filename)
+
+        self._row_size = self._n_parameters * _DTYPE.itemsize
+
+        # Parameters whose values are recorded when record() is called without arguments
+
+        if parameters is not None:
+
+            parameters = list(parameters)
+
+            assert len(parameters) == self._n_parameters, "You need to provide one parameter for each path"
+
+        self._parameters = parameters
+
+        if mode != 'r':
+
+            self._remove_incomplete_row()
+
+            self._file = open(self._filename, 'ab')
+
+        else:
+
+            self._file = None
+
+        # Memory map of the rows, as (number of rows, memory map). It is created again when rows are added
+
+        self._memory_map = (0, np.empty((0, self._n_parameters), dtype=_DTYPE))
+
+    def _write_header(self, paths, units):
+
+        header = json.dumps(collections.OrderedDict([('version', _FORMAT_VERSION),
+                                                     ('paths', paths),
+                                                     ('units', units)]))
+
+        # Pad the header so that the rows are aligned to 8 bytes
+
+        header += ' ' * (-len(header) % 8)
+
+        with open(self._filename, 'wb') as f:
+
+            f.write(_MAGIC)
+            f.write(struct.pack('<Q', len(header)))
+            f.write(header)
+
+    def _remove_incomplete_row(self):
+
+        # Truncate the file at the end of the last complete row
+
+        data_size = os.path.getsize(self._filename) - self._data_offset
+
+        if data_size % self._row_size != 0:
+
+            with open(self._filename, 'r+b') as f:
+
+                f.truncate(self._data_offset + (data_size // self._row_size) * self._row_size)
+
+    def _read_header(self):
+
+        with open(self._filename, 'rb') as f:
+
+            magic = f.read(len(_MAGIC))
+
+            if magic != _MAGIC:
+
+                raise InvalidTrajectoryFile("%s is not a trajectory file" % self._filename)
+
+            header_length = struct.unpack('<Q', f.read(8))[0]
+
+            try:
+
+                header = json.loads(f.read(header_length))
+
+            except ValueError:
+
+                raise InvalidTrajectoryFile("The header of %s is corrupted" % self._filename)
+
+        if header['version'] > _FORMAT_VERSION:
+
+            raise InvalidTrajectoryFile("The trajectory %s was written with a newer version of astromodels"
+                                        % self._filename)
+
+        return [str(path) for path in header['paths']], [str(unit) for unit in header['units']], \
+            len(_MAGIC) + 8 + header_length
+
+    @property
+    def filename(self):
+        """
+        Name of the file
+        """
+
+        return self._filename
+
+    @property
+    def paths(self):
+        """
+        Paths of the parameters, in the same order as the columns
+        """
+
+        return list(self._paths)
+
+    @property
+    def units(self):
+        """
+        Units of the parameters (as strings), in the same order as the columns
+        """
+
+        return list(self._units)
+
+    @property
+    def n_rows(self):
+        """
+        Number of rows in the trajectory
+        """
+
+        if self._file is not None:
+
+            self._file.flush()
+
+        return (os.path.getsize(self._filename) - self._data_offset) // self._row_size
+
+    def __len__(self):
+
+        return self.n_rows
+
+    def record(self, values=None):
+        """
+        Append one row to the trajectory
+
+        :param values: the values of the parameters, in the same order as paths. If the trajectory was created with
+        the parameters (as done by Model.open_trajectory), this can be omitted to record their current values
+        :return: (none)
+        """
+
+        if values is None:
+
+            assert self._parameters is not None, "You need to provide the values, as this trajectory was created " \
+                                                 "without parameters"
+
+            values = [parameter.value for parameter in self._parameters]
+
+        self.record_many(np.array(values, ndmin=2))
+
+    def record_many(self, values):
+        """
+        Append many rows to the trajectory with one write
+
+        :param values: matrix with shape (n_rows, n_parameters)
+        :return: (none)
+        """
+
+        assert self._file is not None, "The trajectory %s is open in read-only mode" % self._filename
+
+        values = np.asarray(values, dtype=_DTYPE)
+
+        assert values.ndim == 2 and values.shape[1] == self._n_parameters, "The values must have shape " \
+                                                                           "(n_rows, %s)" % self._n_parameters
+
+        self._file.write(values.tobytes())
+
+    @property
+    def rows(self):
+        """
+        The rows of the trajectory, as a read-only matrix with shape (n_rows, n_parameters) mapped from the file (the
+        rows are read from disk only when used). The matrix does not include the rows recorded after this call.
+        """
+
+        n_rows = self.n_rows
+
+        if n_rows != self._memory_map[0]:
+
+            if n_rows == 0:
+
+                memory_map = np.empty((0, self._n_parameters), dtype=_DTYPE)
+
+            else:
+
+                memory_map = np.memmap(self._filename, dtype=_DTYPE, mode='r', offset=self._data_offset,
+                                       shape=(n_rows, self._n_parameters))
+
+            self._memory_map = (n_rows, memory_map)
+
+        return self._memory_map[1]
+
+    def __getitem__(self, item):
+
+        return self.rows[item]
+
+    def get_column(self, path):
+        """
+        Returns the values of one parameter in all the rows
+
+        :param path: path of the parameter
+        :return: an array (mapped from the file)
+        """
+
+        return self.rows[:, self._paths.index(path)]
+
+    def iterate_chunks(self, chunk_size=100000):
+        """
+        Iterate over the rows in chunks, so that even very long trajectories can be processed with constant memory
+
+        :param chunk_size: number of rows in each chunk
+        :return: a generator of matrices with shape (chunk_size, n_parameters) (the last one might be shorter)
+        """
+
+        rows = self.rows
+
+        for start in xrange(0, rows.shape[0], chunk_size):
+
+            yield np.array(rows[start: start + chunk_size])
+
+    def close(self):
+        """
+        Close the file (the rows can still be read)
+
+        :return: (none)
+        """
+
+        if self._file is not None:
+
+            self._file.close()
+
+            self._file = None
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+
+        self.close()
+
+    def __repr__(self):
+
+        return "Trajectory %s: %i parameters, %i rows" % (self._filename, self._n_parameters, self.n_rows)
+
+
+def read_trajectory(filename):
+    """
+    Open an existing trajectory in read-only mode
+
+    :param filename: name of the file
+    :return: an instance of Trajectory
+    """
+
+    return Trajectory(filename, mode='r')
@@ -2,8 +2,10 @@ __author__ = 'giacomov'
 
 import collections
 
+import astropy.units as u
+
 from astromodels.utils.io import display
-from astromodels.dual_access_class import DualAccessClass
+from astromodels.dual_access_class import DualAccessClass, _get_slot_names
 from astromodels.utils.valid_variable import is_valid_variable_name
 
 
@@ -11,11 +13,85 @@ class DuplicatedNode(Exception):
     pass
 
 
+class _NoChildren(collections.OrderedDict):
+    """
+    The empty dictionary of children shared by all the nodes without children (for example most parameters). A node
+    gets its own dictionary only when the first child is added (see Node._add_child), so this is never modified.
+    Copying or pickling a node keeps it shared.
+    """
+
+    def __copy__(self):
+
+        return self
+
+    def __deepcopy__(self, memo):
+
+        return self
+
+    def __reduce__(self):
+
+        return '_no_children'
+
+
+_no_children = _NoChildren()
+
+
+# Types of the attributes which can be shared between a node and its clones (see Node._clone_tree)
+
+_immutable_types = (type(None), bool, int, long, float, str, unicode, u.UnitBase)
+
+# Slots copied by clone_from_recipe for each class (the slots describing the tree are set separately)
+
+_clone_slot_names_cache = {}
+
+
+def _get_clone_slot_names(cls):
+
+    slot_names = _clone_slot_names_cache.get(cls)
+
+    if slot_names is None:
+
+        slot_names = [name for name in _get_slot_names(cls)
+                      if name not in ('_Node__children', '_Node__parent', '_lookup_dictionary')]
+
+        _clone_slot_names_cache[cls] = slot_names
+
+    return slot_names
+
+
+def _is_shareable(value, subtree_ids):
+
+    # Returns whether the value can be shared between a node and its clones, or remapped to the cloned nodes
+
+    if isinstance(value, _immutable_types):
+
+        return True
+
+    if isinstance(value, Node):
+
+        # Nodes are replaced by their clones, so they must be part of the tree being cloned
+
+        return id(value) in subtree_ids
+
+    if isinstance(value, tuple):
+
+        return all(_is_shareable(item, subtree_ids) and not isinstance(item, Node) for item in value)
+
+    if isinstance(value, dict):
+
+        return all(isinstance(key, _immutable_types) and _is_shareable(item, subtree_ids)
+                   for key, item in value.iteritems())
+
+    return False
+
+
 class Node(DualAccessClass):
 
+    __slots__ = ('__children', '__parent', '_name')
+
     def __init__(self, name):
 
-        self.__children = collections.OrderedDict()
+        self.__children = _no_children
         self.__parent = None
 
         assert is_valid_variable_name(name), "Illegal characters in name %s. You can only use letters and numbers, " \
@@ -45,7 +121,8 @@ class Node(DualAccessClass):
 
     def _reset_node(self):
 
-        self.__children = collections.OrderedDict()
+        self.__children = _no_children
+        self._lookup_dictionary = self.__children
         self.__parent = None
 
     def _add_children(self, children):
@@ -66,6 +143,13 @@ class Node(DualAccessClass):
 
             raise DuplicatedNode("You cannot use the same name (%s) for different nodes" % name)
 
+        if not self.__children:
+
+            # Create the dictionary of the children (until now this node was using the shared empty one)
+
+            self.__children = collections.OrderedDict()
+            self._lookup_dictionary = self.__children
+
         self.__children[name] = new_child
 
         # Add also an attribute with the name of the new child, to allow access with a syntax like
@@ -187,25 +271,236 @@ class Node(DualAccessClass):
 
         instances = collections.OrderedDict()
 
-        for child_name, child in self._children.iteritems():
+        # The paths are built while going down the tree, instead of going up to the root for each instance
+
+        path = ".".join(self._get_path())
+
+        self._collect_instances(cls, path + "." if path else "", instances)
+
+        return instances
+
+    def _collect_instances(self, cls, prefix, instances):
+
+        for child in self.__children.itervalues():
+
+            child_path = prefix + child._name
 
             if isinstance(child, cls):
 
-                key_name = ".".join(child._get_path())
+                instances[child_path] = child
 
-                instances[key_name] = child
+            # Now check if the child has children, and if it does go deeper in the tree
 
-                # Now check if the instance has children,
-                # and if it does go deeper in the tree
+            # NOTE: an empty dictionary evaluate as False
 
-                # NOTE: an empty dictionary evaluate as False
+            if child._children:
 
-                if child._children:
+                child._collect_instances(cls, child_path + ".", instances)
 
-                    instances.update(child._find_instances(cls))
+    def _clone_tree(self, name=None):
+        """
+        Returns a copy of this node and of all the nodes below it, which is not attached to any parent. The attributes
+        which are not nodes are shared with the original, so this can be used only when _can_clone_tree returns True.
+        This is much faster than a deepcopy. To make many copies of the same tree use _get_clone_recipe and
+        clone_from_recipe, which is even faster (see PointSource.many).
 
-            else:
+        :param name: name for the copy (default: the name of this node)
+        :return: the new node
+        """
 
-                instances.update(child._find_instances(cls))
+        overrides = []
 
-        return instances
+        if name is not None:
+
+            assert is_valid_variable_name(name), "Illegal characters in name %s. You can only use letters and " \
+                                                 "numbers, and + and - (but the name cannot start with -)" % name
+
+            overrides.append((0, '_name', name))
+
+        return clone_from_recipe(self._get_clone_recipe(), overrides)[0]
+
+    def _get_clone_recipe(self):
+        """
+        Returns the instructions to build copies of this node and of the nodes below it (see clone_from_recipe). The
+        nodes are listed depth-first, starting from this node, in the same order as _get_subtree. Use this only
+        when _can_clone_tree returns True.
+
+        :return: the recipe (a list with one element per node)
+        """
+
+        subtree = self._get_subtree()
+
+        index_of = dict((id(node), i) for i, node in enumerate(subtree))
+
+        recipe = []
+
+        for node in subtree:
+
+            # Attributes are stored either as values to be shared (slots and the others separately), or as indexes of
+            # the nodes they refer to, or as dictionaries of nodes to be rebuilt
+
+            shared_slots = []
+            shared_state = {}
+            node_references = []
+            node_dictionaries = []
+
+            attributes = []
+
+            for name in _get_clone_slot_names(type(node)):
+
+                try:
+
+                    attributes.append((name, object.__getattribute__(node, name), True))
+
+                except AttributeError:
+
+                    # Slot not set
+
+                    continue
+
+            for name, value in getattr(node, '__dict__', {}).iteritems():
+
+                attributes.append((name, value, False))
+
+            for name, value, is_slot in attributes:
+
+                if isinstance(value, Node):
+
+                    node_references.append((name, index_of[id(value)]))
+
+                elif isinstance(value, dict) and not isinstance(value, _NoChildren) and \
+                        any(isinstance(item, Node) for item in value.itervalues()):
+
+                    node_dictionaries.append((name, type(value),
+                                              [(key, index_of[id(item)]) for key, item in value.iteritems()]))
+
+                elif is_slot:
+
+                    shared_slots.append((name, value))
+
+                else:
+
+                    shared_state[name] = value
+
+            children = [(key, index_of[id(child)]) for key, child in node._children.iteritems()]
+
+            recipe.append((type(node), shared_slots, shared_state, node_references, node_dictionaries, children))
+
+        return recipe
+
+    def _get_subtree(self):
+
+        # Returns a list with this node and all the nodes below it (depth-first)
+
+        nodes = [self]
+
+        for child in self.__children.itervalues():
+
+            nodes.extend(child._get_subtree())
+
+        return nodes
+
+    def _can_clone_tree(self):
+        """
+        Returns whether this node and the nodes below it can be copied with _clone_tree, i.e., whether their state is
+        made only of immutable objects, nodes in the same tree, and dictionaries of these
+
+        :return: True or False
+        """
+
+        subtree = self._get_subtree()
+
+        subtree_ids = set(id(node) for node in subtree)
+
+        for node in subtree:
+
+            shared_attributes = getattr(node, '_shared_attributes', ())
+
+            for name in _get_clone_slot_names(type(node)):
+
+                try:
+
+                    value = object.__getattribute__(node, name)
+
+                except AttributeError:
+
+                    # Slot not set
+
+                    continue
+
+                if name not in shared_attributes and not _is_shareable(value, subtree_ids):
+
+                    return False
+
+            for name, value in getattr(node, '__dict__', {}).iteritems():
+
+                if name not in shared_attributes and not _is_shareable(value, subtree_ids):
+
+                    return False
+
+        return True
+
+
+def clone_from_recipe(recipe, overrides=()):
+    """
+    Build a copy of a tree of nodes from the recipe returned by Node._get_clone_recipe. The attributes which are not
+    nodes are shared with the original tree.
+
+    :param recipe: the recipe
+    :param overrides: a list of (index of the node, attribute name, value) to be set in place of the attributes of
+    the original tree (for example (0, '_name', 'new_name') to change the name of the root). No check is performed
+    on the values.
+    :return: the list of the new nodes (in the same order as the recipe), the first one being the root
+    """
+
+    set_attribute = object.__setattr__
+
+    new_nodes = [object.__new__(cls) for cls, _, _, _, _, _ in recipe]
+
+    # Bypass __setattr__ (see DualAccessClass), since the nodes are being built from scratch
+
+    for new_node, (_, shared_slots, shared_state, node_references, node_dictionaries, children) in \
+            zip(new_nodes, recipe):
+
+        for name, value in shared_slots:
+
+            set_attribute(new_node, name, value)
+
+        if shared_state:
+
+            new_node.__dict__.update(shared_state)
+
+        for name, index in node_references:
+
+            set_attribute(new_node, name, new_nodes[index])
+
+        for name, dictionary_type, items in node_dictionaries:
+
+            set_attribute(new_node, name, dictionary_type((key, new_nodes[index]) for key, index in items))
+
+        if children:
+
+            new_children = collections.OrderedDict()
+
+            for key, index in children:
+
+                new_children[key] = new_nodes[index]
+
+                set_attribute(new_nodes[index], '_Node__parent', new_node)
+
+        else:
+
+            new_children = _no_children
+
+        set_attribute(new_node, '_Node__children', new_children)
+        set_attribute(new_node, '_lookup_dictionary', new_children)
+
+    # The root is not attached to any parent
+
+    set_attribute(new_nodes[0], '_Node__parent', None)
+
+    for index, name, value in overrides:
+
+        set_attribute(new_nodes[index], name, value)
+
+    return new_nodes
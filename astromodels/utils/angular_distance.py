@@ -31,3 +31,38 @@ def angular_distance(ra1, dec1, ra2, dec2):
     denominator = slat1 * slat2 + clat1 * clat2 * cdlon
 
     return np.rad2deg(np.arctan2(np.sqrt(num1 ** 2 + num2 ** 2), denominator))
+
+
+def select_points_inside_circle(lon, lat, lon0, lat0, radius):
+    """
+    Returns the indexes of the points within the given angular distance from (lon0, lat0). Points which are clearly
+    outside are discarded with a cheap test on latitude and longitude, so that the angular distance is computed only
+    for the points close to the circle.
+
+    :param lon: array of longitudes (deg)
+    :param lat: array of latitudes (deg)
+    :param lon0: longitude of the center (deg)
+    :param lat0: latitude of the center (deg)
+    :param radius: radius of the circle (deg)
+    :return: array of indexes (sorted)
+    """
+
+    lon = np.asarray(lon, dtype=float).reshape(-1)
+    lat = np.asarray(lat, dtype=float).reshape(-1)
+
+    candidates = np.flatnonzero(np.abs(lat - lat0) <= radius)
+
+    # If the circle does not contain a pole, its half-width in longitude is arcsin(sin(radius) / cos(lat0)). A small
+    # margin accounts for rounding errors, the exact test is done later
+
+    if np.abs(lat0) + radius < 90.0:
+
+        max_delta_lon = np.rad2deg(np.arcsin(min(1.0, np.sin(np.deg2rad(radius)) / np.cos(np.deg2rad(lat0))))) + 1e-6
+
+        delta_lon = (lon[candidates] - lon0 + 180.0) % 360.0 - 180.0
+
+        candidates = candidates[np.abs(delta_lon) <= max_delta_lon]
+
+    angsep = angular_distance(lon0, lat0, lon[candidates], lat[candidates])
+
+    return candidates[angsep <= radius]
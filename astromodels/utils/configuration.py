@@ -17,4 +17,19 @@ def get_user_data_path():
 
         os.makedirs(user_data)
 
-        return user_data
\ No newline at end of file
+        return user_data
+
+def get_user_cache_path():
+
+    user_cache = os.path.join(os.path.expanduser('~'), '.astromodels', 'cache')
+
+    # Create it if doesn't exist
+    if os.path.exists(user_cache):
+
+        return user_cache
+
+    else:
+
+        os.makedirs(user_cache)
+
+        return user_cache
@@ -0,0 +1,286 @@
+import collections
+import zlib
+
+import numpy as np
+from astropy.coordinates import SkyCoord, BaseCoordinateFrame, frame_transform_graph, FK5
+from astropy.time import Time
+
+
+# Maximum number of transformed grids kept in memory. Each entry holds two arrays of float64 with the same size as
+# the input grid
+
+max_cached_transforms = 8
+
+# Cache of the transformed coordinates (least recently used entries are removed first)
+
+_transform_cache = collections.OrderedDict()
+
+
+# Frames which are related by a fixed rotation, and can then be handled by rotate_coordinates. FK5 is supported only
+# with the J2000 equinox
+
+rotation_frames = ('icrs', 'fk5', 'galactic')
+
+# Rotation matrices between the frames above (computed when needed)
+
+_rotation_matrices = {}
+
+
+def clear_transform_cache():
+    """
+    Remove all the transformed coordinates from the cache
+
+    :return: (none)
+    """
+
+    _transform_cache.clear()
+
+
+def get_grid_fingerprint(lon, lat):
+    """
+    Returns a string identifying the content of the provided grid of coordinates (two grids with the same
+    content have the same fingerprint)
+
+    :param lon: array of longitudes
+    :param lat: array of latitudes
+    :return: a string
+    """
+
+    # CRC32 is used instead of a cryptographic hash because it is much faster (hashing the grid must cost much less
+    # than transforming it). Using one checksum for each coordinate makes collisions very unlikely
+
+    fingerprint = []
+
+    for array in (lon, lat):
+
+        array = np.ascontiguousarray(array, dtype=float)
+
+        fingerprint.append("%s:%08x" % ("x".join(map(str, array.shape)), zlib.crc32(array.data) & 0xffffffff))
+
+    return "/".join(fingerprint)
+
+
+def _get_frame_key(frame):
+
+    # Returns a hashable representation of the frame, including its attributes (like the equinox)
+
+    if isinstance(frame, basestring):
+
+        # Use an instance with the default attributes, so that the name and the instance give the same key
+
+        frame_class = frame_transform_graph.lookup_name(frame)
+
+        assert frame_class is not None, "Unknown frame %s" % frame
+
+        frame = frame_class()
+
+    assert isinstance(frame, BaseCoordinateFrame), "Frames must be strings or instances of astropy frames"
+
+    attributes = tuple((name, str(getattr(frame, name))) for name in sorted(frame.get_frame_attr_names()))
+
+    return frame.name, attributes
+
+
+def _get_rotation_frame_name(frame):
+
+    # Returns the name of the frame if the frame is one of those supported by rotate_coordinates, None otherwise
+
+    if isinstance(frame, basestring):
+
+        frame_class = frame_transform_graph.lookup_name(frame)
+
+        assert frame_class is not None, "Unknown frame %s" % frame
+
+        frame = frame_class()
+
+    if frame.name not in rotation_frames:
+
+        return None
+
+    if isinstance(frame, FK5) and frame.equinox != Time('J2000', scale='utc'):
+
+        return None
+
+    return frame.name
+
+
+def get_rotation_matrix(from_frame, to_frame):
+    """
+    Returns the 3x3 matrix which rotates unit vectors from one frame to another. The frames must be among those
+    listed in rotation_frames. The matrix is computed with astropy by transforming the axes of the first frame,
+    and then kept in memory.
+
+    :param from_frame: name of the initial frame
+    :param to_frame: name of the final frame
+    :return: a 3x3 array (read-only)
+    """
+
+    key = (from_frame, to_frame)
+
+    try:
+
+        return _rotation_matrices[key]
+
+    except KeyError:
+
+        assert from_frame in rotation_frames and to_frame in rotation_frames, \
+            "Rotations are supported only among %s" % ",".join(rotation_frames)
+
+        # The images of the x, y and z axes are the columns of the matrix
+
+        axes = SkyCoord([0.0, 90.0, 0.0], [0.0, 0.0, 90.0], frame=from_frame, unit="deg").transform_to(to_frame)
+
+        matrix = np.array(axes.cartesian.xyz.value, dtype=float)
+
+        matrix.flags.writeable = False
+
+        _rotation_matrices[key] = matrix
+
+        return matrix
+
+
+def rotate_coordinates(lon, lat, from_frame, to_frame):
+    """
+    Convert coordinates (in degrees) between ICRS, FK5 (J2000) and Galactic by applying the rotation matrix to the
+    unit vectors. This is much faster than going through the astropy transformation graph, and it agrees with astropy
+    to much better than a milliarcsecond.
+
+    :param lon: longitudes (deg)
+    :param lat: latitudes (deg)
+    :param from_frame: name of the initial frame (one of rotation_frames)
+    :param to_frame: name of the final frame (one of rotation_frames)
+    :return: (lon, lat) in the new frame (deg), with lon in [0, 360)
+    """
+
+    matrix = get_rotation_matrix(from_frame, to_frame)
+
+    lon, lat = np.broadcast_arrays(np.asarray(lon, dtype=float), np.asarray(lat, dtype=float))
+
+    new_lon = np.empty(lon.shape)
+    new_lat = np.empty(lon.shape)
+
+    # Work in chunks, so that the temporary arrays stay in the CPU cache
+
+    flat_lon, flat_lat = lon.ravel(), lat.ravel()
+    flat_new_lon, flat_new_lat = new_lon.reshape(-1), new_lat.reshape(-1)
+
+    for start in range(0, flat_lon.shape[0], _chunk_size):
+
+        stop = start + _chunk_size
+
+        _rotate_chunk(matrix, flat_lon[start:stop], flat_lat[start:stop],
+                      flat_new_lon[start:stop], flat_new_lat[start:stop])
+
+    return new_lon[()], new_lat[()]
+
+
+# Number of points processed at once by rotate_coordinates
+
+_chunk_size = 65536
+
+
+def _rotate_chunk(matrix, lon, lat, new_lon, new_lat):
+
+    # Unit vectors in the initial frame
+
+    lon = np.deg2rad(lon)
+    lat = np.deg2rad(lat)
+
+    cos_lat = np.cos(lat)
+
+    x = np.cos(lon)
+    x *= cos_lat
+
+    y = np.sin(lon, out=lon)
+    y *= cos_lat
+
+    z = np.sin(lat, out=lat)
+
+    # Rotated unit vectors
+
+    new_x = matrix[0, 0] * x
+    new_x += matrix[0, 1] * y
+    new_x += matrix[0, 2] * z
+
+    new_y = matrix[1, 0] * x
+    new_y += matrix[1, 1] * y
+    new_y += matrix[1, 2] * z
+
+    new_z = np.multiply(matrix[2, 0], x, out=x)
+    new_z += matrix[2, 1] * y
+    new_z += matrix[2, 2] * z
+
+    # Using arctan2 for the latitude (instead of arcsin) keeps the precision close to the poles
+
+    np.arctan2(new_y, new_x, out=new_lon)
+    np.rad2deg(new_lon, out=new_lon)
+    new_lon[new_lon < 0] += 360.0
+
+    new_x *= new_x
+    new_y *= new_y
+    new_x += new_y
+
+    np.arctan2(new_z, np.sqrt(new_x, out=new_x), out=new_lat)
+    np.rad2deg(new_lat, out=new_lat)
+
+
+def transform_coordinates(lon, lat, from_frame, to_frame):
+    """
+    Transform the provided coordinates (in degrees) from one frame to another, using astropy. The result is cached,
+    so that transforming again the same grid between the same frames is very fast. This is useful for spatial
+    functions which need coordinates in a frame different from the one used for the grid, since the grid is usually
+    the same for all the evaluations during a fit. Transformations among ICRS, FK5 (J2000) and Galactic use
+    rotate_coordinates instead of astropy.
+
+    The returned arrays are read-only, since they are shared among all the callers.
+
+    :param lon: array of longitudes (deg)
+    :param lat: array of latitudes (deg)
+    :param from_frame: frame of the input coordinates (an astropy frame instance or a name like 'icrs')
+    :param to_frame: frame of the output coordinates (an astropy frame instance or a name like 'galactic')
+    :return: (lon, lat) in the new frame (deg)
+    """
+
+    key = (get_grid_fingerprint(lon, lat), _get_frame_key(from_frame), _get_frame_key(to_frame))
+
+    try:
+
+        new_lon, new_lat = _transform_cache.pop(key)
+
+    except KeyError:
+
+        from_rotation_frame = _get_rotation_frame_name(from_frame)
+        to_rotation_frame = _get_rotation_frame_name(to_frame)
+
+        if from_rotation_frame is not None and to_rotation_frame is not None:
+
+            new_lon, new_lat = rotate_coordinates(np.asarray(lon, dtype=float), np.asarray(lat, dtype=float),
+                                                  from_rotation_frame, to_rotation_frame)
+
+        else:
+
+            coordinates = SkyCoord(lon, lat, frame=from_frame, unit="deg").transform_to(to_frame)
+
+            spherical = coordinates.spherical
+
+            new_lon = np.array(spherical.lon.deg, dtype=float)
+            new_lat = np.array(spherical.lat.deg, dtype=float)
+
+        # (scalar inputs give numpy scalars, which are immutable already)
+
+        if isinstance(new_lon, np.ndarray):
+
+            new_lon.flags.writeable = False
+            new_lat.flags.writeable = False
+
+        # Make room for the new entry
+
+        while len(_transform_cache) >= max(max_cached_transforms, 1):
+
+            _transform_cache.popitem(last=False)
+
+    # (Re)insert as most recently used
+
+    _transform_cache[key] = (new_lon, new_lat)
+
+    return new_lon, new_lat
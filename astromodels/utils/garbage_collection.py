@@ -0,0 +1,29 @@
+import contextlib
+import gc
+
+
+@contextlib.contextmanager
+def paused_garbage_collector():
+    """
+    A context manager which pauses the garbage collector, and restores its previous state at the end. Use this when
+    creating a very large number of objects which do not form garbage cycles (like the sources of a catalog): the
+    collector would otherwise run many times, going every time through all the new objects.
+
+        >>> with paused_garbage_collector():
+        ...     sources = [...]
+
+    """
+
+    was_enabled = gc.isenabled()
+
+    gc.disable()
+
+    try:
+
+        yield
+
+    finally:
+
+        if was_enabled:
+
+            gc.enable()
@@ -0,0 +1,216 @@
+import numpy as np
+
+from astromodels.utils.coordinate_transforms import get_grid_fingerprint
+
+
+def select_points_inside_box(lon, lat, box):
+    """
+    Returns the indexes of the points inside the provided box ((min_lon, max_lon), (min_lat, max_lat)). As in
+    SpatialIndex, if min_lon > max_lon the box goes across the meridian lon = 0, and a box equal to None covers the
+    whole sky.
+
+    :param lon: array of longitudes (deg)
+    :param lat: array of latitudes (deg)
+    :param box: the box
+    :return: array of indexes (sorted)
+    """
+
+    lon = np.asarray(lon, dtype=float).reshape(-1)
+    lat = np.asarray(lat, dtype=float).reshape(-1)
+
+    if box is None:
+
+        return np.arange(lon.shape[0])
+
+    return SpatialIndex([box])._select_inside(np.arange(lon.shape[0]), lon % 360.0, lat, 0)
+
+
+class SpatialIndex(object):
+    """
+    An index of boxes in longitude and latitude (like the boundaries of the extended sources), which can tell very
+    quickly which points of a grid are inside each box.
+
+    The sky is divided in cells of cell_size x cell_size degrees. The points are sorted by cell, so that the points in
+    a row of cells are a contiguous block. For each box only the rows of cells it overlaps are examined, which makes
+    the cost of a query roughly proportional to the number of points (instead of the number of points times the number
+    of boxes), when the boxes are small.
+
+    Boxes are given as ((min_lon, max_lon), (min_lat, max_lat)) in degrees. If min_lon > max_lon the box goes across
+    the meridian lon = 0 (for example (350, 10) covers 20 degrees). A box equal to None covers the whole sky.
+    """
+
+    def __init__(self, boxes, cell_size=1.0):
+        """
+
+        :param boxes: list of boxes ((min_lon, max_lon), (min_lat, max_lat)) or None (for boxes covering the whole sky)
+        :param cell_size: size of the cells in degrees
+        """
+
+        self._cell_size = float(cell_size)
+
+        self._n_lon_cells = int(np.ceil(360.0 / self._cell_size))
+        self._n_lat_cells = int(np.ceil(180.0 / self._cell_size))
+
+        self._boxes = []
+
+        for box in boxes:
+
+            if box is None:
+
+                self._boxes.append(None)
+
+            else:
+
+                (min_lon, max_lon), (min_lat, max_lat) = box
+
+                min_lon = float(min_lon) % 360.0
+                max_lon = float(max_lon)
+
+                # Keep 360 as 360, so that (0, 360) covers all longitudes
+
+                if max_lon != 360.0:
+
+                    max_lon = max_lon % 360.0
+
+                self._boxes.append((min_lon, max_lon, float(min_lat), float(max_lat)))
+
+        # Points of the last grid sorted by cell (the grid usually does not change between queries)
+
+        self._grid_cache = None
+
+    @property
+    def n_boxes(self):
+
+        return len(self._boxes)
+
+    def _get_lon_cells(self, lon):
+
+        return np.minimum((lon / self._cell_size).astype(int), self._n_lon_cells - 1)
+
+    def _get_lat_cells(self, lat):
+
+        return np.clip(((lat + 90.0) / self._cell_size).astype(int), 0, self._n_lat_cells - 1)
+
+    def _sort_grid(self, lon, lat):
+
+        # Sort the points by cell (row by row). The result is kept for the next query on the same grid
+
+        fingerprint = get_grid_fingerprint(lon, lat)
+
+        if self._grid_cache is not None and self._grid_cache[0] == fingerprint:
+
+            return self._grid_cache[1:]
+
+        lon = np.asarray(lon, dtype=float).reshape(-1) % 360.0
+        lat = np.asarray(lat, dtype=float).reshape(-1)
+
+        cells = self._get_lat_cells(lat) * self._n_lon_cells + self._get_lon_cells(lon)
+
+        order = np.argsort(cells, kind='mergesort')
+
+        sorted_cells = cells[order]
+
+        self._grid_cache = (fingerprint, lon, lat, order, sorted_cells)
+
+        return lon, lat, order, sorted_cells
+
+    def query(self, lon, lat):
+        """
+        Find the points inside each box
+
+        :param lon: array of longitudes (deg)
+        :param lat: array of latitudes (deg)
+        :return: a list with one array for each box, containing the (sorted) indexes of the points inside the box
+        """
+
+        lon, lat, order, sorted_cells = self._sort_grid(lon, lat)
+
+        n_points = lon.shape[0]
+
+        results = []
+
+        for i, box in enumerate(self._boxes):
+
+            if box is None:
+
+                results.append(np.arange(n_points))
+
+                continue
+
+            min_lon, max_lon, min_lat, max_lat = box
+
+            # Ranges of cells overlapped by the box in each row (two ranges if the box goes across lon = 0)
+
+            min_lon_cell, max_lon_cell = self._get_lon_cells(np.array([min_lon, max_lon]))
+
+            if min_lon <= max_lon:
+
+                lon_cell_ranges = [(min_lon_cell, max_lon_cell)]
+
+            else:
+
+                lon_cell_ranges = [(min_lon_cell, self._n_lon_cells - 1), (0, max_lon_cell)]
+
+            min_lat_cell, max_lat_cell = self._get_lat_cells(np.array([min_lat, max_lat]))
+
+            rows = np.arange(min_lat_cell, max_lat_cell + 1) * self._n_lon_cells
+
+            # Candidates are the points in the overlapped cells
+
+            blocks = []
+
+            for first_cell, last_cell in lon_cell_ranges:
+
+                starts = np.searchsorted(sorted_cells, rows + first_cell, side='left')
+                stops = np.searchsorted(sorted_cells, rows + last_cell, side='right')
+
+                blocks.extend(order[start:stop] for start, stop in zip(starts, stops) if stop > start)
+
+            if len(blocks) == 0:
+
+                results.append(np.array([], dtype=int))
+
+                continue
+
+            candidates = np.concatenate(blocks)
+
+            results.append(np.sort(self._select_inside(candidates, lon[candidates], lat[candidates], i)))
+
+        return results
+
+    def _select_inside(self, candidates, lon, lat, i):
+
+        # Exact test of the candidates (with longitudes in [0, 360)) against the i-th box
+
+        min_lon, max_lon, min_lat, max_lat = self._boxes[i]
+
+        inside = (lat >= min_lat) & (lat <= max_lat)
+
+        if min_lon <= max_lon:
+
+            inside &= (lon >= min_lon) & (lon <= max_lon)
+
+        else:
+
+            inside &= (lon >= min_lon) | (lon <= max_lon)
+
+        return candidates[inside]
+
+    def is_inside_any(self, lon, lat):
+        """
+        Returns whether each point is inside at least one of the boxes
+
+        :param lon: array of longitudes (deg)
+        :param lat: array of latitudes (deg)
+        :return: array of booleans
+        """
+
+        lon = np.asarray(lon, dtype=float).reshape(-1)
+
+        inside = np.zeros(lon.shape[0], dtype=bool)
+
+        for indexes in self.query(lon, lat):
+
+            inside[indexes] = True
+
+        return inside
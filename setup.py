@@ -189,6 +189,7 @@ packages = ['astromodels',
             'astromodels/functions',
             'astromodels/sources',
             'astromodels/utils',
+            'astromodels/benchmarks',
             'astromodels/xspec'
             ]
 